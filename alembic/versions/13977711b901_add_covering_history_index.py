@@ -0,0 +1,39 @@
+"""Replace the generated_tweets history index with a covering one
+
+Revision ID: 13977711b901
+Revises: feb715b5ed41
+Create Date: 2026-10-19 17:41:05.226873
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '13977711b901'
+down_revision: Union[str, None] = 'feb715b5ed41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # generated_tweets is partitioned, and CREATE INDEX CONCURRENTLY isn't
+    # supported on partitioned tables, so this takes a normal build lock
+    op.create_index(
+        'ix_generated_tweets_user_history', 'generated_tweets',
+        ['user_id', 'generated_at', 'id'],
+        postgresql_include=['tweet_text'],
+        if_not_exists=True
+    )
+    op.drop_index('ix_generated_tweets_user_id_generated_at', table_name='generated_tweets', if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index(
+        'ix_generated_tweets_user_id_generated_at', 'generated_tweets',
+        ['user_id', 'generated_at'],
+        if_not_exists=True
+    )
+    op.drop_index('ix_generated_tweets_user_history', table_name='generated_tweets', if_exists=True)
@@ -0,0 +1,72 @@
+"""Add composite and partial indexes for hot-path queries
+
+Revision ID: 5f6aedaeaad9
+Revises: 620773f6dd74
+Create Date: 2026-10-19 10:12:44.318220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f6aedaeaad9'
+down_revision: Union[str, None] = '620773f6dd74'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_generated_tweets_user_id_generated_at', 'generated_tweets',
+            ['user_id', 'generated_at'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_usage_user_id_date', 'usage',
+            ['user_id', 'date'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_user_activity_user_id_timestamp', 'user_activity',
+            ['user_id', 'timestamp'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_scheduled_emails_due', 'scheduled_emails',
+            ['scheduled_for'],
+            postgresql_where=sa.text('sent = false'),
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_users_api_key', 'users',
+            ['api_key'],
+            postgresql_where=sa.text('api_key IS NOT NULL'),
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_users_stripe_customer_id', 'users',
+            ['stripe_customer_id'],
+            postgresql_where=sa.text('stripe_customer_id IS NOT NULL'),
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_stripe_customer_id', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_users_api_key', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_scheduled_emails_due', table_name='scheduled_emails',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_user_activity_user_id_timestamp', table_name='user_activity',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_usage_user_id_date', table_name='usage',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_generated_tweets_user_id_generated_at', table_name='generated_tweets',
+                      postgresql_concurrently=True, if_exists=True)
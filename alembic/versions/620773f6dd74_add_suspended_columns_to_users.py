@@ -18,7 +18,186 @@ branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
 
+def create_initial_tables() -> None:
+    # The tables as create_all made them before migrations were introduced,
+    # so `alembic upgrade head` can also build a fresh database (CI does)
+    op.create_table('blog_posts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('slug', sa.String(), nullable=True),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('excerpt', sa.String(), nullable=False),
+    sa.Column('author', sa.String(), nullable=True),
+    sa.Column('meta_description', sa.String(), nullable=True),
+    sa.Column('meta_keywords', sa.String(), nullable=True),
+    sa.Column('published', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('views', sa.Integer(), nullable=True),
+    sa.Column('read_time', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_blog_posts_id'), 'blog_posts', ['id'], unique=False)
+    op.create_index(op.f('ix_blog_posts_slug'), 'blog_posts', ['slug'], unique=True)
+    op.create_table('ip_bans',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ip_address', sa.String(), nullable=True),
+    sa.Column('reason', sa.Text(), nullable=True),
+    sa.Column('banned_at', sa.DateTime(), nullable=True),
+    sa.Column('banned_by', sa.String(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('unbanned_at', sa.DateTime(), nullable=True),
+    sa.Column('unbanned_by', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ip_bans_id'), 'ip_bans', ['id'], unique=False)
+    op.create_index(op.f('ix_ip_bans_ip_address'), 'ip_bans', ['ip_address'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(), nullable=True),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('hashed_password', sa.LargeBinary(), nullable=False),
+    sa.Column('plan', sa.String(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('stripe_customer_id', sa.String(), nullable=True),
+    sa.Column('api_key', sa.String(), nullable=True),
+    sa.Column('is_admin', sa.Boolean(), nullable=True),
+    sa.Column('role', sa.String(), nullable=True),
+    sa.Column('industry', sa.String(), nullable=True),
+    sa.Column('goals', sa.String(), nullable=True),
+    sa.Column('posting_frequency', sa.String(), nullable=True),
+    sa.Column('original_plan', sa.String(), nullable=True),
+    sa.Column('last_login', sa.DateTime(), nullable=True),
+    sa.Column('last_known_ip', sa.String(), nullable=True),
+    sa.Column('registration_ip', sa.String(), nullable=True),
+    sa.Column('is_ip_banned', sa.Boolean(), nullable=True),
+    sa.Column('cancellation_date', sa.DateTime(), nullable=True),
+    sa.Column('cancellation_requested_at', sa.DateTime(), nullable=True),
+    sa.Column('cancel_at_period_end', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+    op.create_table('email_change_requests',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('new_email', sa.String(), nullable=True),
+    sa.Column('token', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.Column('verified', sa.Boolean(), nullable=True),
+    sa.Column('verified_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_email_change_requests_id'), 'email_change_requests', ['id'], unique=False)
+    op.create_index(op.f('ix_email_change_requests_new_email'), 'email_change_requests', ['new_email'], unique=False)
+    op.create_index(op.f('ix_email_change_requests_token'), 'email_change_requests', ['token'], unique=True)
+    op.create_table('email_verifications',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('token', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.Column('verified', sa.Boolean(), nullable=True),
+    sa.Column('verified_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_email_verifications_id'), 'email_verifications', ['id'], unique=False)
+    op.create_index(op.f('ix_email_verifications_token'), 'email_verifications', ['token'], unique=True)
+    op.create_table('generated_tweets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('tweet_text', sa.String(), nullable=True),
+    sa.Column('generated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_generated_tweets_id'), 'generated_tweets', ['id'], unique=False)
+    op.create_table('password_resets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('token', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.Column('used', sa.Boolean(), nullable=True),
+    sa.Column('used_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_password_resets_id'), 'password_resets', ['id'], unique=False)
+    op.create_index(op.f('ix_password_resets_token'), 'password_resets', ['token'], unique=True)
+    op.create_table('scheduled_emails',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('email_type', sa.String(), nullable=True),
+    sa.Column('scheduled_for', sa.DateTime(), nullable=True),
+    sa.Column('sent', sa.Boolean(), nullable=True),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_scheduled_emails_id'), 'scheduled_emails', ['id'], unique=False)
+    op.create_table('suspension_appeals',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('appeal_type', sa.String(), nullable=False),
+    sa.Column('appeal_message', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('reviewed_at', sa.DateTime(), nullable=True),
+    sa.Column('reviewed_by', sa.String(), nullable=True),
+    sa.Column('admin_notes', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_suspension_appeals_id'), 'suspension_appeals', ['id'], unique=False)
+    op.create_table('team_members',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('role', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_team_members_email'), 'team_members', ['email'], unique=False)
+    op.create_index(op.f('ix_team_members_id'), 'team_members', ['id'], unique=False)
+    op.create_table('usage',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.String(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_usage_id'), 'usage', ['id'], unique=False)
+    op.create_table('user_activity',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('activity_type', sa.String(), nullable=True),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('ip_address', sa.String(), nullable=True),
+    sa.Column('user_agent', sa.String(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('user_metadata', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_user_activity_id'), 'user_activity', ['id'], unique=False)
+
+
 def upgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table('users'):
+        create_initial_tables()
     # ### commands auto generated by Alembic - please adjust! ###
     op.add_column('users', sa.Column('is_suspended', sa.Boolean(), nullable=True))
     op.add_column('users', sa.Column('suspension_reason', sa.Text(), nullable=True))
@@ -0,0 +1,45 @@
+"""Add admin stats rollup tables
+
+Revision ID: a3c58e1f0b27
+Revises: 13977711b901
+Create Date: 2026-10-19 18:22:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c58e1f0b27'
+down_revision: Union[str, None] = '13977711b901'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'admin_stats',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_table(
+        'admin_stats_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('signups', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active_users', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_users', sa.Integer(), nullable=True),
+        sa.Column('suspended_users', sa.Integer(), nullable=True),
+        sa.Column('pending_appeals', sa.Integer(), nullable=True),
+        sa.Column('active_ip_bans', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('day')
+    )
+    # The rows are filled by the app's first reconciliation pass
+
+
+def downgrade() -> None:
+    op.drop_table('admin_stats_daily')
+    op.drop_table('admin_stats')
@@ -0,0 +1,37 @@
+"""Add email_suppressions table
+
+Revision ID: a7d4e91b3c05
+Revises: f0c93d1e7b42
+Create Date: 2026-10-19 22:03:47.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4e91b3c05'
+down_revision: Union[str, None] = 'f0c93d1e7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'email_suppressions',
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('reason', sa.String(), nullable=False),
+        sa.Column('source', sa.String(), nullable=True),
+        sa.Column('detail', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('email')
+    )
+    # Lets each process pick up addresses suppressed by the others
+    op.create_index('ix_email_suppressions_created_at', 'email_suppressions', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_suppressions_created_at', table_name='email_suppressions')
+    op.drop_table('email_suppressions')
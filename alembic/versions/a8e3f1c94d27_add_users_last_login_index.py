@@ -0,0 +1,33 @@
+"""Index users.last_login for the rolling active-today count
+
+Revision ID: a8e3f1c94d27
+Revises: f4b8d2e6a913
+Create Date: 2026-10-20 11:26:18.094317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8e3f1c94d27'
+down_revision: Union[str, None] = 'f4b8d2e6a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_last_login', 'users',
+            ['last_login'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_last_login', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
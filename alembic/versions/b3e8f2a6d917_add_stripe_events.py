@@ -0,0 +1,55 @@
+"""Add stripe_events table
+
+Revision ID: b3e8f2a6d917
+Revises: a7d4e91b3c05
+Create Date: 2026-10-19 22:41:19.583026
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e8f2a6d917'
+down_revision: Union[str, None] = 'a7d4e91b3c05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stripe_events',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('type', sa.String(), nullable=False),
+        sa.Column('customer_id', sa.String(), nullable=True),
+        sa.Column('created', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_stripe_events_due', 'stripe_events', ['next_attempt_at'],
+        postgresql_where=sa.text("status = 'pending'")
+    )
+    # Finds the oldest unfinished event per customer
+    op.create_index(
+        'ix_stripe_events_customer_order', 'stripe_events',
+        ['customer_id', 'created', 'received_at', 'id'],
+        postgresql_where=sa.text("status IN ('pending', 'processing')")
+    )
+    op.create_index('ix_stripe_events_status_received', 'stripe_events', ['status', 'received_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stripe_events_status_received', table_name='stripe_events')
+    op.drop_index('ix_stripe_events_customer_order', table_name='stripe_events')
+    op.drop_index('ix_stripe_events_due', table_name='stripe_events')
+    op.drop_table('stripe_events')
@@ -0,0 +1,40 @@
+"""Index pending_tweets by user and share generated_tweets' id sequence
+
+Revision ID: b5d9e2a7c316
+Revises: a8e3f1c94d27
+Create Date: 2026-10-20 14:02:51.337190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d9e2a7c316'
+down_revision: Union[str, None] = 'a8e3f1c94d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Staged rows now keep their id when moved into generated_tweets, so
+    # rows staged under the old serial ids are moved here first
+    op.execute("LOCK TABLE pending_tweets IN EXCLUSIVE MODE")
+    op.execute(
+        "INSERT INTO generated_tweets (user_id, tweet_text, generated_at) "
+        "SELECT user_id, tweet_text, generated_at FROM pending_tweets "
+        "WHERE user_id IN (SELECT id FROM users) ORDER BY id"
+    )
+    op.execute("DELETE FROM pending_tweets")
+    # Processes still on the old code insert without an id
+    op.execute("ALTER TABLE pending_tweets ALTER COLUMN id SET DEFAULT nextval('generated_tweets_id_seq')")
+    op.drop_index('ix_pending_tweets_generated_at', table_name='pending_tweets')
+    op.create_index('ix_pending_tweets_user_generated_at', 'pending_tweets', ['user_id', 'generated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_pending_tweets_user_generated_at', table_name='pending_tweets')
+    op.create_index('ix_pending_tweets_generated_at', 'pending_tweets', ['generated_at'])
+    op.execute("ALTER TABLE pending_tweets ALTER COLUMN id SET DEFAULT nextval('pending_tweets_id_seq')")
@@ -0,0 +1,52 @@
+"""Add prefix and trigram indexes for admin user search
+
+Revision ID: c4e2b9d17a60
+Revises: a3c58e1f0b27
+Create Date: 2026-10-19 19:04:51.662390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e2b9d17a60'
+down_revision: Union[str, None] = 'a3c58e1f0b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ['username', 'email', 'last_known_ip', 'registration_ip']
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite dev databases use the app's in-process search index
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    # The expressions must match search_admin_users: lower(column).
+    with op.get_context().autocommit_block():
+        for column in SEARCH_COLUMNS:
+            # text_pattern_ops lets LIKE 'abc%' use the btree whatever the collation
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_{column}_prefix "
+                f"ON users (lower({column}) text_pattern_ops)"
+            )
+            # Trigram GIN for LIKE '%abc%'
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_{column}_trgm "
+                f"ON users USING gin (lower({column}) gin_trgm_ops)"
+            )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        for column in reversed(SEARCH_COLUMNS):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_users_{column}_trgm")
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_users_{column}_prefix")
@@ -0,0 +1,43 @@
+"""Add stripe_subscriptions mirror table
+
+Revision ID: c5f1a8e4b260
+Revises: b3e8f2a6d917
+Create Date: 2026-10-19 23:18:52.604317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f1a8e4b260'
+down_revision: Union[str, None] = 'b3e8f2a6d917'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled by webhooks from here on; run sync_stripe_subscriptions.py once
+    # to copy existing subscriptions
+    op.create_table(
+        'stripe_subscriptions',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('customer_id', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('price_id', sa.String(), nullable=True),
+        sa.Column('cancel_at_period_end', sa.Boolean(), nullable=False),
+        sa.Column('current_period_end', sa.DateTime(), nullable=True),
+        sa.Column('canceled_at', sa.DateTime(), nullable=True),
+        sa.Column('ended_at', sa.DateTime(), nullable=True),
+        sa.Column('stripe_updated', sa.Integer(), nullable=False),
+        sa.Column('synced_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stripe_subscriptions_customer_id', 'stripe_subscriptions', ['customer_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stripe_subscriptions_customer_id', table_name='stripe_subscriptions')
+    op.drop_table('stripe_subscriptions')
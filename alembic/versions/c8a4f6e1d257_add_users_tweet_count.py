@@ -0,0 +1,51 @@
+"""Add users.tweet_count for the admin user listing
+
+Revision ID: c8a4f6e1d257
+Revises: b5d9e2a7c316
+Create Date: 2026-10-20 15:47:09.502813
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8a4f6e1d257'
+down_revision: Union[str, None] = 'b5d9e2a7c316'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_USERS = 5000
+
+
+def upgrade() -> None:
+    # A constant default is a metadata-only change on Postgres 11+
+    op.add_column('users', sa.Column('tweet_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill a range of users per transaction so no batch holds many row
+    # locks. Rows flushed by processes still on the old code while this runs
+    # are not counted; re-running this backfill after the deploy is safe.
+    bind = op.get_bind()
+    max_id = bind.execute(sa.text("SELECT max(id) FROM users")).scalar() or 0
+    with op.get_context().autocommit_block():
+        for low in range(0, max_id + 1, BACKFILL_BATCH_USERS):
+            bind.execute(sa.text(
+                "UPDATE users SET tweet_count = "
+                "(SELECT count(*) FROM generated_tweets WHERE generated_tweets.user_id = users.id) "
+                "WHERE id >= :low AND id < :high"
+            ), {"low": low, "high": low + BACKFILL_BATCH_USERS})
+
+        op.create_index(
+            'ix_users_tweet_count', 'users',
+            ['tweet_count', 'id'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_tweet_count', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('users', 'tweet_count')
@@ -0,0 +1,34 @@
+"""Add admin_stat_deltas for transactional admin stat changes
+
+Revision ID: d3f7a9b2c614
+Revises: c8a4f6e1d257
+Create Date: 2026-10-20 17:10:33.861402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f7a9b2c614'
+down_revision: Union[str, None] = 'c8a4f6e1d257'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Replaces the per-process in-memory counters; rows are short-lived
+    op.create_table(
+        'admin_stat_deltas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=True),
+        sa.Column('delta', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('admin_stat_deltas')
@@ -0,0 +1,48 @@
+"""Replace the user_activity index with keyset timeline indexes
+
+Revision ID: d81f3a6c52e9
+Revises: c4e2b9d17a60
+Create Date: 2026-10-19 19:48:12.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81f3a6c52e9'
+down_revision: Union[str, None] = 'c4e2b9d17a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_activity_user_timeline', 'user_activity',
+            ['user_id', 'timestamp', 'id'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_user_activity_user_type_timeline', 'user_activity',
+            ['user_id', 'activity_type', 'timestamp', 'id'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_user_activity_user_id_timestamp', table_name='user_activity',
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_activity_user_id_timestamp', 'user_activity',
+            ['user_id', 'timestamp'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_user_activity_user_type_timeline', table_name='user_activity',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_user_activity_user_timeline', table_name='user_activity',
+                      postgresql_concurrently=True, if_exists=True)
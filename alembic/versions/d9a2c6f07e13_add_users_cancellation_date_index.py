@@ -0,0 +1,35 @@
+"""Index users.cancellation_date for the subscription expiry sweeper
+
+Revision ID: d9a2c6f07e13
+Revises: c5f1a8e4b260
+Create Date: 2026-10-19 23:52:30.771845
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a2c6f07e13'
+down_revision: Union[str, None] = 'c5f1a8e4b260'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Partial: only cancelling users have a cancellation_date
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_cancellation_date', 'users',
+            ['cancellation_date'],
+            postgresql_where=sa.text('cancellation_date IS NOT NULL'),
+            postgresql_concurrently=True, if_not_exists=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_cancellation_date', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
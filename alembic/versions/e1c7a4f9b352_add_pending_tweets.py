@@ -0,0 +1,37 @@
+"""Add pending_tweets staging table for the tweet write buffer
+
+Revision ID: e1c7a4f9b352
+Revises: d9a2c6f07e13
+Create Date: 2026-10-20 09:12:40.218846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1c7a4f9b352'
+down_revision: Union[str, None] = 'd9a2c6f07e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Replaces the local tweet_buffer.spool file, which did not survive dyno
+    # restarts and was shared unsafely between processes
+    op.create_table(
+        'pending_tweets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('tweet_text', sa.String(), nullable=True),
+        sa.Column('generated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_pending_tweets_generated_at', 'pending_tweets', ['generated_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_pending_tweets_generated_at', table_name='pending_tweets')
+    op.drop_table('pending_tweets')
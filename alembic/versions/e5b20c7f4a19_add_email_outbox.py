@@ -0,0 +1,59 @@
+"""Add the email_outbox table
+
+Revision ID: e5b20c7f4a19
+Revises: d81f3a6c52e9
+Create Date: 2026-10-19 20:37:44.118502
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b20c7f4a19'
+down_revision: Union[str, None] = 'd81f3a6c52e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'email_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email_type', sa.String(), nullable=False),
+        sa.Column('to_email', sa.String(), nullable=False),
+        sa.Column('bcc', sa.Text(), nullable=True),
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('html_body', sa.Text(), nullable=True),
+        sa.Column('text_body', sa.Text(), nullable=True),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # The dispatcher claims pending rows in (priority, next_attempt_at) order
+    op.create_index(
+        'ix_email_outbox_due', 'email_outbox',
+        ['priority', 'next_attempt_at', 'id'],
+        postgresql_where=sa.text("status = 'pending'")
+    )
+    op.create_index(
+        'ix_email_outbox_leases', 'email_outbox',
+        ['locked_until'],
+        postgresql_where=sa.text("status = 'sending'")
+    )
+    op.create_index('ix_email_outbox_status_created', 'email_outbox', ['status', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_outbox_status_created', table_name='email_outbox')
+    op.drop_index('ix_email_outbox_leases', table_name='email_outbox')
+    op.drop_index('ix_email_outbox_due', table_name='email_outbox')
+    op.drop_table('email_outbox')
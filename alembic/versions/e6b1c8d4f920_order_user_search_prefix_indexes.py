@@ -0,0 +1,53 @@
+"""Rebuild the admin user search prefix indexes in C collation with id
+
+Revision ID: e6b1c8d4f920
+Revises: d3f7a9b2c614
+Create Date: 2026-10-21 10:37:12.508913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b1c8d4f920'
+down_revision: Union[str, None] = 'd3f7a9b2c614'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_COLUMNS = ['username', 'email', 'last_known_ip', 'registration_ip']
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite dev databases use the app's in-process search index
+        return
+
+    # A text_pattern_ops index serves LIKE 'abc%' but not ORDER BY, so every
+    # prefix match was read and sorted. In C collation the same btree serves
+    # both, and with id appended it covers the (value, id) keyset, so
+    # search_users_sql stops after one page per column.
+    with op.get_context().autocommit_block():
+        for column in SEARCH_COLUMNS:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_{column}_prefix_new "
+                f"ON users ((lower({column}) COLLATE \"C\"), id)"
+            )
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_users_{column}_prefix")
+            op.execute(f"ALTER INDEX ix_users_{column}_prefix_new RENAME TO ix_users_{column}_prefix")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    with op.get_context().autocommit_block():
+        for column in reversed(SEARCH_COLUMNS):
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_{column}_prefix_old "
+                f"ON users (lower({column}) text_pattern_ops)"
+            )
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS ix_users_{column}_prefix")
+            op.execute(f"ALTER INDEX ix_users_{column}_prefix_old RENAME TO ix_users_{column}_prefix")
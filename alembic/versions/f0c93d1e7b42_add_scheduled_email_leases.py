@@ -0,0 +1,27 @@
+"""Add lease column to scheduled_emails
+
+Revision ID: f0c93d1e7b42
+Revises: e5b20c7f4a19
+Create Date: 2026-10-19 21:14:06.530871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f0c93d1e7b42'
+down_revision: Union[str, None] = 'e5b20c7f4a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Nullable with no default, so this is a catalog-only change on Postgres
+    op.add_column('scheduled_emails', sa.Column('locked_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('scheduled_emails', 'locked_until')
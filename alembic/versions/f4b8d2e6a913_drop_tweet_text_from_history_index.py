@@ -0,0 +1,39 @@
+"""Rebuild the history index without INCLUDE (tweet_text)
+
+Revision ID: f4b8d2e6a913
+Revises: e1c7a4f9b352
+Create Date: 2026-10-20 10:41:07.552913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b8d2e6a913'
+down_revision: Union[str, None] = 'e1c7a4f9b352'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # tweet_text is unbounded, so carrying it in the index risked inserts
+    # failing once a tweet pushed an index entry past the btree row size
+    # limit. generated_tweets is partitioned, so this can't be CONCURRENTLY;
+    # drop and create run in one transaction so the swap is atomic.
+    op.drop_index('ix_generated_tweets_user_history', table_name='generated_tweets', if_exists=True)
+    op.create_index(
+        'ix_generated_tweets_user_history', 'generated_tweets',
+        ['user_id', 'generated_at', 'id']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generated_tweets_user_history', table_name='generated_tweets', if_exists=True)
+    op.create_index(
+        'ix_generated_tweets_user_history', 'generated_tweets',
+        ['user_id', 'generated_at', 'id'],
+        postgresql_include=['tweet_text']
+    )
@@ -0,0 +1,138 @@
+"""Partition generated_tweets by month
+
+Revision ID: feb715b5ed41
+Revises: 5f6aedaeaad9
+Create Date: 2026-10-19 16:02:11.504117
+
+The old table is renamed aside and an empty partitioned table, with its
+indexes, takes its name in one short transaction. Rows are then copied
+across in batches of COPY_BATCH_ROWS ids, each committed on its own, so
+no lock is held for the whole copy. Until the copy finishes:
+
+- /history and exports show only the rows copied so far. Run it when
+  traffic is low.
+- Users with tweets can't be deleted, because generated_tweets_legacy
+  still references them.
+
+If the copy is interrupted, running `alembic upgrade` again resumes it.
+The downgrade copies everything back in one transaction, so it needs a
+maintenance window with the app stopped.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'feb715b5ed41'
+down_revision: Union[str, None] = '5f6aedaeaad9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COPY_BATCH_ROWS = 50000
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        # Declarative partitioning is Postgres-only; SQLite dev databases
+        # keep the plain table and the sweeper falls back to batched deletes
+        return
+
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT to_regclass('generated_tweets_legacy')")).scalar() is None:
+        create_partitioned_table()
+
+    with op.get_context().autocommit_block():
+        max_id = bind.execute(sa.text("SELECT max(id) FROM generated_tweets_legacy")).scalar() or 0
+        for low in range(0, max_id + 1, COPY_BATCH_ROWS):
+            bind.execute(sa.text("""
+                INSERT INTO generated_tweets (id, user_id, tweet_text, generated_at)
+                SELECT id, user_id, tweet_text, COALESCE(generated_at, now() AT TIME ZONE 'utc')
+                FROM generated_tweets_legacy
+                WHERE id >= :low AND id < :high
+                ON CONFLICT DO NOTHING
+            """), {"low": low, "high": low + COPY_BATCH_ROWS})
+        op.execute("DROP TABLE generated_tweets_legacy")
+
+
+def create_partitioned_table() -> None:
+    op.execute("ALTER TABLE generated_tweets RENAME TO generated_tweets_legacy")
+    op.execute("ALTER INDEX IF EXISTS generated_tweets_pkey RENAME TO generated_tweets_legacy_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_generated_tweets_id")
+    op.execute("DROP INDEX IF EXISTS ix_generated_tweets_user_id_generated_at")
+
+    # The partition key has to be part of the primary key
+    op.execute("""
+        CREATE TABLE generated_tweets (
+            id INTEGER NOT NULL DEFAULT nextval('generated_tweets_id_seq'),
+            user_id INTEGER REFERENCES users (id),
+            tweet_text VARCHAR,
+            generated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, generated_at)
+        ) PARTITION BY RANGE (generated_at)
+    """)
+    op.execute("ALTER SEQUENCE generated_tweets_id_seq OWNED BY generated_tweets.id")
+
+    # One partition per month from the oldest row through two months ahead;
+    # the app creates future months from then on
+    op.execute("""
+        DO $$
+        DECLARE
+            month_start DATE := date_trunc('month', COALESCE(
+                (SELECT min(generated_at) FROM generated_tweets_legacy),
+                now() AT TIME ZONE 'utc'
+            ))::date;
+            last_month DATE := (date_trunc('month', now() AT TIME ZONE 'utc') + interval '2 months')::date;
+        BEGIN
+            WHILE month_start <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF generated_tweets FOR VALUES FROM (%L) TO (%L)',
+                    'generated_tweets_p' || to_char(month_start, 'YYYYMM'),
+                    month_start,
+                    (month_start + interval '1 month')::date
+                );
+                month_start := (month_start + interval '1 month')::date;
+            END LOOP;
+        END $$;
+    """)
+    op.execute("CREATE TABLE generated_tweets_default PARTITION OF generated_tweets DEFAULT")
+
+    # Indexed while empty, so the copy maintains them instead of a
+    # non-concurrent build over every row afterwards
+    op.create_index('ix_generated_tweets_id', 'generated_tweets', ['id'])
+    op.create_index(
+        'ix_generated_tweets_user_id_generated_at', 'generated_tweets',
+        ['user_id', 'generated_at']
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("ALTER SEQUENCE generated_tweets_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE generated_tweets RENAME TO generated_tweets_partitioned")
+    op.execute("DROP INDEX IF EXISTS ix_generated_tweets_id")
+    op.execute("DROP INDEX IF EXISTS ix_generated_tweets_user_id_generated_at")
+
+    op.create_table(
+        'generated_tweets',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('generated_tweets_id_seq')"), nullable=False),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id'), nullable=True),
+        sa.Column('tweet_text', sa.String(), nullable=True),
+        sa.Column('generated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("ALTER SEQUENCE generated_tweets_id_seq OWNED BY generated_tweets.id")
+    op.execute("""
+        INSERT INTO generated_tweets (id, user_id, tweet_text, generated_at)
+        SELECT id, user_id, tweet_text, generated_at FROM generated_tweets_partitioned
+    """)
+    op.execute("DROP TABLE generated_tweets_partitioned")
+
+    op.create_index('ix_generated_tweets_id', 'generated_tweets', ['id'])
+    op.create_index(
+        'ix_generated_tweets_user_id_generated_at', 'generated_tweets',
+        ['user_id', 'generated_at']
+    )
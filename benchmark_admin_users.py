@@ -0,0 +1,125 @@
+# benchmark_admin_users.py
+# Compares the old per-user COUNT loop behind /admin/api/users with the
+# single-query fetch_admin_users_page on a seeded database. Tweet counts are
+# seeded into users.tweet_count, as the buffer flush maintains them.
+#
+#   python benchmark_admin_users.py                      # 100k users in a temp SQLite file
+#   BENCH_DATABASE_URL=postgresql://... python benchmark_admin_users.py --users 100000
+#
+# Use a throwaway database: the users and generated_tweets tables are filled
+# with synthetic rows.
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from main import (Base, User, GeneratedTweet, adjust_tweet_counts, convert_to_eastern,
+                  fetch_admin_users_page, ADMIN_USER_SORTS)
+
+
+def seed(db, users: int, tweets_per_user: int):
+    now = datetime.utcnow()
+    batch = []
+    for i in range(users):
+        batch.append({
+            "username": f"bench_user_{i}",
+            "email": f"bench_user_{i}@example.com",
+            "hashed_password": b"x",
+            "plan": random.choice(["free", "creator_monthly", "agency"]),
+            "is_active": True,
+            "created_at": now - timedelta(minutes=random.randint(0, 500000)),
+            "last_login": None if i % 5 == 0 else now - timedelta(minutes=random.randint(0, 50000))
+        })
+        if len(batch) == 10000:
+            db.execute(insert(User), batch)
+            batch = []
+    if batch:
+        db.execute(insert(User), batch)
+    db.commit()
+
+    user_ids = [row[0] for row in db.query(User.id).all()]
+    counts = Counter()
+    batch = []
+    for user_id in user_ids:
+        counts[user_id] = random.randint(0, tweets_per_user * 2)
+        for _ in range(counts[user_id]):
+            batch.append({
+                "user_id": user_id,
+                "tweet_text": "benchmark tweet",
+                "generated_at": now - timedelta(minutes=random.randint(0, 100000))
+            })
+            if len(batch) == 20000:
+                db.execute(insert(GeneratedTweet), batch)
+                batch = []
+    if batch:
+        db.execute(insert(GeneratedTweet), batch)
+    adjust_tweet_counts(db, counts)
+    db.commit()
+
+
+def legacy_page(db, limit: int):
+    """The previous implementation: one COUNT query per user on the page"""
+    users = db.query(User).order_by(User.created_at.desc()).limit(limit).all()
+    data = []
+    for user in users:
+        total_tweets = db.query(GeneratedTweet).filter(GeneratedTweet.user_id == user.id).count()
+        data.append((user.id, total_tweets, convert_to_eastern(user.created_at), convert_to_eastern(user.last_login)))
+    return data
+
+
+def timed(fn, runs: int):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the admin user listing")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--tweets-per-user", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+
+    print(f"Seeding {args.users} users into {engine.url.render_as_string(hide_password=True)}...")
+    started = time.perf_counter()
+    seed(db, args.users, args.tweets_per_user)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s "
+          f"({db.query(GeneratedTweet).count()} tweets)\n")
+
+    print(f"{'case':<32} {'median':>10} {'max':>10}")
+    median, worst = timed(lambda: legacy_page(db, args.limit), args.runs)
+    print(f"{'legacy N+1 (created_at desc)':<32} {median:>8.1f}ms {worst:>8.1f}ms")
+
+    for sort in ADMIN_USER_SORTS:
+        median, worst = timed(lambda: fetch_admin_users_page(db, args.limit, sort, "desc"), args.runs)
+        print(f"{'single query, ' + sort:<32} {median:>8.1f}ms {worst:>8.1f}ms")
+
+    # Walk 50 pages deep and time the last one; keyset pages should not slow down
+    cursor = None
+    for _ in range(50):
+        _, cursor = fetch_admin_users_page(db, args.limit, "created_at", "desc", cursor)
+    median, worst = timed(lambda: fetch_admin_users_page(db, args.limit, "created_at", "desc", cursor), args.runs)
+    print(f"{'single query, page 51':<32} {median:>8.1f}ms {worst:>8.1f}ms")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
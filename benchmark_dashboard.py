@@ -0,0 +1,110 @@
+# benchmark_dashboard.py
+# Measures GET /dashboard requests/sec and latency at several concurrency
+# levels for a logged-in user.
+#
+#   python benchmark_dashboard.py                        # in-process app, temp SQLite file
+#   BENCH_DATABASE_URL=postgresql://... python benchmark_dashboard.py --concurrency 1,10,50
+#   python benchmark_dashboard.py --url http://localhost:8000 --username bench_user
+#
+# In-process runs create their own user and tweets in a throwaway database.
+# They don't run the app's lifespan, so the async engine is disposed here.
+# To compare before and after the async data layer, start `uvicorn main:app`
+# from each checkout against the same database and run with --url; the token
+# is signed locally, so SECRET_KEY must match the server's.
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+
+def seed(app_module, username: str, tweets: int):
+    db = app_module.SessionLocal()
+    try:
+        user = app_module.User(username=username, email=f"{username}@example.com",
+                         hashed_password=b"x", plan="free", is_active=True)
+        db.add(user)
+        db.commit()
+        now = datetime.utcnow()
+        db.execute(app_module.insert(app_module.GeneratedTweet), [
+            {"user_id": user.id, "tweet_text": f"benchmark tweet {i}", "generated_at": now - timedelta(minutes=i)}
+            for i in range(tweets)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, requests: int):
+    """Issue requests GETs with at most concurrency in flight.
+
+    Returns (requests/sec, median ms, p95 ms, errors).
+    """
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await client.get("/dashboard")
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return requests / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], errors
+
+
+async def bench(args, app_module):
+    token = app_module.create_access_token({"sub": args.username})
+    if args.url:
+        transport, base_url = None, args.url
+    else:
+        transport, base_url = httpx.ASGITransport(app=app_module.app), "https://giverai.me"
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url,
+                                 cookies={"access_token": token}, timeout=60) as client:
+        await run_level(client, 1, 5)  # warm up pools and template cache
+        print(f"{'concurrency':>12} {'req/s':>10} {'median':>10} {'p95':>10} {'errors':>8}")
+        for concurrency in [int(level) for level in args.concurrency.split(",")]:
+            rps, median, p95, errors = await run_level(client, concurrency, args.requests)
+            print(f"{concurrency:>12} {rps:>10.1f} {median:>8.1f}ms {p95:>8.1f}ms {errors:>8}")
+
+    await app_module.async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard requests/sec")
+    parser.add_argument("--url", help="Benchmark a running server instead of the app in-process")
+    parser.add_argument("--username", default="bench_user")
+    parser.add_argument("--tweets", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", default="1,10,50")
+    args = parser.parse_args()
+
+    if not args.url:
+        # main builds its engines from DATABASE_URL at import time
+        os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    import main as app_module
+
+    if not args.url:
+        app_module.Base.metadata.create_all(app_module.engine)
+        seed(app_module, args.username, args.tweets)
+        print(f"Benchmarking in-process against {app_module.engine.url.render_as_string(hide_password=True)}\n")
+    else:
+        print(f"Benchmarking {args.url}\n")
+
+    asyncio.run(bench(args, app_module))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmark_email_templates.py
+# Measures the cost of building emails from the Jinja templates in
+# templates/email: compiling them cold vs from the bytecode cache, and the
+# per-message CPU for rendering both parts of each email type.
+#
+#   python benchmark_email_templates.py                  # 2000 renders per template
+#   python benchmark_email_templates.py --renders 20000
+#
+# Nothing is sent; renders go straight to memory.
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from jinja2 import Environment
+
+from main import build_email_environment, get_email_templates, render_email_template
+
+USER = SimpleNamespace(id=1, username="bench_user", email="bench_user@example.com", plan="creator",
+                       created_at=datetime(2025, 1, 1), suspended_at=None, suspension_reason=None)
+
+# Lifecycle emails go out in bulk, so they come first
+CASES = {
+    "day1_followup": dict(user=USER, tweets_created=3, tweets_remaining=12, hours_until_reset=7),
+    "day3_nudge": dict(user=USER, last_login="March 01", missed_tweets=45),
+    "day7_reengagement": dict(user=USER),
+    "power_user_reward": dict(user=USER, tweets_remaining=9),
+    "welcome": dict(user=USER),
+    "verification": dict(user=USER, verification_url="https://giverai.me/verify-email?token=abc"),
+    "password_reset": dict(user=USER, reset_url="https://giverai.me/reset-password?token=abc", ip_address="203.0.113.7"),
+    "subscription_upgrade": dict(user=USER, old_plan="free", new_plan="creator", plan_description="For creators",
+                                 features=["Unlimited daily tweets", "Export tweet history"], amount=9,
+                                 next_billing_date=datetime(2026, 1, 1)),
+    "subscription_cancellation": dict(user=USER, plan_name="Creator", cancellation_date=datetime(2026, 1, 1)),
+}
+
+
+def legacy_day1(user, tweets_created, tweets_remaining, hours_until_reset):
+    """The previous inline f-string for the day 1 email, HTML part only"""
+    return f"""
+        <html>
+        <body style="font-family: Arial, sans-serif; color: #333; background: #f9f9f9;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 30px; background: white; border-radius: 8px;">
+            <h1 style="color: #667eea;">How did your first day go? 🚀</h1>
+            <p>Hey {user.username},</p>
+            <p>You generated <strong>{tweets_created} tweet{'s' if tweets_created != 1 else ''}</strong> today.
+            {'Nice start!' if tweets_created > 0 else "Looks like you haven't tried it yet — here's what you're missing:"}</p>
+            {'<p>You still have <strong>' + str(tweets_remaining) + ' free tweets</strong> left today. Your credits reset in ' + str(hours_until_reset) + ' hours.</p>' if tweets_remaining > 0 else '<p>Your daily credits reset in ' + str(hours_until_reset) + ' hours — come back tomorrow for 15 more free tweets.</p>'}
+            <p style="margin: 30px 0;">
+                <a href="https://giverai.me/dashboard"
+                style="background: linear-gradient(45deg, #00ffff, #667eea); color: #000; padding: 14px 28px;
+                        text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">
+                Generate More Tweets →
+                </a>
+            </p>
+            <p>— The GiverAI Team</p>
+            </div>
+        </body>
+        </html>
+        """
+
+
+def compile_all(env: Environment) -> float:
+    started = time.perf_counter()
+    for name in env.list_templates(extensions=["html", "txt"]):
+        env.get_template(name)
+    return (time.perf_counter() - started) * 1000
+
+
+def per_render_us(fn, renders: int, rounds: int = 5) -> float:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(renders):
+            fn()
+        samples.append((time.perf_counter() - started) / renders * 1_000_000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark email template rendering")
+    parser.add_argument("--renders", type=int, default=2000, help="renders per template per round")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="email-bytecode-")
+    try:
+        cold = compile_all(build_email_environment(cache_dir))
+        warm = compile_all(build_email_environment(cache_dir))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    count = len(get_email_templates().list_templates(extensions=["html", "txt"]))
+    print(f"Compile {count} templates: {cold:.1f}ms cold, {warm:.1f}ms from the bytecode cache\n")
+
+    print(f"{'template':<28} {'html + text':>12} {'bytes':>8}")
+    for name, context in CASES.items():
+        html_body, text_body = render_email_template(name, **context)
+        us = per_render_us(lambda: render_email_template(name, **context), args.renders)
+        print(f"{name:<28} {us:>10.1f}µs {len(html_body) + len(text_body):>8}")
+
+    legacy = per_render_us(lambda: legacy_day1(**CASES["day1_followup"]), args.renders)
+    print(f"\n{'legacy f-string day1 (html)':<28} {legacy:>10.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
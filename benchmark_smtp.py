@@ -0,0 +1,112 @@
+# benchmark_smtp.py
+# Compares a fresh SMTP connection per message (the old EmailService
+# behaviour) with SMTPConnectionPool, against a local aiosmtpd sink.
+#
+#   pip install aiosmtpd
+#   python benchmark_smtp.py                         # 500 messages, 4 senders
+#   python benchmark_smtp.py --messages 2000 --senders 8 --handshake-delay 0.05
+#
+# --handshake-delay makes the sink wait before its greeting, standing in for
+# the TCP/TLS/AUTH round trips to a real provider. No mail leaves the machine.
+
+import argparse
+import asyncio
+import smtplib
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+
+try:
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import SMTP as AiosmtpdSMTP
+except ImportError:
+    raise SystemExit("benchmark_smtp.py needs aiosmtpd: pip install aiosmtpd")
+
+from main import SMTPConnectionPool
+
+
+class Sink:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+class SlowGreetingSMTP(AiosmtpdSMTP):
+    handshake_delay = 0.0
+
+    async def _handle_client(self):
+        if self.handshake_delay:
+            await asyncio.sleep(self.handshake_delay)
+        await super()._handle_client()
+
+
+class SinkController(Controller):
+    def factory(self):
+        return SlowGreetingSMTP(self.handler)
+
+
+def build_message(i: int) -> str:
+    msg = MIMEText(f"Benchmark message {i}\n" + "lorem ipsum dolor sit amet\n" * 100, "plain")
+    msg["From"] = "bench@example.com"
+    msg["To"] = f"user{i}@example.com"
+    msg["Subject"] = f"Benchmark {i}"
+    return msg.as_string()
+
+
+def send_fresh(host: str, port: int, i: int):
+    """The previous transport: connect, send and quit for every message"""
+    with smtplib.SMTP(host, port, timeout=15) as server:
+        server.sendmail("bench@example.com", [f"user{i}@example.com"], build_message(i))
+
+
+def run(label: str, send, messages: int, senders: int):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=senders) as executor:
+        list(executor.map(send, range(messages)))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:>8.2f}s {messages / elapsed:>10.0f} msg/s")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs per-message SMTP connections")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--senders", type=int, default=4, help="concurrent sending threads (and pool size)")
+    parser.add_argument("--handshake-delay", type=float, default=0.0,
+                        help="seconds the sink waits before greeting each new connection")
+    args = parser.parse_args()
+
+    SlowGreetingSMTP.handshake_delay = args.handshake_delay
+    handler = Sink()
+    host, port = "127.0.0.1", free_port()
+    controller = SinkController(handler, hostname=host, port=port, ready_timeout=10)
+    controller.start()
+    print(f"Sink on {host}:{port}, {args.messages} messages, {args.senders} senders, "
+          f"handshake delay {args.handshake_delay * 1000:.0f}ms\n")
+
+    try:
+        print(f"{'transport':<28} {'elapsed':>9} {'throughput':>14}")
+        run("connection per message", lambda i: send_fresh(host, port, i), args.messages, args.senders)
+
+        pool = SMTPConnectionPool(host, port, None, None, size=args.senders, starttls=False,
+                                  max_messages=args.messages)
+        run("pooled connections", lambda i: pool.send("bench@example.com", [f"user{i}@example.com"],
+                                                      build_message(i)), args.messages, args.senders)
+        pool.close_all()
+        print(f"\nPool: {pool.stats()}")
+        print(f"Sink received {handler.received} messages")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmark_tweet_buffer.py
+# Measures generated_tweets insert throughput for the old one-ORM-object-per-
+# tweet commit and for TweetWriteBuffer flushes at several batch sizes.
+#
+#   python benchmark_tweet_buffer.py                     # temp SQLite file
+#   BENCH_DATABASE_URL=postgresql://... python benchmark_tweet_buffer.py --rows 20000
+#
+# Use a throwaway database: users, pending_tweets and generated_tweets are
+# filled with synthetic rows.
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import main as app_module
+from main import Base, User, GeneratedTweet, TweetWriteBuffer
+
+
+def legacy_insert(db, user_ids, rows: int):
+    """The previous implementation: one ORM object and one commit per request"""
+    for i in range(rows):
+        db.add(GeneratedTweet(user_id=user_ids[i % len(user_ids)], tweet_text=f"benchmark tweet {i}"))
+        db.commit()
+
+
+def buffered_insert(db, user_ids, rows: int, batch_size: int, tweets_per_request: int):
+    """Stage rows the way the generate handlers do, then flush every batch_size rows.
+
+    Staging happens in the request's own commit, which the handler makes for
+    the usage increment anyway. Returns (stage seconds, flush seconds).
+    """
+    buffer = TweetWriteBuffer(batch_size, 3600)
+    stage_seconds = flush_seconds = 0.0
+    for start in range(0, rows, tweets_per_request):
+        texts = [f"benchmark tweet {i}" for i in range(start, min(start + tweets_per_request, rows))]
+        started = time.perf_counter()
+        buffer.add(db, user_ids[start % len(user_ids)], texts)
+        db.commit()
+        stage_seconds += time.perf_counter() - started
+        if buffer._staged_since_flush >= batch_size:
+            started = time.perf_counter()
+            buffer.flush()
+            flush_seconds += time.perf_counter() - started
+    started = time.perf_counter()
+    buffer.flush()
+    flush_seconds += time.perf_counter() - started
+    return stage_seconds, flush_seconds
+
+
+def timed(fn, runs: int):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generated tweet inserts")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tweets-per-request", type=int, default=3)
+    parser.add_argument("--batch-sizes", default="1,10,50,200,1000")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    app_module.SessionLocal = sessionmaker(bind=engine)
+    db = app_module.SessionLocal()
+
+    db.execute(insert(User), [
+        {"username": f"bench_user_{i}", "email": f"bench_user_{i}@example.com",
+         "hashed_password": b"x", "plan": "free", "is_active": True}
+        for i in range(args.users)
+    ])
+    db.commit()
+    user_ids = [row[0] for row in db.query(User.id).all()]
+
+    print(f"Inserting {args.rows} tweets into {engine.url.render_as_string(hide_password=True)}\n")
+    print(f"{'case':<28} {'rows/s':>10} {'worst':>10} {'stage rows/s':>14}")
+
+    median, worst = timed(lambda: legacy_insert(db, user_ids, args.rows), args.runs)
+    print(f"{'legacy per-row commit':<28} {args.rows / median:>10.0f} {args.rows / worst:>10.0f} {'-':>14}")
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        samples = [buffered_insert(db, user_ids, args.rows, batch_size, args.tweets_per_request) for _ in range(args.runs)]
+        flush_times = [flush for _, flush in samples]
+        stage_time = statistics.median(stage for stage, _ in samples)
+        print(f"{'buffer flush, batch ' + str(batch_size):<28} "
+              f"{args.rows / statistics.median(flush_times):>10.0f} {args.rows / max(flush_times):>10.0f} "
+              f"{args.rows / stage_time:>14.0f}")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
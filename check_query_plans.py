@@ -0,0 +1,140 @@
+# check_query_plans.py
+# Fails when a hot-path query stops using the index that was added for it
+# (alembic 5f6aedaeaad9 and the indexes that later replaced its ones).
+#
+#   DATABASE_URL=postgresql://... python check_query_plans.py
+#
+# Each query is EXPLAINed with sequential scans, bitmap scans and sorts
+# turned off, so even on a small or empty database the planner picks the
+# index whenever it exists and can serve the query, including its ORDER BY.
+# Falling back to another index or to a sequential scan is a plan regression.
+# Run it against a migrated database (alembic upgrade head). With a
+# non-Postgres DATABASE_URL the check is skipped and exits 0.
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import select, or_, func
+
+from main import engine, GeneratedTweet, Usage, UserActivity, ScheduledEmail, User
+
+now = datetime.utcnow()
+
+# (description, statement, relation, index the plan must use)
+HOT_PATH_QUERIES = [
+    (
+        "tweet history page",
+        select(GeneratedTweet.id, GeneratedTweet.tweet_text, GeneratedTweet.generated_at)
+        .where(GeneratedTweet.user_id == 1, GeneratedTweet.generated_at >= now)
+        .order_by(GeneratedTweet.generated_at.desc(), GeneratedTweet.id.desc())
+        .limit(21),
+        "generated_tweets", "ix_generated_tweets_user_history"
+    ),
+    (
+        "today's usage",
+        select(Usage).where(Usage.user_id == 1, Usage.date == now.strftime("%Y-%m-%d")),
+        "usage", "ix_usage_user_id_date"
+    ),
+    (
+        "user activity timeline",
+        select(UserActivity)
+        .where(UserActivity.user_id == 1)
+        .order_by(UserActivity.timestamp.desc(), UserActivity.id.desc())
+        .limit(50),
+        "user_activity", "ix_user_activity_user_timeline"
+    ),
+    (
+        "due scheduled emails",
+        select(ScheduledEmail)
+        .where(
+            ScheduledEmail.sent == False,
+            ScheduledEmail.scheduled_for <= now,
+            or_(ScheduledEmail.locked_until.is_(None), ScheduledEmail.locked_until < now)
+        )
+        .order_by(ScheduledEmail.scheduled_for, ScheduledEmail.id)
+        .limit(50),
+        "scheduled_emails", "ix_scheduled_emails_due"
+    ),
+    (
+        "user by API key",
+        select(User).where(User.api_key == "plan-check"),
+        "users", "ix_users_api_key"
+    ),
+    (
+        "user by Stripe customer",
+        select(User).where(User.stripe_customer_id == "cus_plan_check"),
+        "users", "ix_users_stripe_customer_id"
+    ),
+    (
+        "admin user search, one field's prefix scan",
+        select(User.id)
+        .where(func.lower(User.username).collate("C").like("plan%"))
+        .order_by(func.lower(User.username).collate("C"), User.id)
+        .limit(51),
+        "users", "ix_users_username_prefix"
+    ),
+]
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def parent_index(conn, index_name: str) -> str:
+    """Partition indexes are auto-named; map them to the partitioned parent index"""
+    row = conn.exec_driver_sql(
+        "SELECT parent.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE child.relname = %(name)s",
+        {"name": index_name}
+    ).first()
+    return row[0] if row else index_name
+
+
+def check(conn, statement, relation: str, index_name: str):
+    """Return None when the plan uses index_name, else a description of the plan"""
+    compiled = statement.compile(dialect=conn.dialect)
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    nodes = list(plan_nodes(plan[0]["Plan"]))
+
+    used, seq_scans = set(), []
+    for node in nodes:
+        if node.get("Index Name"):
+            used.add(parent_index(conn, node["Index Name"]))
+        if node["Node Type"] == "Seq Scan":
+            seq_scans.append(node.get("Relation Name"))
+
+    if index_name in used and not any(name and name.startswith(relation) for name in seq_scans):
+        return None
+    return f"uses {sorted(used) or 'no index'}, seq scans on {seq_scans or 'nothing'}"
+
+
+def main():
+    if engine.dialect.name != "postgresql":
+        print(f"⏭️ Skipping plan checks: DATABASE_URL is {engine.dialect.name}, not Postgres")
+        return
+
+    failures = 0
+    with engine.connect() as conn:
+        # Empty or tiny tables make every plan look equally cheap; without
+        # these the planner would happily seq scan, or bitmap scan and sort
+        for setting in ("enable_seqscan", "enable_bitmapscan", "enable_sort"):
+            conn.exec_driver_sql(f"SET {setting} = off")
+        for description, statement, relation, index_name in HOT_PATH_QUERIES:
+            problem = check(conn, statement, relation, index_name)
+            if problem:
+                failures += 1
+                print(f"❌ {description}: expected {index_name}, {problem}")
+            else:
+                print(f"✅ {description}: {index_name}")
+
+    if failures:
+        print(f"\n{failures} hot-path quer{'y' if failures == 1 else 'ies'} regressed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
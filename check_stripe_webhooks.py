@@ -0,0 +1,189 @@
+# check_stripe_webhooks.py
+# End-to-end check of the Stripe webhook pipeline: payloads are signed with
+# stripe.WebhookSignature exactly as Stripe signs them, posted to
+# /stripe-webhook and applied by the running stripe_event_processor.
+#
+#   python check_stripe_webhooks.py                      # temp SQLite file
+#   CHECK_DATABASE_URL=postgresql://... python check_stripe_webhooks.py
+#
+# Covers duplicate delivery, per-customer ordering across a failed attempt
+# and retry, and dead-lettering followed by an admin retry. Failures are
+# injected by wrapping apply_stripe_event. Exits non-zero if any check
+# fails. Use a throwaway database: it adds users and stripe_events rows.
+
+import json
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+# main builds its engines and reads these at import time
+os.environ["DATABASE_URL"] = os.getenv("CHECK_DATABASE_URL") or f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+os.environ["STRIPE_WEBHOOK_SECRET"] = "whsec_check_stripe_webhooks"
+os.environ["STRIPE_EVENT_POLL_SECONDS"] = "0.2"
+os.environ["STRIPE_EVENT_BACKOFF_SECONDS"] = "0"
+os.environ["STRIPE_EVENT_MAX_ATTEMPTS"] = "3"
+os.environ.setdefault("SECRET_KEY", "check-stripe-webhooks")
+os.environ.setdefault("ADMIN_EMAILS", "admin@example.com")
+
+import stripe
+from fastapi.testclient import TestClient
+
+import main as app_module
+
+RUN = secrets.token_hex(4)  # keeps ids unique if the database is reused
+failures = []
+
+
+def check(description: str, ok: bool, detail=""):
+    print(f"{'✅' if ok else '❌'} {description}" + (f" ({detail})" if detail and not ok else ""))
+    if not ok:
+        failures.append(description)
+
+
+def signed_headers(payload: str) -> dict:
+    timestamp = int(time.time())
+    signature = stripe.WebhookSignature._compute_signature(
+        f"{timestamp}.{payload}", os.environ["STRIPE_WEBHOOK_SECRET"]
+    )
+    return {"stripe-signature": f"t={timestamp},v1={signature}", "content-type": "application/json"}
+
+
+def subscription_event(name: str, event_type: str, customer: str, created: int, **subscription) -> str:
+    return json.dumps({
+        "id": f"evt_{RUN}_{name}",
+        "object": "event",
+        "type": event_type,
+        "created": created,
+        "data": {"object": {
+            "id": f"sub_{customer}",
+            "object": "subscription",
+            "customer": customer,
+            "status": "active",
+            **subscription
+        }}
+    })
+
+
+def wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def event_rows(*names):
+    ids = [f"evt_{RUN}_{name}" for name in names]
+    db = app_module.SessionLocal()
+    try:
+        rows = db.query(app_module.StripeEvent).filter(app_module.StripeEvent.id.in_(ids)).all()
+        return {row.id.rsplit("_", 1)[1]: (row.status, row.attempts) for row in rows}
+    finally:
+        db.close()
+
+
+def user_state(customer: str):
+    db = app_module.SessionLocal()
+    try:
+        user = db.query(app_module.User).filter(app_module.User.stripe_customer_id == customer).one()
+        return user.plan, bool(user.cancel_at_period_end)
+    finally:
+        db.close()
+
+
+def main():
+    app_module.Base.metadata.create_all(app_module.engine)
+    customers = {name: f"cus_{RUN}_{name}" for name in ("dup", "order", "dead")}
+    admin_email = os.environ["ADMIN_EMAILS"].split(",")[0].strip()
+    db = app_module.SessionLocal()
+    db.add_all([
+        app_module.User(username=f"check_{RUN}_{name}", email=f"check_{RUN}_{name}@example.com",
+                        hashed_password=b"x", stripe_customer_id=customer, plan="creator_monthly")
+        for name, customer in customers.items()
+    ])
+    # Admin access is by email, so reuse the admin left by an earlier run
+    admin = db.query(app_module.User).filter(app_module.User.email == admin_email).first()
+    if admin is None:
+        admin = app_module.User(username=f"check_{RUN}_admin", email=admin_email, hashed_password=b"x", is_active=True)
+        db.add(admin)
+    db.commit()
+    admin_username = admin.username
+    db.close()
+
+    # Record the order events are applied in and fail the ones we ask to
+    applied, fail_next = [], {}
+    apply_stripe_event = app_module.apply_stripe_event
+
+    async def instrumented_apply(db, event):
+        name = event["id"].rsplit("_", 1)[1]
+        applied.append(name)
+        if fail_next.get(name):
+            fail_next[name] -= 1
+            raise RuntimeError("injected failure")
+        await apply_stripe_event(db, event)
+
+    app_module.apply_stripe_event = instrumented_apply
+    now = int(time.time())
+
+    with TestClient(app_module.app, base_url="https://giverai.me") as client:
+        def post(payload: str, headers: dict = None):
+            return client.post("/stripe-webhook", content=payload, headers=headers or signed_headers(payload))
+
+        # Duplicate delivery: acknowledged both times, stored and applied once
+        payload = subscription_event("dup1", "customer.subscription.updated", customers["dup"], now,
+                                     cancel_at_period_end=True, current_period_end=now + 86400)
+        first, second = post(payload), post(payload)
+        check("duplicate delivery is acknowledged twice",
+              (first.status_code, second.status_code) == (200, 200)
+              and [first.json()["status"], second.json()["status"]] == ["received", "duplicate"],
+              f"{first.text} / {second.text}")
+        wait_for(lambda: event_rows("dup1").get("dup1", ("",))[0] == "processed")
+        check("duplicate delivery is applied once", applied.count("dup1") == 1, applied)
+        check("bad signature is rejected", post(payload, {"stripe-signature": "t=1,v1=00"}).status_code == 400)
+
+        # Ordering across a retry: ord2 must wait until ord1 has succeeded
+        fail_next["ord1"] = 1
+        post(subscription_event("ord1", "customer.subscription.updated", customers["order"], now,
+                                cancel_at_period_end=True, current_period_end=now + 86400))
+        post(subscription_event("ord2", "customer.subscription.updated", customers["order"], now + 1,
+                                cancel_at_period_end=False))
+        wait_for(lambda: event_rows("ord1", "ord2").get("ord2", ("",))[0] == "processed")
+        order = [name for name in applied if name.startswith("ord")]
+        check("customer's events apply in order across a retry", order == ["ord1", "ord1", "ord2"], order)
+        check("later event's state wins", user_state(customers["order"]) == ("creator_monthly", False),
+              user_state(customers["order"]))
+
+        # Dead-lettering: gives up after the max attempts without blocking
+        # the customer's later events, and an admin retry applies it
+        fail_next["dead1"] = 99
+        post(subscription_event("dead1", "customer.subscription.updated", customers["dead"], now,
+                                cancel_at_period_end=True, current_period_end=now + 86400))
+        post(subscription_event("dead2", "customer.subscription.updated", customers["dead"], now + 1,
+                                cancel_at_period_end=False))
+        wait_for(lambda: event_rows("dead1", "dead2").get("dead2", ("",))[0] == "processed")
+        rows = event_rows("dead1", "dead2")
+        check("failing event is dead-lettered after max attempts",
+              rows.get("dead1") == ("dead", app_module.STRIPE_EVENT_MAX_ATTEMPTS), rows)
+        check("dead-lettered event does not block later events", rows.get("dead2", ("",))[0] == "processed", rows)
+
+        fail_next["dead1"] = 0
+        client.cookies.set("access_token", app_module.create_access_token({"sub": admin_username}))
+        retry = client.post(f"/admin/api/stripe-events/evt_{RUN}_dead1/retry")
+        wait_for(lambda: event_rows("dead1").get("dead1", ("",))[0] == "processed")
+        check("admin retry re-applies a dead-lettered event",
+              retry.status_code == 200 and event_rows("dead1").get("dead1", ("",))[0] == "processed",
+              f"{retry.status_code} {event_rows('dead1')}")
+        check("retried older event doesn't undo the newer one",
+              user_state(customers["dead"]) == ("creator_monthly", False), user_state(customers["dead"]))
+
+    if failures:
+        print(f"\n{len(failures)} webhook check(s) failed")
+        sys.exit(1)
+    print("\nAll webhook checks passed")
+
+
+if __name__ == "__main__":
+    main()
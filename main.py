@@ -3,45 +3,61 @@ from datetime import datetime, time, timedelta, date, timezone
 import os
 import re
 import secrets
-import requests 
 import hashlib
 import time
 from starlette.middleware.sessions import SessionMiddleware
-from authlib.integrations.starlette_client import OAuth
 from starlette.config import Config
-from functools import lru_cache
+from functools import lru_cache, partial
 from typing import Optional, List
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, status, BackgroundTasks, Header, Query, Response
-from fastapi.responses import HTMLResponse, RedirectResponse, Response, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, JSONResponse, FileResponse, StreamingResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, StrictUndefined, select_autoescape
+from markupsafe import Markup, escape
 from fastapi_csrf_protect import CsrfProtect
 from fastapi_csrf_protect.exceptions import CsrfProtectError
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.middleware.base import BaseHTTPMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, text, Text
-from sqlalchemy.pool import QueuePool
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Index, text, Text
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import event as sqlalchemy_event
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import select, delete, update, tuple_, case, bindparam, union_all, literal, DDL
 from email_validator import validate_email, EmailNotValidError
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, insert
 from sqlalchemy import LargeBinary
 from sqlalchemy import inspect
 from sqlalchemy import Text 
 from sqlalchemy.exc import IntegrityError, ProgrammingError 
-from sqlalchemy.orm import defer
+from sqlalchemy.orm import defer, joinedload, aliased
 from sqlalchemy import func, Text
 from sqlalchemy import Text, TIMESTAMP
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
-from openai import OpenAI
 from jose import JWTError, jwt
-import stripe
+import importlib
 import json
 import asyncio
+import threading
+import traceback
+import base64
+import csv
+import io
+import zlib
+from collections import Counter, deque
+import bisect
+import heapq
+import random
+import math
+import tempfile
 import smtplib
 import pytz
 import ipaddress
@@ -54,16 +70,48 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import logging
 import structlog
-import bleach
-import dns.resolver
 
 IS_PRODUCTION = os.getenv("ENV", "development") == "production"
 SECRET_KEY = os.getenv("SECRET_KEY")
 RECAPTCHA_SITE_KEY = os.getenv("RECAPTCHA_SITE_KEY")
 RECAPTCHA_SECRET_KEY = os.getenv("RECAPTCHA_SECRET_KEY")
 
+class LazyModule:
+    """Stand-in for a heavy module that is imported on first attribute access.
+    on_load runs once with the real module (e.g. to set API keys)."""
+
+    def __init__(self, name: str, on_load=None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._on_load:
+                        self._on_load(module)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+def _configure_stripe(module):
+    module.api_key = os.getenv("STRIPE_SECRET_KEY")
+
+# Stripe, bleach and dnspython account for a large share of import time;
+# scripts that only need models and SessionLocal never touch them.
+stripe = LazyModule("stripe", on_load=_configure_stripe)
+bleach = LazyModule("bleach")
+dns_resolver = LazyModule("dns.resolver")
+dns_asyncresolver = LazyModule("dns.asyncresolver")
+requests = LazyModule("requests")
+httpx = LazyModule("httpx")
+
 # Stripe configuration
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 STRIPE_CREATOR_PRICE_ID = os.getenv("STRIPE_CREATOR_PRICE_ID")
 STRIPE_SMALL_TEAM_PRICE_ID = os.getenv("STRIPE_SMALL_TEAM_PRICE_ID")
@@ -78,21 +126,25 @@ TRUSTPILOT_EMAIL = os.getenv("TRUSTPILOT")
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
 
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=GOOGLE_CLIENT_ID,
-    client_secret=GOOGLE_CLIENT_SECRET,
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={'scope': 'openid email profile'}
-)
+@lru_cache(maxsize=None)
+def get_oauth():
+    """Google OAuth client, built on first use (authlib pulls in httpx)"""
+    from authlib.integrations.starlette_client import OAuth
+    oauth = OAuth()
+    oauth.register(
+        name='google',
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
+        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+        client_kwargs={'scope': 'openid email profile'}
+    )
+    return oauth
 
 logging.basicConfig(level=logging.WARNING)  # Only log warnings and errors
 logger = logging.getLogger(__name__)
 
 try:
     import bcrypt
-    print("bcrypt module imported successfully")
 except Exception as e:
     print("bcrypt import error:", e)
 
@@ -113,26 +165,230 @@ except ImportError:
 DATABASE_URL = os.getenv("DATABASE_URL")  # Heroku PostgreSQL URL
 Base = declarative_base()
 
+# ----- Connection pool telemetry -----
+DB_LEAK_THRESHOLD_SECONDS = float(os.getenv("DB_LEAK_THRESHOLD_SECONDS", 30))
+DB_POOL_TEST_MODE = os.getenv("DB_POOL_TEST_MODE", "false").lower() == "true"
+# Walking the stack on every checkout is expensive, so by default only a
+# sample of checkouts records where it came from (all of them in test mode)
+DB_LEAK_STACK_SAMPLE_RATE = 1.0 if DB_POOL_TEST_MODE else float(os.getenv("DB_LEAK_STACK_SAMPLE_RATE", 0))
+SQLALCHEMY_DIR = os.path.dirname(os.path.dirname(sqlalchemy_event.__file__)) + os.sep
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in milliseconds"""
+    BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000, 30000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = 0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.samples += 1
+
+    def snapshot(self):
+        labels = [f"<={bound}ms" for bound in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "samples": self.samples,
+            "avg_ms": round(self.total_ms / self.samples, 3) if self.samples else 0,
+            "max_ms": round(self.max_ms, 3)
+        }
+
+class PoolTelemetry:
+    """Checkout/checkin counters, wait and hold-time histograms and a leak
+    detector for one SQLAlchemy connection pool, fed by pool events."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait_time = LatencyHistogram()
+        self.hold_time = LatencyHistogram()
+        self._checked_out = {}  # id(connection_record) -> (checked_out_at, stack)
+        self._reported_leaks = set()
+
+    def attach(self, pool):
+        self.pool = pool
+        pool._telemetry = self
+        sqlalchemy_event.listen(pool, "connect", self._on_connect)
+        sqlalchemy_event.listen(pool, "checkout", self._on_checkout)
+        sqlalchemy_event.listen(pool, "checkin", self._on_checkin)
+        sqlalchemy_event.listen(pool, "invalidate", self._on_invalidate)
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_time.observe(seconds)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    # Frames inside the pool machinery say nothing about who took the connection
+    POOL_FRAMES = {"capture_stack", "_on_checkout", "_do_get"}
+
+    def capture_stack(self, limit: int = 15):
+        frames = [
+            frame for frame in traceback.extract_stack(limit=80)
+            # "<string>" frames are SQLAlchemy's generated decorator wrappers
+            if not frame.filename.startswith(SQLALCHEMY_DIR) and frame.filename != "<string>"
+            and not (frame.filename == __file__ and frame.name in self.POOL_FRAMES)
+        ]
+        return frames[-limit:]
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        stack = None
+        if DB_LEAK_STACK_SAMPLE_RATE and random.random() < DB_LEAK_STACK_SAMPLE_RATE:
+            stack = self.capture_stack()
+        with self._lock:
+            self.checkouts += 1
+            self._checked_out[id(connection_record)] = (time.monotonic(), stack)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+            entry = self._checked_out.pop(id(connection_record), None)
+            self._reported_leaks.discard(id(connection_record))
+            if entry:
+                self.hold_time.observe(time.monotonic() - entry[0])
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def leaks(self, threshold: float = DB_LEAK_THRESHOLD_SECONDS):
+        """Connections checked out for longer than threshold seconds"""
+        now = time.monotonic()
+        with self._lock:
+            held = list(self._checked_out.items())
+        return [
+            {
+                "connection": key,
+                "held_seconds": round(now - started, 3),
+                "stack": traceback.format_list(stack) if stack else None
+            }
+            for key, (started, stack) in held
+            if now - started > threshold
+        ]
+
+    def report_new_leaks(self, threshold: float = DB_LEAK_THRESHOLD_SECONDS):
+        """Log each leaked connection once, with the stack that acquired it"""
+        for leak in self.leaks(threshold):
+            with self._lock:
+                if leak["connection"] in self._reported_leaks:
+                    continue
+                self._reported_leaks.add(leak["connection"])
+            stack = "".join(leak["stack"]) if leak["stack"] else "(stack not sampled, see DB_LEAK_STACK_SAMPLE_RATE)"
+            print(f"⚠️ [{self.name}] DB connection held for {leak['held_seconds']}s, acquired at:\n{stack}")
+
+    def snapshot(self):
+        with self._lock:
+            stats = {
+                "name": self.name,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "checked_out_now": len(self._checked_out),
+                "wait_time": self.wait_time.snapshot(),
+                "hold_time": self.hold_time.snapshot()
+            }
+        if self.pool is not None:
+            stats["pool_status"] = self.pool.status()
+        stats["leaks"] = self.leaks()
+        return stats
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long callers wait for a connection"""
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            telemetry = getattr(self, "_telemetry", None)
+            if telemetry is not None:
+                telemetry.record_wait(time.monotonic() - started)
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that reports how long callers wait for a connection"""
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            telemetry = getattr(self, "_telemetry", None)
+            if telemetry is not None:
+                telemetry.record_wait(time.monotonic() - started)
+
+def assert_no_leaked_connections(threshold: float = 0):
+    """Test-mode check: fail if any pooled connection is still checked out
+    after threshold seconds, showing where it was acquired"""
+    leaks = [(t.name, leak) for t in (db_pool_telemetry, async_pool_telemetry) for leak in t.leaks(threshold)]
+    if leaks:
+        details = "\n".join(
+            f"[{name}] held {leak['held_seconds']}s, acquired at:\n" + "".join(leak["stack"] or [])
+            for name, leak in leaks
+        )
+        raise AssertionError(f"{len(leaks)} DB connection(s) not returned to the pool:\n{details}")
+
+async def monitor_pool_leaks():
+    """Background task that logs connections held past DB_LEAK_THRESHOLD_SECONDS"""
+    while True:
+        await asyncio.sleep(max(DB_LEAK_THRESHOLD_SECONDS / 2, 1))
+        try:
+            db_pool_telemetry.report_new_leaks()
+            async_pool_telemetry.report_new_leaks()
+        except Exception as e:
+            print(f"❌ Pool leak monitor error: {e}")
+
+db_pool_telemetry = PoolTelemetry("primary")
+async_pool_telemetry = PoolTelemetry("async")
+
+def database_connect_args(url: str) -> dict:
+    """Connect timeout and 10s statement timeout, spelled for the URL's driver.
+
+    psycopg2 and asyncpg take different arguments and other drivers (SQLite
+    for local runs and scripts) take neither.
+    """
+    if not url or not url.startswith(("postgres", "postgresql")):
+        return {}
+    if url.startswith("postgresql+asyncpg://"):
+        return {"timeout": 10, "server_settings": {"statement_timeout": "10000"}}
+    return {
+        "connect_timeout": 10,      # Timeout connecting after 10 seconds
+        "options": "-c statement_timeout=10000"  # Kill queries after 10 seconds
+    }
+
 # Create engine with proper connection pooling
 engine = create_engine(
     DATABASE_URL,
-    poolclass=QueuePool,
+    poolclass=TimedQueuePool,
     pool_size=5,                    # Number of permanent connections
     max_overflow=10,                # Max connections beyond pool_size
     pool_pre_ping=True,             # ← THE MOST IMPORTANT ONE - checks connection before using
     pool_recycle=3600,              # Recycle connections after 1 hour
-    connect_args={
-        "connect_timeout": 10,      # Timeout connecting after 10 seconds
-        "options": "-c statement_timeout=10000"  # Kill queries after 10 seconds
-    },
+    connect_args=database_connect_args(DATABASE_URL),
     echo=False  # Set to True for SQL debugging
 )
 
+db_pool_telemetry.attach(engine.pool)
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-_scheduler_started = False
-
 def get_db_session():
     """Dependency for getting DB sessions."""
     db = SessionLocal()
@@ -141,14 +397,248 @@ def get_db_session():
     finally:
         db.close()
 
+# ----- Async DB Setup -----
+def get_async_database_url(url: str) -> str:
+    """Point a sync Postgres or SQLite URL at its async driver (asyncpg/aiosqlite)"""
+    if url and url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url and url.startswith("postgresql://"):
+        url = "postgresql+asyncpg://" + url[len("postgresql://"):]
+    elif url and url.startswith("sqlite://"):
+        url = "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or get_async_database_url(DATABASE_URL)
+
+# Used by async route handlers so DB round trips don't block the event loop.
+# Scripts like setup_blog.py keep using the sync engine/SessionLocal above.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=TimedAsyncQueuePool,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    connect_args=database_connect_args(ASYNC_DATABASE_URL),
+    echo=False
+)
+async_pool_telemetry.attach(async_engine.sync_engine.pool)
+
+# expire_on_commit=False so templates can read attributes after commit
+# without triggering a lazy load outside the async context
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+async def get_async_db():
+    """Dependency for getting async DB sessions."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# ----- Read replica routing -----
+# Routes declare intent through their dependency: get_read_db /
+# get_async_read_db for read-only work, get_db / get_async_db for anything
+# that writes. Read-only sessions send SELECTs to the replica while its lag
+# is under REPLICA_MAX_LAG_SECONDS and fall back to the primary otherwise.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+ASYNC_DATABASE_REPLICA_URL = os.getenv("ASYNC_DATABASE_REPLICA_URL") or get_async_database_url(DATABASE_REPLICA_URL)
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", 5))
+# Long enough for the tweet buffer to flush and the replica to catch up
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", 30))
+READ_YOUR_WRITES_COOKIE = "db_read_primary_until"
+
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        DATABASE_REPLICA_URL,
+        poolclass=TimedQueuePool,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        connect_args=database_connect_args(DATABASE_REPLICA_URL)
+    )
+    async_replica_engine = create_async_engine(
+        ASYNC_DATABASE_REPLICA_URL,
+        poolclass=TimedAsyncQueuePool,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        connect_args=database_connect_args(ASYNC_DATABASE_REPLICA_URL)
+    )
+else:
+    replica_engine = None
+    async_replica_engine = None
+
+class ReplicaRouter:
+    """Tracks replica health/lag and decides where read-only sessions go"""
+
+    def __init__(self, primary, replica=None, async_primary=None, async_replica=None,
+                 max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS):
+        self.primary = primary
+        self.replica = replica
+        self.async_primary = async_primary
+        self.async_replica = async_replica
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_seconds = 0.0
+        self.healthy = replica is not None
+        self.last_checked = None
+        self.last_error = None
+        self.replica_reads = 0
+        self.primary_fallbacks = 0
+
+    def replica_usable(self) -> bool:
+        return (
+            self.replica is not None
+            and self.healthy
+            and self.lag_seconds <= self.max_lag_seconds
+        )
+
+    def read_bind(self, force_primary: bool = False, use_async: bool = False):
+        """Engine a read-only session should query; None means the primary"""
+        if self.replica is None:
+            return None
+        if force_primary or not self.replica_usable():
+            self.primary_fallbacks += 1
+            return None
+        self.replica_reads += 1
+        return self.async_replica.sync_engine if use_async else self.replica
+
+    def check_lag(self):
+        """Measure replica lag; any failure routes reads back to the primary"""
+        if self.replica is None:
+            return
+        try:
+            with self.replica.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    self.lag_seconds = float(conn.execute(REPLICA_LAG_SQL).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    self.lag_seconds = 0.0
+            if not self.healthy:
+                print("✅ Read replica back in rotation")
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            if self.healthy:
+                print(f"⚠️ Read replica unavailable, reading from primary: {e}")
+            self.healthy = False
+            self.last_error = str(e)
+        self.last_checked = datetime.utcnow()
+
+    async def run(self):
+        while True:
+            await asyncio.to_thread(self.check_lag)
+            await asyncio.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+    def status(self):
+        return {
+            "configured": self.replica is not None,
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "max_lag_seconds": self.max_lag_seconds,
+            "in_use": self.replica_usable(),
+            "replica_reads": self.replica_reads,
+            "primary_fallbacks": self.primary_fallbacks,
+            "last_checked": self.last_checked.isoformat() if self.last_checked else None,
+            "last_error": self.last_error
+        }
+
+replica_router = ReplicaRouter(engine, replica_engine, async_engine, async_replica_engine)
+
+class RoutingSession(Session):
+    """Session that runs SELECTs on read_bind when one was chosen for it.
+    Flushes and non-SELECT statements always go to the session's primary bind."""
+
+    def __init__(self, *args, read_bind=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_bind = read_bind
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (
+            self.read_bind is not None
+            and not self._flushing
+            and getattr(clause, "is_select", False)
+        ):
+            return self.read_bind
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
+AsyncReadSessionLocal = async_sessionmaker(
+    async_engine,
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
+    autoflush=False
+)
+
+def wants_primary_reads(request: Request) -> bool:
+    """True right after this client wrote something it expects to read back"""
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def mark_read_your_writes(response: Response):
+    """Pin this client's reads to the primary until the replica has caught up"""
+    response.set_cookie(
+        READ_YOUR_WRITES_COOKIE,
+        str(int(time.time()) + READ_YOUR_WRITES_SECONDS),
+        max_age=READ_YOUR_WRITES_SECONDS,
+        httponly=True,
+        secure=True,
+        samesite="lax"
+    )
+    return response
+
+def get_read_db(request: Request):
+    """Dependency for read-only DB sessions (replica when fresh enough)."""
+    db = ReadSessionLocal(read_bind=replica_router.read_bind(wants_primary_reads(request)))
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    """Dependency for read-only async DB sessions (replica when fresh enough)."""
+    read_bind = replica_router.read_bind(wants_primary_reads(request), use_async=True)
+    async with AsyncReadSessionLocal(read_bind=read_bind) as db:
+        yield db
+
 # ----- User & Usage Models -----
 class GeneratedTweet(Base):
+    # On Postgres this is range partitioned by month on generated_at with
+    # PRIMARY KEY (id, generated_at); ids still come from one shared sequence
     __tablename__ = "generated_tweets"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     tweet_text = Column(String)
     generated_at = Column(DateTime, default=datetime.utcnow)
     user = relationship("User")
+    __table_args__ = (
+        # Serves the keyset-paginated history query. tweet_text is not
+        # INCLUDEd: long tweets could push an entry past the btree row limit
+        Index("ix_generated_tweets_user_history", "user_id", "generated_at", "id"),
+    )
+
+class PendingTweet(Base):
+    # Durable staging for TweetWriteBuffer: generated tweets are added here in
+    # the request's transaction and moved into generated_tweets in batches. On
+    # Postgres ids come from generated_tweets_id_seq and are kept by the move.
+    __tablename__ = "pending_tweets"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    tweet_text = Column(String)
+    generated_at = Column(DateTime, nullable=False)
+    __table_args__ = (
+        Index("ix_pending_tweets_user_generated_at", "user_id", "generated_at"),
+    )
 
 class IPban(Base):
     __tablename__ = "ip_bans"
@@ -212,6 +702,38 @@ class User(Base):
     last_failed_login = Column(DateTime, nullable=True)
     account_locked_until = Column(DateTime, nullable=True)
 
+    # Rows in generated_tweets, kept by the tweet buffer flush and the
+    # retention sweeper (adjust_tweet_counts) for the admin listing
+    tweet_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("ix_users_api_key", "api_key", postgresql_where=text("api_key IS NOT NULL")),
+        Index("ix_users_stripe_customer_id", "stripe_customer_id",
+              postgresql_where=text("stripe_customer_id IS NOT NULL")),
+        Index("ix_users_cancellation_date", "cancellation_date",
+              postgresql_where=text("cancellation_date IS NOT NULL")),
+        # Rolling 24h "active today" count on the admin dashboard
+        Index("ix_users_last_login", "last_login"),
+        # Admin user listing sorted by tweet count, keyset on (tweet_count, id)
+        Index("ix_users_tweet_count", "tweet_count", "id"),
+        # Admin user search (search_users_sql), Postgres only: prefix matches
+        # are read in lower(column) order, substring matches by trigram
+        *[index.ddl_if(dialect="postgresql") for field, column in (
+            ("username", username), ("email", email),
+            ("last_known_ip", last_known_ip), ("registration_ip", registration_ip),
+        ) for index in (
+            Index(f"ix_users_{field}_prefix", func.lower(column).collate("C"), "id"),
+            Index(f"ix_users_{field}_trgm", func.lower(column).label(f"{field}_lower"),
+                  postgresql_using="gin", postgresql_ops={f"{field}_lower": "gin_trgm_ops"}),
+        )],
+    )
+
+# create_all needs pg_trgm for the trigram indexes above
+sqlalchemy_event.listen(
+    User.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
 class Usage(Base):
     __tablename__ = "usage"
     id = Column(Integer, primary_key=True, index=True)
@@ -219,6 +741,9 @@ class Usage(Base):
     date = Column(String)
     count = Column(Integer, default=0)
     user = relationship("User")
+    __table_args__ = (
+        Index("ix_usage_user_id_date", "user_id", "date"),
+    )
     
 class UserActivity(Base):
     __tablename__ = "user_activity"
@@ -231,6 +756,11 @@ class UserActivity(Base):
     timestamp = Column(DateTime, nullable=True)
     user_metadata = Column(String, nullable=True) 
     user = relationship("User")
+    __table_args__ = (
+        # Keyset pagination of one user's log, optionally by activity type
+        Index("ix_user_activity_user_timeline", "user_id", "timestamp", "id"),
+        Index("ix_user_activity_user_type_timeline", "user_id", "activity_type", "timestamp", "id"),
+    )
     
 class PasswordReset(Base):
     __tablename__ = "password_resets"
@@ -269,6 +799,74 @@ class BlogPost(Base):
     views = Column(Integer, default=0)
     read_time = Column(Integer, default=5)
 
+class AdminStat(Base):
+    """Current value of an admin dashboard counter (see ADMIN_STAT_KEYS)"""
+    __tablename__ = "admin_stats"
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class AdminStatsDaily(Base):
+    """Per-day admin figures: signups/active users are counted as they happen,
+    the totals are snapshots written by reconciliation"""
+    __tablename__ = "admin_stats_daily"
+    day = Column(Date, primary_key=True)
+    signups = Column(Integer, nullable=False, default=0)
+    active_users = Column(Integer, nullable=False, default=0)
+    total_users = Column(Integer, nullable=True)
+    suspended_users = Column(Integer, nullable=True)
+    pending_appeals = Column(Integer, nullable=True)
+    active_ip_bans = Column(Integer, nullable=True)
+
+class AdminStatDelta(Base):
+    """Append-only admin stat changes, inserted by the transaction that made
+    them and folded into admin_stats / admin_stats_daily by admin_stats_rollup"""
+    __tablename__ = "admin_stat_deltas"
+    id = Column(Integer, primary_key=True)
+    key = Column(String, nullable=False)  # admin_stats key, or admin_stats_daily column when day is set
+    day = Column(Date, nullable=True)
+    delta = Column(Integer, nullable=False)
+
+class StripeEvent(Base):
+    """Verified Stripe webhook events, stored on receipt and applied by
+    stripe_event_processor. The primary key is Stripe's event id, so a
+    redelivered event is recognised and never applied twice."""
+    __tablename__ = "stripe_events"
+    id = Column(String, primary_key=True)  # evt_...
+    type = Column(String, nullable=False)
+    customer_id = Column(String, nullable=True)
+    created = Column(Integer, nullable=False)  # Stripe's event timestamp, orders a customer's events
+    payload = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # 'pending', 'processing', 'processed', 'dead'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_stripe_events_due", "next_attempt_at", postgresql_where=text("status = 'pending'")),
+        Index("ix_stripe_events_customer_order", "customer_id", "created", "received_at", "id",
+              postgresql_where=text("status IN ('pending', 'processing')")),
+        Index("ix_stripe_events_status_received", "status", "received_at"),
+    )
+
+class StripeSubscription(Base):
+    """Local copy of a Stripe subscription, written from webhook events (and
+    checkout) so pages can show billing state without calling Stripe"""
+    __tablename__ = "stripe_subscriptions"
+    id = Column(String, primary_key=True)  # sub_...
+    customer_id = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False)  # Stripe's: 'active', 'trialing', 'past_due', 'canceled'...
+    price_id = Column(String, nullable=True)
+    cancel_at_period_end = Column(Boolean, nullable=False, default=False)
+    current_period_end = Column(DateTime, nullable=True)
+    canceled_at = Column(DateTime, nullable=True)
+    ended_at = Column(DateTime, nullable=True)
+    # Stripe timestamp of the state stored here; older updates are ignored
+    stripe_updated = Column(Integer, nullable=False, default=0)
+    synced_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
 # Security Headers Middleware
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -291,15 +889,388 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
         return response
 
-def is_valid_email_domain(email: str) -> bool:
-    try:
+# Email domain validation
+EMAIL_DOMAIN_MX_TIMEOUT_SECONDS = float(os.getenv("EMAIL_DOMAIN_MX_TIMEOUT_SECONDS", 3))
+EMAIL_DOMAIN_POSITIVE_TTL_SECONDS = int(os.getenv("EMAIL_DOMAIN_POSITIVE_TTL_SECONDS", 86400))
+EMAIL_DOMAIN_NEGATIVE_TTL_SECONDS = int(os.getenv("EMAIL_DOMAIN_NEGATIVE_TTL_SECONDS", 900))
+EMAIL_DOMAIN_CACHE_SIZE = int(os.getenv("EMAIL_DOMAIN_CACHE_SIZE", 10000))
+
+# Mailbox providers that certainly accept mail; these never go to DNS
+POPULAR_EMAIL_DOMAINS = frozenset({
+    "gmail.com", "googlemail.com", "outlook.com", "hotmail.com", "hotmail.co.uk", "live.com",
+    "msn.com", "yahoo.com", "yahoo.co.uk", "ymail.com", "icloud.com", "me.com", "mac.com",
+    "aol.com", "protonmail.com", "proton.me", "pm.me", "gmx.com", "gmx.de", "gmx.net",
+    "web.de", "mail.com", "yandex.com", "yandex.ru", "zoho.com", "fastmail.com", "hey.com",
+})
+
+# Throwaway inbox services, rejected before any lookup. Extend with a file of
+# one domain per line via DISPOSABLE_EMAIL_DOMAINS_FILE.
+DISPOSABLE_EMAIL_DOMAINS = frozenset({
+    "10minutemail.com", "10minutemail.net", "20minutemail.com", "33mail.com", "burnermail.io",
+    "discard.email", "dispostable.com", "emailondeck.com", "fakeinbox.com", "getairmail.com",
+    "getnada.com", "guerrillamail.biz", "guerrillamail.com", "guerrillamail.de", "guerrillamail.info",
+    "guerrillamail.net", "guerrillamail.org", "guerrillamailblock.com", "inboxkitten.com",
+    "jetable.org", "mailcatch.com", "maildrop.cc", "mailinator.com", "mailinator.net",
+    "mailnesia.com", "mintemail.com", "mohmal.com", "moakt.com", "mytemp.email", "nada.email",
+    "sharklasers.com", "spam4.me", "spamgourmet.com", "temp-mail.io", "temp-mail.org",
+    "tempail.com", "tempmail.com", "tempmail.net", "tempmailo.com", "tempr.email",
+    "throwawaymail.com", "trashmail.com", "trashmail.de", "trashmail.net", "yopmail.com",
+    "yopmail.fr", "yopmail.net",
+})
+
+def load_disposable_email_domains(path: Optional[str] = os.getenv("DISPOSABLE_EMAIL_DOMAINS_FILE")) -> frozenset:
+    if not path:
+        return DISPOSABLE_EMAIL_DOMAINS
+    with open(path) as f:
+        extra = {line.strip().lower() for line in f if line.strip() and not line.startswith("#")}
+    return DISPOSABLE_EMAIL_DOMAINS | extra
+
+class EmailDomainValidator:
+    """Decides whether an email address's domain can receive mail.
+
+    Checks run cheapest first: disposable domains (and their subdomains)
+    are rejected and popular providers accepted from in-memory sets, then
+    the MX lookup result is served from a per-domain cache. Domains with MX
+    records are cached for positive_ttl; NXDOMAIN, no MX and null MX
+    (RFC 7505) answers for negative_ttl. Timeouts and SERVFAILs are not
+    cached, so a resolver outage doesn't stick. Concurrent lookups of the
+    same domain share one query.
+
+    resolver is anything with dnspython's async resolve(qname, rdtype,
+    lifetime=...) that raises dns.resolver.NXDOMAIN/NoAnswer, so tests can
+    pass a local stub; by default dns.asyncresolver is used.
+    """
+
+    def __init__(self, resolver=None, positive_ttl: int = EMAIL_DOMAIN_POSITIVE_TTL_SECONDS,
+                 negative_ttl: int = EMAIL_DOMAIN_NEGATIVE_TTL_SECONDS,
+                 timeout: float = EMAIL_DOMAIN_MX_TIMEOUT_SECONDS, max_size: int = EMAIL_DOMAIN_CACHE_SIZE,
+                 popular_domains: frozenset = POPULAR_EMAIL_DOMAINS, disposable_domains: Optional[frozenset] = None):
+        self.resolver = resolver
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.max_size = max_size
+        self.popular_domains = popular_domains
+        self.disposable_domains = load_disposable_email_domains() if disposable_domains is None else disposable_domains
+        self._cache = {}  # {domain: (valid, expires_at)}
+        self._inflight = {}  # {domain: Future}
+        self._hits = 0
+        self._lookups = 0
+        self._errors = 0
+
+    @staticmethod
+    def domain_of(email: str) -> Optional[str]:
         if "@" not in email:
+            return None
+        domain = email.rsplit("@", 1)[1].strip().lower().rstrip(".")
+        return domain or None
+
+    def is_disposable(self, domain: str) -> bool:
+        # mx.mailinator.com is as disposable as mailinator.com
+        labels = domain.split(".")
+        return any(".".join(labels[i:]) in self.disposable_domains for i in range(len(labels) - 1))
+
+    async def lookup(self, domain: str) -> Optional[bool]:
+        """MX lookup; None when the answer is unknown (timeout, SERVFAIL)"""
+        self._lookups += 1
+        resolver = self.resolver or dns_asyncresolver
+        try:
+            answer = await resolver.resolve(domain, "MX", lifetime=self.timeout)
+        except (dns_resolver.NXDOMAIN, dns_resolver.NoAnswer):
             return False
-        domain = email.rsplit("@", 1)[1].strip().lower()
-        dns.resolver.resolve(domain, "MX", lifetime=3)
-        return True
-    except Exception:
-        return False
+        except Exception as e:
+            self._errors += 1
+            print(f"⚠️ MX lookup for {domain} failed: {type(e).__name__}: {e}")
+            return None
+        # A lone "0 ." MX record means the domain explicitly accepts no mail
+        return any(str(record.exchange) != "." for record in answer)
+
+    def _store(self, domain: str, valid: bool):
+        if len(self._cache) >= self.max_size:
+            now = time.monotonic()
+            self._cache = {d: entry for d, entry in self._cache.items() if entry[1] > now}
+            while len(self._cache) >= self.max_size:
+                self._cache.pop(next(iter(self._cache)))
+        ttl = self.positive_ttl if valid else self.negative_ttl
+        self._cache[domain] = (valid, time.monotonic() + ttl)
+
+    async def is_valid(self, email: str) -> bool:
+        domain = self.domain_of(email)
+        if not domain or self.is_disposable(domain):
+            return False
+        if domain in self.popular_domains:
+            return True
+
+        cached = self._cache.get(domain)
+        if cached and cached[1] > time.monotonic():
+            self._hits += 1
+            return cached[0]
+
+        pending = self._inflight.get(domain)
+        if pending is None:
+            pending = asyncio.ensure_future(self.lookup(domain))
+            self._inflight[domain] = pending
+            pending.add_done_callback(lambda task: self._finish(domain, task))
+        # Shielded so one cancelled request doesn't cancel the others' lookup
+        valid = await asyncio.shield(pending)
+        # Unknown answers fail closed, as the blocking check did
+        return bool(valid)
+
+    def _finish(self, domain: str, task: asyncio.Future):
+        self._inflight.pop(domain, None)
+        if not task.cancelled() and task.result() is not None:
+            self._store(domain, task.result())
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {
+            "cached_domains": len(self._cache),
+            "cache_hits": self._hits,
+            "dns_lookups": self._lookups,
+            "dns_errors": self._errors,
+            "disposable_domains": len(self.disposable_domains)
+        }
+
+email_domain_validator = EmailDomainValidator()
+
+async def is_valid_email_domain(email: str) -> bool:
+    return await email_domain_validator.is_valid(email)
+
+# SMTP connection pool
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_POOL_MAX_IDLE_SECONDS = float(os.getenv("SMTP_POOL_MAX_IDLE_SECONDS", 60))
+SMTP_POOL_MAX_MESSAGES = int(os.getenv("SMTP_POOL_MAX_MESSAGES", 100))
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 15))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+
+class PooledSMTPConnection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.messages_sent = 0
+        self.reused = False
+
+class SMTPConnectionPool:
+    """Thread-safe pool of logged-in SMTP connections.
+
+    Opening a connection costs a TCP handshake, STARTTLS and AUTH, so
+    connections are kept and reused across messages. At most `size` are
+    open at once; callers beyond that wait for one to be checked in. A
+    connection idle longer than max_idle_seconds is closed instead of
+    reused (providers drop idle sessions), one is retired after
+    max_messages, and a send that finds its reused connection dead is
+    retried once on a fresh one. send() blocks; async callers go through
+    asyncio.to_thread.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str, size: int = SMTP_POOL_SIZE,
+                 max_idle_seconds: float = SMTP_POOL_MAX_IDLE_SECONDS, max_messages: int = SMTP_POOL_MAX_MESSAGES,
+                 timeout: float = SMTP_TIMEOUT_SECONDS, starttls: bool = SMTP_STARTTLS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.max_idle_seconds = max_idle_seconds
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.starttls = starttls
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = []  # LIFO, so the most recently used (warmest) connection goes out first
+        self.opened = 0
+        self.reused = 0
+        self.sent = 0
+        self.reconnects = 0
+        self.failures = 0
+
+    def _connect(self) -> PooledSMTPConnection:
+        if self.port == 465:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self.opened += 1
+        return PooledSMTPConnection(smtp)
+
+    @staticmethod
+    def _close(connection: PooledSMTPConnection):
+        try:
+            connection.smtp.quit()
+        except Exception:
+            connection.smtp.close()
+
+    def _checkout(self) -> PooledSMTPConnection:
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self._connect()
+                if time.monotonic() - connection.last_used > self.max_idle_seconds:
+                    self._close(connection)
+                    continue
+                connection.reused = True
+                self.reused += 1
+                return connection
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, connection: PooledSMTPConnection, healthy: bool):
+        try:
+            if healthy and connection.messages_sent < self.max_messages:
+                connection.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(connection)
+            else:
+                self._close(connection)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _is_dead_connection(error: Exception) -> bool:
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        if isinstance(error, smtplib.SMTPResponseException):
+            return error.smtp_code == 421  # service closing transmission channel
+        # SMTPException subclasses OSError; plain OSErrors are socket failures
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+    def send(self, from_addr: str, recipients: list, message: str):
+        for attempt in (1, 2):
+            connection = self._checkout()
+            try:
+                connection.smtp.sendmail(from_addr, recipients, message)
+            except Exception as e:
+                self._checkin(connection, healthy=False)
+                self.failures += 1
+                if attempt == 1 and connection.reused and self._is_dead_connection(e):
+                    self.reconnects += 1
+                    continue
+                raise
+            connection.messages_sent += 1
+            self.sent += 1
+            self._checkin(connection, healthy=True)
+            return
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "opened": self.opened,
+            "reused": self.reused,
+            "sent": self.sent,
+            "reconnects": self.reconnects,
+            "failures": self.failures
+        }
+
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "email")
+EMAIL_TEMPLATE_CACHE_DIR = os.getenv("EMAIL_TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "giverai-email-templates"))
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_RULE = re.compile(r"\.([A-Za-z][\w-]*)\s*\{([^}]*)\}")
+_HTML_TAG = re.compile(r"<[A-Za-z][^<>]*>")
+_CLASS_ATTR = re.compile(r'\sclass="([^"{}]*)"')
+_STYLE_ATTR = re.compile(r'\sstyle="')
+
+def parse_email_css(css: str) -> dict:
+    """Map each single-class rule in the email stylesheet to its declarations"""
+    rules = {}
+    for name, body in _CSS_RULE.findall(_CSS_COMMENT.sub("", css)):
+        declarations = [declaration.strip() for declaration in body.split(";") if declaration.strip()]
+        rules[name] = "; ".join(declarations) + ";"
+    return rules
+
+def inline_email_css(source: str, rules: dict) -> str:
+    """Turn class="..." on every tag into inline styles. Class declarations go
+    first so a style="" already on the tag overrides them."""
+    def inline(match):
+        tag = match.group(0)
+        classes = _CLASS_ATTR.search(tag)
+        if not classes:
+            return tag
+        names = classes.group(1).split()
+        unknown = [name for name in names if name not in rules]
+        if unknown:
+            raise ValueError(f"Unknown email CSS class: {', '.join(unknown)}")
+        declarations = " ".join(rules[name] for name in names)
+        tag = tag[:classes.start()] + tag[classes.end():]
+        style = _STYLE_ATTR.search(tag)
+        if style:
+            return f"{tag[:style.end()]}{declarations} {tag[style.end():]}"
+        end = -2 if tag.endswith("/>") else -1
+        return f'{tag[:end].rstrip()} style="{declarations}"{tag[end:]}'
+    return _HTML_TAG.sub(inline, source)
+
+class EmailTemplateLoader(FileSystemLoader):
+    """Loads email templates with styles.css already inlined, so the compiled
+    template (and its bytecode cache entry) holds the final markup and
+    rendering never touches CSS"""
+    def __init__(self, searchpath: str, stylesheet: str = "styles.css"):
+        super().__init__(searchpath)
+        with open(os.path.join(searchpath, stylesheet), encoding="utf-8") as f:
+            self.css_rules = parse_email_css(f.read())
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if template.endswith(".html"):
+            source = inline_email_css(source, self.css_rules)
+        return source, filename, uptodate
+
+def plan_display_name(plan: str) -> str:
+    return (plan or "").replace("_", " ").title()
+
+def nl2br(value: str) -> Markup:
+    return Markup("<br>").join(escape(value or "").split("\n"))
+
+def build_email_environment(cache_dir: str) -> Environment:
+    env = Environment(
+        loader=EmailTemplateLoader(EMAIL_TEMPLATE_DIR),
+        autoescape=select_autoescape(enabled_extensions=("html",), default_for_string=False),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir),
+        undefined=StrictUndefined,
+        trim_blocks=True,
+        lstrip_blocks=True,
+        auto_reload=False
+    )
+    env.filters["plan_name"] = plan_display_name
+    env.filters["nl2br"] = nl2br
+    return env
+
+@lru_cache(maxsize=None)
+def get_email_templates() -> Environment:
+    """Email template environment, built on first use (startup warm-up or
+    first send) so importing main reads no CSS and creates no directories"""
+    os.makedirs(EMAIL_TEMPLATE_CACHE_DIR, exist_ok=True)
+    return build_email_environment(EMAIL_TEMPLATE_CACHE_DIR)
+
+def compile_email_templates() -> int:
+    """Compile every email template up front, filling the bytecode cache"""
+    email_templates = get_email_templates()
+    names = email_templates.list_templates(extensions=["html", "txt"])
+    for name in names:
+        email_templates.get_template(name)
+    return len(names)
+
+def render_email_template(template: str, /, **context) -> tuple[str, str]:
+    """Render the HTML and plain-text parts of templates/email/<template>"""
+    email_templates = get_email_templates()
+    html_body = email_templates.get_template(f"{template}.html").render(context)
+    text_body = email_templates.get_template(f"{template}.txt").render(context)
+    return html_body, text_body
 
 class EmailService:
     def __init__(self):
@@ -309,6 +1280,7 @@ class EmailService:
         self.smtp_password = os.getenv("SMTP_PASSWORD")
         self.from_email = os.getenv("EMAIL_FROM", "noreply@giverai.me")
         self.sender_name = os.getenv("EMAIL_SENDER_NAME", "GiverAI")
+        self.transport = SMTPConnectionPool(self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password)
        
     async def send_email(self, to_email: str, subject: str, body: str):
         """Base email sending method"""
@@ -330,19 +1302,9 @@ class EmailService:
             # Add body
             msg.attach(MIMEText(body, 'plain'))
             
-            # Send email
-            print(f"🔌 Connecting to SMTP server: {self.smtp_server}:{self.smtp_port}")
-            
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()  # Enable security
-            
-            print(f"🔐 Logging in with username: {self.smtp_username}")
-            server.login(self.smtp_username, self.smtp_password)
-            
+            # Send email over a pooled connection, off the event loop
             print(f"📤 Sending email...")
-            text = msg.as_string()
-            server.sendmail(self.from_email, to_email, text)
-            server.quit()
+            await asyncio.to_thread(self.transport.send, self.from_email, [to_email], msg.as_string())
             
             print(f"✅ Email sent successfully to {to_email}")
             
@@ -353,31 +1315,34 @@ class EmailService:
             print(f"❌ Full traceback: {traceback.format_exc()}")
             raise e
 
-    def send_simple_email(self, to_email: str, subject: str, html_body: str,bcc: list[str] | None = None, ) -> bool:
+    def build_message(self, to_email: str, subject: str, html_body: str | None = None, text_body: str | None = None) -> MIMEMultipart:
+        """Build the MIME message for an email, plain part first when there is one"""
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = f"{self.sender_name} <{self.from_email}>"
+        msg["To"] = to_email
+
+        if text_body:
+            msg.attach(MIMEText(text_body, "plain"))
+        if html_body:
+            msg.attach(MIMEText(html_body, "html"))
+        return msg
+
+    def send_simple_email(self, to_email: str, subject: str, html_body: str, bcc: list[str] | None = None, text_body: str | None = None) -> bool:
         """Send an email with simple HTML"""
         try:
             if not all([self.smtp_server, self.smtp_username, self.smtp_password]):
                 print("⛔ Missing email configuration")
                 return False
 
-            # Create message
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = f"{self.sender_name} <{self.from_email}>"
-            msg["To"] = to_email
-
-            html_part = MIMEText(html_body, "html")
-            msg.attach(html_part)
+            msg = self.build_message(to_email, subject, html_body, text_body)
 
             recipients = [to_email]
             if bcc:
                 recipients.extend(bcc)
 
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.sendmail(self.from_email, recipients, msg.as_string())
+            # Send email over a pooled connection
+            self.transport.send(self.from_email, recipients, msg.as_string())
 
             print(f"✅ Email sent to {to_email} (bcc={bcc})")
             return True
@@ -385,374 +1350,108 @@ class EmailService:
         except Exception as e:
             print(f"⛔ Failed to send email: {str(e)}")
             return False
+
+    async def send_simple_email_async(self, to_email: str, subject: str, html_body: str, bcc: list[str] | None = None, text_body: str | None = None) -> bool:
+        """send_simple_email without blocking the event loop"""
+        return await asyncio.to_thread(self.send_simple_email, to_email, subject, html_body, bcc, text_body)
         
+    def send_template(self, template: str, to_email: str, subject: str, /, bcc: list[str] | None = None, **context) -> bool:
+        """Render an email template's HTML and text parts and send them"""
+        if email_suppressions.blocks(to_email, template):
+            return False
+        html_body, text_body = render_email_template(template, **context)
+        return self.send_simple_email(to_email, subject, html_body, bcc, text_body=text_body)
+
+    async def send_template_async(self, template: str, to_email: str, subject: str, /, bcc: list[str] | None = None, **context) -> bool:
+        """send_template without blocking the event loop on SMTP"""
+        if await email_suppressions.blocks_async(to_email, template):
+            return False
+        html_body, text_body = render_email_template(template, **context)
+        return await self.send_simple_email_async(to_email, subject, html_body, bcc, text_body=text_body)
+
     async def send_password_reset_email(self, user, reset_token, ip_address="Unknown"):
         """Send password reset email"""
-        reset_url = f"https://giverai.me/reset-password?token={reset_token}"
-
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h1 style="color: #667eea;">Password Reset Request</h1>
-              <p>Hi {user.username}!</p>
-              <p>We received a request to reset your password for your GiverAI account.</p>
-              <p>
-                <a href="{reset_url}"
-                   style="background: #28a745; color: white; padding: 12px 24px;
-                          text-decoration: none; border-radius: 4px;
-                          display: inline-block;">
-                  Reset My Password
-                </a>
-              </p>
-              <p>This link expires in 1 hour.</p>
-              <p>Request made from IP: {ip_address}</p>
-              <p>If you didn't request this, please ignore this email.</p>
-              <p>Best regards,<br>The GiverAI Team</p>
-            </div>
-          </body>
-        </html>
-        """
-        
-        return self.send_simple_email(
-            user.email,
-            "Reset Your GiverAI Password 🔑",
-            html_body
+        return await self.send_template_async(
+            "password_reset", user.email, "Reset Your GiverAI Password 🔑",
+            user=user,
+            reset_url=f"https://giverai.me/reset-password?token={reset_token}",
+            ip_address=ip_address
         )
 
     async def send_account_locked_email(self, email: str, lock_duration_hours: int = 24):
         """Send account locked notification email"""
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h1 style="color: #dc3545;">Account Temporarily Locked</h1>
-              <p>Your GiverAI account has been temporarily locked due to multiple failed login attempts.</p>
-              <p><strong>Lock Duration:</strong> {lock_duration_hours} hours</p>
-              <p>This is a security measure to protect your account. You can try logging in again after the lock period expires.</p>
-              <p>If you believe this was not you, please contact our support team immediately.</p>
-              <p>Best regards,<br>The GiverAI Team</p>
-            </div>
-          </body>
-        </html>
-        """
-        
-        return self.send_simple_email(
-            email,
-            "Account Temporarily Locked - GiverAI",
-            html_body
+        return await self.send_template_async(
+            "account_locked", email, "Account Temporarily Locked - GiverAI",
+            lock_duration_hours=lock_duration_hours
         )
-        
+
     async def send_suspension_email(self, email: str, reason: str):
         """Send account suspension notification email"""
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h1 style="color: #dc3545;">Account Suspended</h1>
-              <p>Your GiverAI account has been suspended.</p>
-              <p><strong>Reason:</strong> {reason}</p>
-              <p>If you believe this was done in error, please contact our support team.</p>
-              <p>Best regards,<br>The GiverAI Team</p>
-            </div>
-          </body>
-        </html>
-        """
-        
-        return self.send_simple_email(
-            email,
-            "Account Suspended - GiverAI",
-            html_body
+        return await self.send_template_async(
+            "suspension", email, "Account Suspended - GiverAI",
+            reason=reason
         )
-    
+
     async def send_day1_followup_email(self, user, tweets_created: int, tweets_remaining: int, hours_until_reset: int):
         """Day 1 follow-up — sent after first day to nudge continued use"""
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; background: #f9f9f9;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 30px; background: white; border-radius: 8px;">
-            <h1 style="color: #667eea;">How did your first day go? 🚀</h1>
-            <p>Hey {user.username},</p>
-            <p>You generated <strong>{tweets_created} tweet{'s' if tweets_created != 1 else ''}</strong> today. 
-            {'Nice start!' if tweets_created > 0 else "Looks like you haven't tried it yet — here's what you're missing:"}</p>
-            
-            {'<p>You still have <strong>' + str(tweets_remaining) + ' free tweets</strong> left today. Your credits reset in ' + str(hours_until_reset) + ' hours.</p>' if tweets_remaining > 0 else '<p>Your daily credits reset in ' + str(hours_until_reset) + ' hours — come back tomorrow for 15 more free tweets.</p>'}
-            
-            <p style="margin: 30px 0;">
-                <a href="https://giverai.me/dashboard" 
-                style="background: linear-gradient(45deg, #00ffff, #667eea); color: #000; padding: 14px 28px;
-                        text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">
-                Generate More Tweets →
-                </a>
-            </p>
-            
-            <p style="color: #666; font-size: 14px;">
-                💡 <strong>Pro tip:</strong> Try switching tones. Casual works great for personal takes, 
-                Professional for industry content, Refined for thought leadership.
-            </p>
-            
-            <p style="color: #666; font-size: 13px; margin-top: 30px; border-top: 1px solid #eee; padding-top: 20px;">
-                Want unlimited tweets? Use code <strong>FLASH40</strong> for 40% off Creator plan ($5.40/mo) — offer ends August 2026.
-            </p>
-            
-            <p>— The GiverAI Team</p>
-            </div>
-        </body>
-        </html>
-        """
-        return self.send_simple_email(
-            user.email,
-            "How did your first day with GiverAI go? 🚀",
-            html_body
+        return await self.send_template_async(
+            "day1_followup", user.email, "How did your first day with GiverAI go? 🚀",
+            user=user,
+            tweets_created=tweets_created,
+            tweets_remaining=tweets_remaining,
+            hours_until_reset=hours_until_reset
         )
-        
-    
+
     async def send_day3_nudge_email(self, user, last_login: str, missed_tweets: int):
         """Day 3 nudge — sent if user hasn't returned"""
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; background: #f9f9f9;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 30px; background: white; border-radius: 8px;">
-            <h1 style="color: #667eea;">You've missed {missed_tweets} free tweets 👀</h1>
-            <p>Hey {user.username},</p>
-            <p>Since you last logged in on {last_login}, your free daily credits have been resetting 
-            — <strong>{missed_tweets} tweets you could have generated, free.</strong></p>
-            <p>Takes 2 minutes. No credit card. No catch.</p>
-            
-            <p style="margin: 30px 0;">
-                <a href="https://giverai.me/dashboard"
-                style="background: linear-gradient(45deg, #00ffff, #667eea); color: #000; padding: 14px 28px;
-                        text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">
-                Claim Your Free Tweets →
-                </a>
-            </p>
-            
-            <p style="color: #666; font-size: 13px; margin-top: 30px; border-top: 1px solid #eee; padding-top: 20px;">
-                40% off Creator plan with code <strong>FLASH40</strong> — ends August 2026.
-            </p>
-            
-            <p>— The GiverAI Team</p>
-            </div>
-        </body>
-        </html>
-        """
-        return self.send_simple_email(
-            user.email,
-            "You've missed 45 free tweets (they don't roll over) 👀",
-            html_body
+        return await self.send_template_async(
+            "day3_nudge", user.email, "You've missed 45 free tweets (they don't roll over) 👀",
+            user=user,
+            last_login=last_login,
+            missed_tweets=missed_tweets
         )
 
-
     async def send_day7_reengagement_email(self, user):
         """Day 7 re-engagement — last attempt before going quiet"""
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; background: #f9f9f9;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 30px; background: white; border-radius: 8px;">
-            <h1 style="color: #667eea;">Still there, {user.username}? 👋</h1>
-            <p>It's been a week since you signed up for GiverAI.</p>
-            <p>We won't keep nudging you after this — but before we go quiet, 
-            we wanted to make sure you actually got to try it properly.</p>
-            
-            <p>If something didn't work, or the output didn't sound like you — 
-            <strong>reply to this email and tell us.</strong> We read every reply.</p>
-            
-            <p style="margin: 30px 0;">
-                <a href="https://giverai.me/dashboard"
-                style="background: linear-gradient(45deg, #00ffff, #667eea); color: #000; padding: 14px 28px;
-                        text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">
-                Give It One More Try →
-                </a>
-            </p>
-            
-            <p style="color: #666; font-size: 14px;">
-                15 free tweets every day. No credit card. Your account is still active.
-            </p>
-
-            <p style="color: #666; font-size: 13px; margin-top: 30px; border-top: 1px solid #eee; padding-top: 20px;">
-                40% off Creator plan with code <strong>FLASH40</strong> — ends August 2026.
-            </p>
-            
-            <p>— The GiverAI Team</p>
-            </div>
-        </body>
-        </html>
-        """
-        return self.send_simple_email(
-            user.email,
-            "Still there? (last email from us) 👋",
-            html_body
+        return await self.send_template_async(
+            "day7_reengagement", user.email, "Still there? (last email from us) 👋",
+            user=user
         )
 
-
     async def send_power_user_reward_email(self, user, tweets_remaining: int):
         """Power user reward — sent when user returns on day 2"""
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; background: #f9f9f9;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 30px; background: white; border-radius: 8px;">
-            <h1 style="color: #667eea;">You came back 🔥</h1>
-            <p>Hey {user.username},</p>
-            <p>Day 2. You actually came back. That puts you ahead of most people who sign up for tools like this.</p>
-            <p>You've got <strong>{tweets_remaining} free tweets</strong> left today.</p>
-            
-            <p style="color: #444; background: #f0f0ff; padding: 15px; border-radius: 8px; border-left: 4px solid #667eea;">
-                💡 <strong>The workflow that works:</strong> Generate 5 variations, pick the best hook, 
-                add one personal detail only you'd know, post. Takes under 3 minutes.
-            </p>
-            
-            <p style="margin: 30px 0;">
-                <a href="https://giverai.me/dashboard"
-                style="background: linear-gradient(45deg, #00ffff, #667eea); color: #000; padding: 14px 28px;
-                        text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">
-                Keep Going →
-                </a>
-            </p>
-            
-            <p style="color: #666; font-size: 13px; margin-top: 30px; border-top: 1px solid #eee; padding-top: 20px;">
-                Ready to go unlimited? Code <strong>FLASH40</strong> → 40% off Creator plan ($5.40/mo). Ends August 2026.
-            </p>
-            
-            <p>— The GiverAI Team</p>
-            </div>
-        </body>
-        </html>
-        """
-        return self.send_simple_email(
-            user.email,
-            "You came back 🔥 here's the workflow that works",
-            html_body
+        return await self.send_template_async(
+            "power_user_reward", user.email, "You came back 🔥 here's the workflow that works",
+            user=user,
+            tweets_remaining=tweets_remaining
         )
 
     async def send_account_recovery_email(self, email: str):
         """Send account recovery instructions email"""
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h1 style="color: #ffc107;">Account Security Alert</h1>
-              <p>We've received a report that your account may have been compromised.</p>
-              <p><strong>Immediate actions taken:</strong></p>
-              <ul>
-                <li>Account temporarily suspended</li>
-                <li>All active sessions invalidated</li>
-                <li>Password reset required</li>
-              </ul>
-              <p>To recover your account, please contact our support team with proof of identity.</p>
-              <p>Best regards,<br>The GiverAI Team</p>
-            </div>
-          </body>
-        </html>
-        """
-        
-        return self.send_simple_email(
-            email,
-            "Account Security Alert - GiverAI",
-            html_body
+        return await self.send_template_async(
+            "account_recovery", email, "Account Security Alert - GiverAI"
         )
+
     async def send_downgrade_confirmation_email(self, user):
         pass
         """Send downgrade confirmation email"""
 
     async def send_verification_email(self, user, verification_token):
         """Send verification email with simple template"""
-        verification_url = f"https://giverai.me/verify-email?token={verification_token}"
-
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h1 style="color: #667eea;">Verify Your Email</h1>
-              <p>Hi {user.username}!</p>
-              <p>Please verify your email address by clicking the button below:</p>
-              <p>
-                <a href="{verification_url}"
-                   style="background: #28a745; color: white; padding: 12px 24px;
-                          text-decoration: none; border-radius: 4px;
-                          display: inline-block;">
-                  Verify Email Address
-                </a>
-              </p>
-              <p>This link expires in 24 hours.</p>
-              <p>Best regards,<br>The GiverAI Team</p>
-            </div>
-          </body>
-        </html>
-        """
-
-        return self.send_simple_email(
-            user.email,
-            "Verify Your GiverAI Account",
-            html_body
+        return await self.send_template_async(
+            "verification", user.email, "Verify Your GiverAI Account",
+            user=user,
+            verification_url=f"https://giverai.me/verify-email?token={verification_token}"
         )
+
     async def send_welcome_email(self, user):
         """Send welcome email to new user"""
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; margin: 0; padding: 0;">
-             <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                  <div style="background: #667eea; color: white; padding: 30px;
-                  text-align: center; border-radius: 8px;">
-                    <h1 style="margin: 0; color: white;">Welcome to GiverAI! 🎉</h1>
-                        <p style="margin: 10px 0 0 0; color: white;">
-                      Your AI-powered Twitter content creation platform
-                        </p>
-                      </div>
-
-              <div style="padding: 30px; background: white; border: 1px solid #eee;
-                      border-radius: 0 0 8px 8px;">
-            <h2 style="color: #333;">Hi {user.username}! 👋</h2>
-            <p>
-              We're thrilled to have you join our community of content creators
-              who are transforming their Twitter presence with AI.
-            </p>
-            <div class="feature-box">
-                <h3>📧 Your Account Details</h3>
-                <p><strong>👤 Username:</strong> {user.username}</p>
-                <p><strong>📧 Email:</strong> {user.email}</p>
-                <p>Use either to log in anytime!</p>
-                </div>
-            <div style="background: #f8f9fa; padding: 15px; margin: 15px 0;
-                        border-radius: 6px; border-left: 4px solid #667eea;">
-              <h3 style="margin-top: 0; color: #333;">✨ Your Free Plan Includes:</h3>
-              <ul style="margin: 0; padding-left: 20px;">
-                <li>15 AI-generated tweets per day</li>
-                <li>Basic customization options</li>
-                <li>1-day tweet history</li>
-              </ul>
-            </div>
-
-            <p>Ready to create your first viral tweet?</p>
-            <p style="text-align: center;">
-              <a href="https://giverai.me/login"
-                 style="display: inline-block; background: #667eea;
-                        color: white; padding: 12px 24px;
-                        text-decoration: none; border-radius: 6px;">
-                Start Creating Tweets
-              </a>
-            </p>
-
-            <p>Happy tweeting!</p>
-            <p><strong>The GiverAI Team</strong></p>
-          </div>
-
-          <div style="text-align: center; margin-top: 20px; color: #666;
-                      font-size: 12px;">
-            <p>GiverAI - AI-Powered Twitter Content Creation</p>
-          </div>
-
-        </div>
-      </body>
-    </html>
-    """
-
-        return self.send_simple_email(
-            user.email,
-            "Welcome to GiverAI! Your Twitter Content Creation Journey Starts Now 🚀",
-            html_body,
-            bcc=[TRUSTPILOT_EMAIL] 
+        return await self.send_template_async(
+            "welcome", user.email, "Welcome to GiverAI! Your Twitter Content Creation Journey Starts Now 🚀",
+            bcc=[TRUSTPILOT_EMAIL],
+            user=user
         )
-        
+
     async def send_subscription_upgrade_email(self, user, old_plan, new_plan, amount, next_billing_date):
         """Send subscription upgrade notification."""
         plan_features = get_plan_features(new_plan)
@@ -760,21 +1459,21 @@ class EmailService:
 
         # Build feature list dynamically
         if plan_features["daily_limit"] == float("inf"):
-            feature_list.append("• Unlimited daily tweets")
+            feature_list.append("Unlimited daily tweets")
         else:
-            feature_list.append(f"• {plan_features['daily_limit']} tweets per day")
+            feature_list.append(f"{plan_features['daily_limit']} tweets per day")
 
         if plan_features["team_seats"] > 1:
-            feature_list.append(f"• {plan_features['team_seats']} team seats")
+            feature_list.append(f"{plan_features['team_seats']} team seats")
 
         if plan_features["export"]:
-            feature_list.append("• Export tweet history")
+            feature_list.append("Export tweet history")
 
         if plan_features["analytics"]:
-            feature_list.append("• Advanced analytics")
+            feature_list.append("Advanced analytics")
 
         if plan_features["api_access"]:
-            feature_list.append("• API access")
+            feature_list.append("API access")
 
         plan_descriptions = {
             "creator": "Perfect for individual creators and influencers",
@@ -783,65 +1482,17 @@ class EmailService:
             "enterprise": "Complete solution for large organizations",
         }
 
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0;">
-                <h1 style="margin: 0; color: white;">Subscription Upgraded! 🎉</h1>
-                <p style="margin: 10px 0 0 0; color: white;">Welcome to {new_plan.replace('_', ' ').title()}</p>
-              </div>
-
-              <div style="background: white; padding: 30px; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                <h2 style="color: #333;">Hi {user.username}!</h2>
-
-                <div style="background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 20px; margin: 20px 0; border-radius: 8px; text-align: center;">
-                  <h2 style="margin: 0; color: white;">🚀 Welcome to {new_plan.replace('_', ' ').title()}!</h2>
-                  <p style="margin: 10px 0 0 0; color: white;">{plan_descriptions.get(new_plan, '')}</p>
-                </div>
-
-                <h3>🎯 Your New Features:</h3>
-                <div style="background: #f8f9fa; padding: 20px; margin: 15px 0; border-radius: 6px;">
-                  {"<br>".join(feature_list)}
-                </div>
-
-                <h3>💳 Billing Details:</h3>
-                <div style="background: #e8f5e8; padding: 15px; margin: 15px 0; border-radius: 6px;">
-                  <p><strong>Previous Plan:</strong> {old_plan.replace('_', ' ').title()}</p>
-                  <p><strong>New Plan:</strong> {new_plan.replace('_', ' ').title()}</p>
-                  <p><strong>Amount:</strong> ${amount}/month</p>
-                  <p><strong>Next Billing Date:</strong> {next_billing_date.strftime('%Y-%m-%d') if next_billing_date else 'N/A'}</p>
-                </div>
-
-                <p>Your new features are active immediately! Start exploring them now.</p>
-
-                <p style="text-align: center;">
-                  <a href="https://giverai.me/dashboard" 
-                     style="display: inline-block; background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                    Explore New Features
-                  </a>
-                </p>
-
-                <p>Questions about your subscription? Visit your <a href="https://giverai.me/account">account settings</a> or contact support.</p>
-
-                <p>Thanks for upgrading and supporting GiverAI!</p>
-                <p><strong>The GiverAI Team</strong></p>
-              </div>
-
-              <div style="text-align: center; margin-top: 20px; color: #666; font-size: 12px;">
-                <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                <p>Manage your subscription: <a href="https://giverai.me/account">Account Settings</a></p>
-              </div>
-            </div>
-          </body>
-        </html>
-        """
-
-        return self.send_simple_email(
-            user.email,
-            f"Welcome to {new_plan.replace('_', ' ').title()}! Your GiverAI Upgrade is Active 🚀",
-            html_body,
-            bcc=[TRUSTPILOT_EMAIL] 
+        return await self.send_template_async(
+            "subscription_upgrade", user.email,
+            f"Welcome to {plan_display_name(new_plan)}! Your GiverAI Upgrade is Active 🚀",
+            bcc=[TRUSTPILOT_EMAIL],
+            user=user,
+            old_plan=old_plan,
+            new_plan=new_plan,
+            plan_description=plan_descriptions.get(new_plan, ''),
+            features=feature_list,
+            amount=amount,
+            next_billing_date=next_billing_date
         )
 
     def send_subscription_cancellation_email(self, user, original_plan, cancellation_date):
@@ -854,250 +1505,50 @@ class EmailService:
             "enterprise": "Enterprise",
         }
 
-        plan_name = plan_display_names.get(original_plan, original_plan.replace("_", " ").title())
+        plan_name = plan_display_names.get(original_plan, plan_display_name(original_plan))
         print(f"📧 Email using plan name: {plan_name} (from original_plan: {original_plan})")
 
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333; margin: 0; padding: 0;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              
-              <!-- Header Section -->
-              <div style="background: #dc3545; color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0;">
-                <h1 style="margin: 0; color: white;">Subscription Cancelled 😢</h1>
-                <p style="margin: 10px 0 0 0; color: white;">We're sorry to see you go</p>
-              </div>
-
-              <!-- Main Body -->
-              <div style="background: white; padding: 30px; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                <h2 style="color: #333;">Hi {user.username},</h2>
-
-                <div style="background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                  <p style="margin: 0;">
-                    <strong>⚠️ Your {plan_name} subscription has been cancelled</strong>
-                  </p>
-                </div>
-
-                <p>
-                  Your subscription will remain active until 
-                  <strong>{cancellation_date.strftime('%B %d, %Y') if cancellation_date else 'the end of your billing period'}</strong>.
-                  After that, your account will be downgraded to the free plan.
-                </p>
-
-                <h3>What happens next?</h3>
-                <ul>
-                  <li>✅ Continue using all premium features until 
-                       {cancellation_date.strftime('%B %d, %Y') if cancellation_date else 'your period ends'}</li>
-                  <li>📅 No more charges after your current period ends</li>
-                  <li>🔄 Automatic downgrade to free plan on 
-                       {cancellation_date.strftime('%B %d, %Y') if cancellation_date else 'your end date'}</li>
-                </ul>
-
-                <h3>Changed your mind?</h3>
-                <p>
-                  You can reactivate your subscription anytime before 
-                  {cancellation_date.strftime('%B %d, %Y') if cancellation_date else 'your period ends'}.
-                </p>
-
-                <p style="text-align: center;">
-                  <a href="https://giverai.me/account" 
-                     style="display: inline-block; background: #28a745; color: white; 
-                            padding: 12px 24px; text-decoration: none; border-radius: 6px;">
-                    Reactivate Subscription
-                  </a>
-                </p>
-
-                <p>Thanks for being part of GiverAI. We hope to see you again!</p>
-                <p><strong>The GiverAI Team</strong></p>
-              </div>
-            </div>
-          </body>
-        </html>
-        """
-
-        return self.send_simple_email(
-            user.email,
-            f"Your {plan_name} Subscription Has Been Cancelled",
-            html_body,
+        return self.send_template(
+            "subscription_cancellation", user.email, f"Your {plan_name} Subscription Has Been Cancelled",
+            user=user,
+            plan_name=plan_name,
+            cancellation_date=cancellation_date
         )
     
     def send_subscription_downgrade_email(self, user, old_plan):
         """Send notification when user is downgraded to free plan"""
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333; margin: 0; padding: 0;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <div style="background: #6c757d; color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0;">
-                <h1 style="margin: 0; color: white;">Plan Downgraded ⬇️</h1>
-                <p style="margin: 10px 0 0 0; color: white;">You're now on the Free Plan</p>
-                  </div>
-
-          <div style="background: white; padding: 30px; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-            <h2 style="color: #333;">Hi {user.username},</h2>
-
-            <div style="background: #d1ecf1; border: 1px solid #bee5eb; padding: 15px; margin: 20px 0; border-radius: 6px;">
-              <p style="margin: 0;"><strong>ℹ️ Your subscription period has ended</strong></p>
-              <p>Your {old_plan.replace('_', ' ').title()} plan has expired and you've been moved to our Free Plan.</p>
-            </div>
-
-            <h3>🎯 Your Current Free Plan Features:</h3>
-            <div style="background: #f8f9fa; padding: 20px; margin: 15px 0; border-radius: 6px;">
-              <p>• 15 AI-generated tweets per day</p>
-              <p>• Basic customization options</p>
-              <p>• 1-day tweet history</p>
-              <p>• Community support</p>
-            </div>
-
-            <h3>💡 Want More?</h3>
-            <p>Upgrade anytime to get back your premium features:</p>
-            <div style="background: #fff3cd; padding: 15px; margin: 15px 0; border-radius: 6px;">
-              <p><strong>Creator Plan:</strong> Unlimited tweets, 60-day history, advanced customization</p>
-              <p><strong>Small Team:</strong> Team collaboration + all Creator features</p>
-              <p><strong>Agency:</strong> Advanced analytics + white label options</p>
-            </div>
-
-            <div style="text-align: center; margin: 30px 0;">
-              <a href="https://giverai.me/pricing" 
-                 style="display: inline-block; background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                View Pricing Plans
-              </a>
-            </div>
-
-            <p><strong>Good News:</strong> All your tweet history and account data are safe and will be restored when you upgrade!</p>
-
-            <p>Questions? We're here to help at support@giverai.me</p>
-
-            <p>Thanks for being part of GiverAI!</p>
-            <p><strong>The GiverAI Team</strong></p>
-          </div>
-
-          <div style="text-align: center; margin-top: 20px; color: #666; font-size: 12px;">
-            <p>GiverAI - AI-Powered Twitter Content Creation</p>
-          </div>
-        </div>
-      </body>
-    </html>
-        """
-        return self.send_simple_email(
-            user.email,
-            "Your GiverAI Plan Has Changed to Free Plan",
-            html_body
+        return self.send_template(
+            "subscription_downgrade", user.email, "Your GiverAI Plan Has Changed to Free Plan",
+            user=user,
+            old_plan=old_plan
         )
 
     def send_username_reminder_email(self, user):
         """Send username reminder email"""
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h1 style="color: #667eea;">Username Reminder</h1>
-              <p>Hi there!</p>
-              <p>You requested a reminder of your GiverAI username. Here it is:</p>
-              <div style="background: #e3f2fd; padding: 20px; margin: 20px 0; text-align: center; border-radius: 8px;">
-                <h2 style="color: #667eea; margin: 10px 0;">{user.username}</h2>
-              </div>
-              <p>
-            <a href="https://giverai.me/login"
-               style="background: #667eea; color: white; padding: 12px 24px;
-                      text-decoration: none; border-radius: 4px;
-                      display: inline-block;">
-              Log In to GiverAI
-            </a>
-          </p>
-          <p>Plan: {user.plan.replace('_', ' ').title()}</p>
-          <p>Member since: {user.created_at.strftime('%B %d, %Y')}</p>
-          <p>If you also forgot your password, you can <a href="https://giverai.me/forgot-password">reset it here</a>.</p>
-          <p>Best regards,<br>The GiverAI Team</p>
-        </div>
-      </body>
-    </html>
-        """
-
-        return self.send_simple_email(
-            user.email,
-            "Your GiverAI Username Reminder 👤",
-            html_body
+        return self.send_template(
+            "username_reminder", user.email, "Your GiverAI Username Reminder 👤",
+            user=user
         )
 
     def send_password_reset_success_email(self, user, ip_address="Unknown"):
         """Send password reset success confirmation"""
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <h1 style="color: #28a745;">Password Changed Successfully!</h1>
-              <p>Hi {user.username}!</p>
-              <p>Your GiverAI password has been successfully changed.</p>
-              <div style="background: #d4edda; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                <p><strong>When:</strong> {datetime.utcnow().strftime('%B %d, %Y at %I:%M %p UTC')}</p>
-                <p><strong>IP Address:</strong> {ip_address}</p>
-            </div>
-              <p>If you didn't change your password, please contact our support team immediately.</p>
-              <p>Best regards,<br>The GiverAI Security Team</p>
-            </div>
-          </body>
-        </html>
-        """
-
-        return self.send_simple_email(
-            user.email,
-            "Your GiverAI Password Has Been Changed ✅",
-            html_body
+        return self.send_template(
+            "password_reset_success", user.email, "Your GiverAI Password Has Been Changed ✅",
+            user=user,
+            ip_address=ip_address,
+            changed_at=datetime.utcnow().strftime('%B %d, %Y at %I:%M %p UTC')
         )
 
     def send_account_changed_email(self, user, change_details, ip_address="Unknown"):
         """Send account security alert"""
-        html_body = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; color: #333; margin: 0; padding: 0;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="background: #dc3545; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                    <h1 style="margin: 0; color: white;">Account Security Alert 🔒</h1>
-                    <p style="margin: 10px 0 0 0; color: white;">Important changes to your GiverAI account</p>
-                </div>
-
-                <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                    <h2 style="color: #333;">Hi {user.username},</h2>
-
-                    <div style="background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                        <p style="margin: 0;"><strong>⚠️ Your account information was recently updated</strong></p>
-                    </div>
-
-                    <div style="background: #f8f9fa; padding: 15px; margin: 15px 0; border-radius: 6px;">
-                        <h3 style="margin-top: 0; color: #333;">What Changed:</h3>
-                        <p style="margin: 5px 0;">{change_details}</p>
-                        <p style="margin: 5px 0;"><strong>When:</strong> {datetime.now().strftime("%B %d, %Y at %I:%M %p UTC")}</p>
-                        <p style="margin: 5px 0;"><strong>IP Address:</strong> {ip_address}</p>
-                    </div>
-
-                    <h3>Was this you?</h3>
-                <p>If you made this change, no action is needed. Your account is secure.</p>
-
-                    <div style="background: #f8d7da; border: 1px solid #f5c6cb; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                    <p style="margin: 0;"><strong>🚨 If you didn't authorize this change:</strong></p>
-                    <ol style="margin: 10px 0; padding-left: 20px;">
-                        <li>Contact our support team immediately at support@giverai.me</li>
-                        <li>Change your password as soon as possible</li>
-                        <li>Review your account for any other unauthorized changes</li>
-                    </ol>
-                </div>
-
-                <p>Your account security is our priority. If you have any concerns, please don't hesitate to contact us.</p>
-
-                <p>Best regards,<br><strong>The GiverAI Security Team</strong></p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-
-        return self.send_simple_email(
-            user.email,
-            "Important Changes to Your GiverAI Account",
-            html_body
+        return self.send_template(
+            "account_changed", user.email, "Important Changes to Your GiverAI Account",
+            user=user,
+            change_details=change_details,
+            ip_address=ip_address,
+            changed_at=datetime.now().strftime("%B %d, %Y at %I:%M %p UTC")
         )
 
-
     def send_contact_form_notification(self, name: str, email: str, subject_category: str, message: str, user_info: str = None):
         """Send contact form submission to support email"""
 
@@ -1117,72 +1568,17 @@ class EmailService:
             raise ValueError("Please select a valid topic")
 
         subject_label = subject_labels.get(subject_category, subject_category)
-        formatted_message = message.replace('\n', '<br>')
-    
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto;">
-            <div style="background: #667eea; color: white; padding: 20px; text-align: center;">
-                <h1 style="margin: 0; color: white;">New Contact Form Submission 📧</h1>
-                <p style="margin: 10px 0 0 0; color: white;">From your GiverAI website</p>
-            </div>
-    
-            <div style="padding: 30px; background: white; border: 1px solid #eee;">
-                <h2 style="color: #333; border-bottom: 2px solid #667eea; padding-bottom: 10px;">Contact Details</h2>
-    
-                <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                    <tr style="background: #f8f9fa;">
-                        <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold; width: 30%;">Name:</td>
-                        <td style="padding: 12px; border: 1px solid #dee2e6;">{name}</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Email:</td>
-                        <td style="padding: 12px; border: 1px solid #dee2e6;">
-                            <a href="mailto:{email}" style="color: #667eea;">{email}</a>
-                        </td>
-                    </tr>
-                    <tr style="background: #f8f9fa;">
-                        <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Category:</td>
-                        <td style="padding: 12px; border: 1px solid #dee2e6;">
-                            <span style="background: #667eea; color: white; padding: 4px 12px; border-radius: 15px; font-size: 12px;">
-                                {subject_label}
-                            </span>
-                        </td>
-                    </tr>
-                    {f'''<tr>
-                        <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Account Info:</td>
-                        <td style="padding: 12px; border: 1px solid #dee2e6; font-size: 14px; color: #666;">{user_info}</td>
-                    </tr>''' if user_info else ''}
-                    <tr style="background: #f8f9fa;">
-                        <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Timestamp:</td>
-                        <td style="padding: 12px; border: 1px solid #dee2e6;">{datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")}</td>
-                    </tr>
-                </table>
-    
-                <h3 style="color: #333; margin-top: 30px;">Message:</h3>
-                <div style="background: #f8f9fa; padding: 20px; border-left: 4px solid #667eea; border-radius: 4px; line-height: 1.6;">
-                    {formatted_message}
-                </div>
-    
-                <div style="margin-top: 30px; padding: 20px; background: #e3f2fd; border-radius: 8px;">
-                    <p style="margin: 0; color: #1976d2;">
-                        <strong>💡 Quick Reply:</strong> Simply reply to this email to respond directly to {name} at {email}
-                    </p>
-                </div>
-            </div>
-    
-            <div style="background: #f8f9fa; padding: 20px; text-align: center; color: #666; font-size: 14px;">
-                <p>This message was sent via the GiverAI contact form</p>
-            </div>
-        </body>
-        </html>
-        """
     
-        return self.send_simple_email(
-            "support@giverai.me",
-            f"[GiverAI Contact] {subject_label} - {name}",
-            html_body
+        return self.send_template(
+            "contact_form_notification", "support@giverai.me", f"[GiverAI Contact] {subject_label} - {name}",
+            name=name,
+            email=email,
+            subject_label=subject_label,
+            message=message,
+            user_info=user_info,
+            received_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
         )
+
     def send_contact_confirmation_email(self, name: str, email: str, subject_category: str):
         """Send confirmation email to user who submitted contact form"""
     
@@ -1200,517 +1596,97 @@ class EmailService:
         
         subject_label = subject_labels.get(subject_category, subject_category)
         
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <div style="background: #28a745; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                <h1 style="margin: 0; color: white;">Message Received! ✅</h1>
-                <p style="margin: 10px 0 0 0; color: white;">We'll get back to you soon</p>
-              </div>
-              
-              <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                <h2 style="color: #333;">Hi {name}!</h2>
-                
-                <p>Thanks for reaching out to GiverAI! We've received your message about <strong>{subject_label}</strong> and we'll respond as soon as possible.</p>
-                
-                <div style="background: #e3f2fd; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                  <p style="margin: 0;"><strong>📧 What's next?</strong></p>
-                  <ul style="margin: 10px 0; padding-left: 20px;">
-                    <li>We typically respond within 24 hours</li>
-                    <li>Priority support users get faster responses</li>
-                    <li>You'll receive our reply at {email}</li>
-                  </ul>
-                </div>
-                
-                <p>In the meantime, you might find answers in our <a href="https://giverai.me/faq" style="color: #667eea;">FAQ section</a> or feel free to continue using GiverAI!</p>
-                
-                <p style="text-align: center; margin: 30px 0;">
-                  <a href="https://giverai.me/dashboard" 
-                     style="display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px;">
-                    Back to GiverAI
-                  </a>
-                </p>
-                
-                <p>Thanks for being part of GiverAI!</p>
-                <p><strong>The GiverAI Support Team</strong></p>
-              </div>
-            </div>
-          </body>
-        </html>
-        """
-        
-        return self.send_simple_email(
-            email,
-            "We received your message - GiverAI Support",
-            html_body
+        return self.send_template(
+            "contact_confirmation", email, "We received your message - GiverAI Support",
+            name=name,
+            email=email,
+            subject_label=subject_label
         )
 
-
     def send_contact_form_confirmation(self, name: str, email: str, subject_category: str):
         """Send confirmation email to user who submitted contact form"""
-
-        subject_labels = {
-            "general_support": "General Support",
-            "technical_issue": "Technical Issue",
-            "billing_question": "Billing Question", 
-            "feature_request": "Feature Request",
-            "account_help": "Account Help",
-            "bug_report": "Bug Report",
-            "feedback": "Feedback",
-            "other": "Other"
-        }
-    
-        subject_label = subject_labels.get(subject_category, subject_category)
-    
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="background: #28a745; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                    <h1 style="margin: 0; color: white;">Message Received! ✅</h1>
-                    <p style="margin: 10px 0 0 0; color: white;">We'll get back to you soon</p>
-                </div>
-    
-                <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                    <h2 style="color: #333;">Hi {name}!</h2>
-    
-                    <p>Thanks for reaching out to GiverAI! We've received your message about <strong>{subject_label}</strong> and we'll respond as soon as possible.</p>
-    
-                    <div style="background: #e3f2fd; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                        <p style="margin: 0;"><strong>📧 What's next?</strong></p>
-                        <ul style="margin: 10px 0; padding-left: 20px;">
-                            <li>We typically respond within 24 hours</li>
-                            <li>Priority support users get faster responses</li>
-                            <li>You'll receive our reply at {email}</li>
-                        </ul>
-                    </div>
-    
-                    <p>In the meantime, you might find answers in our <a href="https://giverai.me/faq" style="color: #667eea;">FAQ section</a> or feel free to continue using GiverAI!</p>
-    
-                    <p style="text-align: center; margin: 30px 0;">
-                        <a href="https://giverai.me/dashboard" 
-                           style="display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px;">
-                            Back to GiverAI
-                        </a>
-                    </p>
-    
-                    <p>Thanks for being part of GiverAI!</p>
-                    <p><strong>The GiverAI Support Team</strong></p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    
-        return self.send_simple_email(
-            email,
-            "We received your message - GiverAI Support",
-            html_body
-        )
+        return self.send_contact_confirmation_email(name, email, subject_category)
 
     def send_email_change_verification(self, user, new_email, verification_token, ip_address="Unknown"):
         """Send email verification for email change to the new email address"""
-        verification_url = f"https://giverai.me/verify-email-change?token={verification_token}"
-
-        html_body = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-              <div style="background: #667eea; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                <h1 style="margin: 0; color: white;">Verify Your New Email Address</h1>
-                <p style="margin: 10px 0 0 0; color: white;">Complete your email change request</p>
-              </div>
-    
-              <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                <h2 style="color: #333;">Hi {user.username}!</h2>
-    
-                <div style="background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                  <p style="margin: 0;"><strong>📧 You requested to change your email address</strong></p>
-                </div>
-    
-                <p>To complete the email change process, please verify this new email address by clicking the button below:</p>
-    
-                <div style="background: #f8f9fa; padding: 15px; margin: 15px 0; border-radius: 6px;">
-                  <p style="margin: 5px 0;"><strong>New Email:</strong> {new_email}</p>
-                  <p style="margin: 5px 0;"><strong>Request Time:</strong> {datetime.now().strftime("%B %d, %Y at %I:%M %p UTC")}</p>
-                  <p style="margin: 5px 0;"><strong>IP Address:</strong> {ip_address}</p>
-                </div>
-    
-                <p style="text-align: center;">
-                  <a href="{verification_url}"
-                     style="display: inline-block; background: #28a745; color: white; 
-                            padding: 15px 30px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                    Verify New Email Address
-                  </a>
-                </p>
-    
-                <p><strong>Important:</strong> This verification link expires in 1 hour.</p>
-    
-                <div style="background: #f8d7da; border: 1px solid #f5c6cb; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                  <p style="margin: 0;"><strong>🚨 If you didn't request this change:</strong></p>
-                  <p>Someone may be trying to access your account. Please contact our support team immediately at support@giverai.me</p>
-                </div>
-    
-                <p>After verification, all future notifications will be sent to this email address.</p>
-    
-                <p>Best regards,<br><strong>The GiverAI Team</strong></p>
-              </div>
-    
-              <div style="text-align: center; margin-top: 20px; color: #666; font-size: 12px;">
-                <p>This verification was sent to: {new_email}</p>
-              </div>
-            </div>
-          </body>
-        </html>
-        """
-    
-        return self.send_simple_email(
-            new_email,
-            "Verify Your New Email Address - GiverAI",
-            html_body
+        return self.send_template(
+            "email_change_verification", new_email, "Verify Your New Email Address - GiverAI",
+            user=user,
+            new_email=new_email,
+            verification_url=f"https://giverai.me/verify-email-change?token={verification_token}",
+            ip_address=ip_address,
+            requested_at=datetime.now().strftime("%B %d, %Y at %I:%M %p UTC")
         )
     
     def send_email_changed_notification(self, user, old_email, ip_address="Unknown"):
         """Send notification to old email address when email is changed"""
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; margin: 0; padding: 0;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="background: #dc3545; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                    <h1 style="margin: 0; color: white;">Email Address Changed 🔒</h1>
-                    <p style="margin: 10px 0 0 0; color: white;">Your GiverAI account email was updated</p>
-                </div>
-    
-                <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                    <h2 style="color: #333;">Hi {user.username},</h2>
-    
-                    <div style="background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                        <p style="margin: 0;"><strong>⚠️ Your account email address was recently changed</strong></p>
-                    </div>
-    
-                    <div style="background: #f8f9fa; padding: 15px; margin: 15px 0; border-radius: 6px;">
-                        <h3 style="margin-top: 0; color: #333;">Change Details:</h3>
-                        <p style="margin: 5px 0;"><strong>From:</strong> {old_email}</p>
-                        <p style="margin: 5px 0;"><strong>To:</strong> {user.email}</p>
-                        <p style="margin: 5px 0;"><strong>When:</strong> {datetime.now().strftime("%B %d, %Y at %I:%M %p UTC")}</p>
-                        <p style="margin: 5px 0;"><strong>IP Address:</strong> {ip_address}</p>
-                    </div>
-    
-                    <h3>Was this you?</h3>
-                    <p>If you made this change, no action is needed. Future notifications will be sent to your new email address.</p>
-    
-                    <div style="background: #f8d7da; border: 1px solid #f5c6cb; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                        <p style="margin: 0;"><strong>🚨 If you didn't authorize this change:</strong></p>
-                        <ol style="margin: 10px 0; padding-left: 20px;">
-                            <li>Contact our support team immediately at support@giverai.me</li>
-                            <li>Change your password as soon as possible</li>
-                            <li>Review your account for any other unauthorized changes</li>
-                        </ol>
-                    </div>
-    
-                    <p>Your account security is our priority. If you have any concerns, please don't hesitate to contact us.</p>
-    
-                    <p>Best regards,<br><strong>The GiverAI Security Team</strong></p>
-                </div>
-    
-                <div style="text-align: center; margin-top: 20px; color: #666; font-size: 12px;">
-                    <p>This notification was sent to your previous email address: {old_email}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    
-        return self.send_simple_email(
-            old_email,
-            "Your GiverAI Email Address Was Changed 📧",
-            html_body
+        return self.send_template(
+            "email_changed_notification", old_email, "Your GiverAI Email Address Was Changed 📧",
+            user=user,
+            old_email=old_email,
+            ip_address=ip_address,
+            changed_at=datetime.now().strftime("%B %d, %Y at %I:%M %p UTC")
         )
-    def send_goodbye_email(self, user, total_tweets, days_active, plan):
-
-        plan_display_names = {
-        "creator": "Creator",
-        "small_team": "Small Team", 
-        "agency": "Agency",
-        "enterprise": "Enterprise",
-        "free": "Free",
-        "canceling": "Free"  
-    }
 
-        plan_name = plan_display_names.get(plan, plan.replace("_", " ").title())
-    
+    def send_goodbye_email(self, user, total_tweets, days_active, plan):
         """Send account deletion confirmation"""
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333; margin: 0; padding: 0;">
-        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="background: #f5576c; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                <h1 style="margin: 0; color: white;">Account Deleted 😢</h1>
-                <p style="margin: 10px 0 0 0; color: white;">We're sorry to see you go, {user.username}</p>
-            </div>
-
-            <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                <h2 style="color: #333;">Your GiverAI account has been successfully deleted</h2>
-
-                <div style="background: #fff3cd; padding: 15px; margin: 20px 0; border-radius: 6px; border: 1px solid #ffeaa7;">
-                    <h3 style="margin-top: 0; color: #333;">🗂️ Data Removal</h3>
-                    <p>As requested, we have permanently deleted:</p>
-                    <ul style="margin: 0; padding-left: 20px;">
-                        <li>Your account profile and settings</li>
-                        <li>All generated tweets and content history</li>
-                        <li>Usage data and analytics</li>
-                        <li>Team memberships and collaborations</li>
-                        <li>Billing and subscription information</li>
-                    </ul>
-                    <p><strong>This action cannot be undone.</strong></p>
-                </div>
-
-                <h3>Thank You for Using GiverAI</h3>
-                <p>We appreciate the time you spent with us. During your journey, you:</p>
-                <ul style="padding-left: 20px;">
-                    <li>📝 Generated {total_tweets} tweets</li>
-                    <li>📅 Were with us for {days_active} days</li>
-                    <li>🎯 Used the {plan_name} plan</li>
-                </ul>
-
-                <h3>Changed Your Mind?</h3>
-                <p>You're always welcome back! If you decide to return, you can create a new account anytime, though your previous data cannot be restored.</p>
-
-                <p style="text-align: center;">
-                    <a href="https://giverai.me/register" 
-                       style="display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px;">
-                        Return to GiverAI
-                    </a>
-                </p>
-
-                <p>We hope our paths cross again in the future. Until then, we wish you all the best with your content creation journey!</p>
-
-                <p>Farewell and best wishes,</p>
-                <p><strong>The GiverAI Team</strong></p>
-            </div>
-
-            <div style="text-align: center; margin-top: 20px; color: #666; font-size: 12px;">
-                <p>This confirmation was sent to {user.email}</p>
-                <p>You will not receive any further emails from us.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
+        plan_display_names = {
+            "creator": "Creator",
+            "small_team": "Small Team", 
+            "agency": "Agency",
+            "enterprise": "Enterprise",
+            "free": "Free",
+            "canceling": "Free"  
+        }
 
-        return self.send_simple_email(
-            user.email,
-            "We're Sorry to See You Go - Your GiverAI Account Has Been Deleted 👋",
-            html_body
+        return self.send_template(
+            "goodbye", user.email, "We're Sorry to See You Go - Your GiverAI Account Has Been Deleted 👋",
+            user=user,
+            total_tweets=total_tweets,
+            days_active=days_active,
+            plan_name=plan_display_names.get(plan, plan_display_name(plan))
         )
-    
-async def send_suspension_appeal_notification(self, user, appeal):
+
+    async def send_suspension_appeal_notification(self, user, appeal):
         """Send suspension appeal notification to admin"""
         appeal_types = {
-        "wrongful_suspension": "Account Wrongfully Suspended",
-        "policy_misunderstanding": "Policy Misunderstanding", 
-        "technical_error": "Technical Error",
-        "account_compromise": "Account Was Compromised",
-        "content_misidentified": "Content Misidentified",
-        "first_time_offense": "First Time Offense - Request Leniency",
-        "other": "Other"
-    }
-    
+            "wrongful_suspension": "Account Wrongfully Suspended",
+            "policy_misunderstanding": "Policy Misunderstanding", 
+            "technical_error": "Technical Error",
+            "account_compromise": "Account Was Compromised",
+            "content_misidentified": "Content Misidentified",
+            "first_time_offense": "First Time Offense - Request Leniency",
+            "other": "Other"
+        }
         appeal_type_display = appeal_types.get(appeal.appeal_type, appeal.appeal_type)
-    
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-            <div style="background: #dc3545; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                <h1 style="margin: 0; color: white;">Suspension Appeal Submitted 📋</h1>
-                <p style="margin: 10px 0 0 0; color: white;">Requires Admin Review</p>
-            </div>
-            
-            <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                <h2>Appeal Details</h2>
-                
-                <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                <tr style="background: #f8f9fa;">
-                    <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">User:</td>
-                    <td style="padding: 12px; border: 1px solid #dee2e6;">{user.username} ({user.email})</td>
-                </tr>
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Appeal Type:</td>
-                    <td style="padding: 12px; border: 1px solid #dee2e6;">{appeal_type_display}</td>
-                </tr>
-                <tr style="background: #f8f9fa;">
-                    <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Suspended Date:</td>
-                    <td style="padding: 12px; border: 1px solid #dee2e6;">
-                    {user.suspended_at.strftime('%Y-%m-%d %H:%M UTC') if user.suspended_at else 'Unknown'}
-                    </td>
-                </tr>
-                <tr>
-                    <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Suspension Reason:</td>
-                    <td style="padding: 12px; border: 1px solid #dee2e6;">{user.suspension_reason}</td>
-                </tr>
-                <tr style="background: #f8f9fa;">
-                    <td style="padding: 12px; border: 1px solid #dee2e6; font-weight: bold;">Plan:</td>
-                    <td style="padding: 12px; border: 1px solid #dee2e6;">{user.plan.replace('_', ' ').title()}</td>
-                </tr>
-                </table>
-                
-                <h3>Appeal Message:</h3>
-                <div style="background: #f8f9fa; padding: 20px; border-left: 4px solid #dc3545; border-radius: 4px;">
-                {appeal.appeal_message.replace(chr(10), '<br>')}
-                </div>
-                
-                <p style="text-align: center; margin: 30px 0;">
-                <a href="https://giverai.me/admin/appeals" 
-                    style="display: inline-block; background: #dc3545; color: white; padding: 15px 30px; text-decoration: none; border-radius: 6px;">
-                    Review Appeal
-                </a>
-                </p>
-            </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        return self.send_simple_email(
-            "support@giverai.me",
+
+        return await self.send_template_async(
+            "suspension_appeal_notification", "support@giverai.me",
             f"[URGENT] Suspension Appeal from {user.username} - {appeal_type_display}",
-            html_body
+            user=user,
+            appeal=appeal,
+            appeal_type_display=appeal_type_display
         )
-    
-async def send_appeal_confirmation_email(self, user, appeal_type):
-        """Send confirmation email to user who submitted appeal"""
-        
-        appeal_type_labels = {
-            "wrongful_suspension": "Wrongful Suspension",
-            "policy_misunderstanding": "Policy Misunderstanding", 
-            "technical_error": "Technical Error",
-            "account_compromise": "Account Compromised",
+
+    async def send_appeal_confirmation_email(self, user, appeal):
+        """Send appeal confirmation to user"""
+        appeal_types = {
+            "wrongful_suspension": "Account Wrongfully Suspended",
+            "policy_misunderstanding": "Policy Misunderstanding",
+            "technical_error": "Technical Error", 
+            "account_compromise": "Account Was Compromised",
             "content_misidentified": "Content Misidentified",
-            "first_time_offense": "First Time Offense",
+            "first_time_offense": "First Time Offense - Request Leniency",
             "other": "Other"
         }
-        
-        appeal_label = appeal_type_labels.get(appeal_type, appeal_type)
-        
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <div style="background: #28a745; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-                    <h1 style="margin: 0; color: white;">Appeal Received ✅</h1>
-                    <p style="margin: 10px 0 0 0; color: white;">We're reviewing your suspension appeal</p>
-                </div>
-    
-                <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-                    <h2 style="color: #333;">Hi {user.username}!</h2>
-    
-                    <p>Thank you for submitting your suspension appeal. We've received your request to review the suspension of your GiverAI account.</p>
-    
-                    <div style="background: #e3f2fd; padding: 15px; margin: 20px 0; border-radius: 6px;">
-                        <p style="margin: 0;"><strong>📋 Appeal Details:</strong></p>
-                        <ul style="margin: 10px 0; padding-left: 20px;">
-                            <li><strong>Type:</strong> {appeal_label}</li>
-                            <li><strong>Submitted:</strong> {datetime.now().strftime("%B %d, %Y at %I:%M %p UTC")}</li>
-                            <li>
-                                <strong>Status:</strong> Under Review
-                            </li>
-                        </ul>
-                    </div>
-
-                    <p>
-                        Our team will carefully review your appeal and may reach out if we need more information.<br>
-                        You'll receive a follow-up email within <strong>24-48 hours</strong> with our decision.
-                    </p>
-
-                    <p>If you have further questions, reply to this email or contact <a href="mailto:support@giverai.me">support@giverai.me</a>.</p>
-                    
-                    <div style="background: #fff3cd; padding: 15px; border-radius: 6px; margin-top: 20px;">
-                        <p style="margin: 0;">
-                            <strong>Need urgent assistance?</strong> Please reply with any additional context or requests for expedited review.
-                        </p>
-                    </div>
-
-                    <p style="margin-top: 30px; color: #888; font-size: 13px;">
-                        This confirmation was automatically generated by GiverAI Suspension Appeals.<br>
-                        Reference ID: <strong>{user.id}</strong>
-                    </p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        appeal_type_display = appeal_types.get(appeal.appeal_type, appeal.appeal_type)
 
-        return self.send_simple_email(
-            user.email,
-            "✅ GiverAI Suspension Appeal Received",
-            html_body
+        return await self.send_template_async(
+            "appeal_confirmation", user.email, f"Appeal Submitted - Reference #{appeal.id} | GiverAI",
+            user=user,
+            appeal=appeal,
+            appeal_type_display=appeal_type_display
         )
-    
-def send_appeal_confirmation_email(self, user, appeal):
-    """Send appeal confirmation to user"""
-    appeal_types = {
-        "wrongful_suspension": "Account Wrongfully Suspended",
-        "policy_misunderstanding": "Policy Misunderstanding",
-        "technical_error": "Technical Error", 
-        "account_compromise": "Account Was Compromised",
-        "content_misidentified": "Content Misidentified",
-        "first_time_offense": "First Time Offense - Request Leniency",
-        "other": "Other"
-    }
-    
-    appeal_type_display = appeal_types.get(appeal.appeal_type, appeal.appeal_type)
-    
-    html_body = f"""
-    <html>
-      <body style="font-family: Arial, sans-serif; color: #333;">
-        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-          <div style="background: #28a745; color: white; padding: 30px; text-align: center; border-radius: 8px;">
-            <h1 style="margin: 0; color: white;">Appeal Submitted Successfully ✅</h1>
-            <p style="margin: 10px 0 0 0; color: white;">We've received your suspension appeal</p>
-          </div>
-          
-          <div style="padding: 30px; background: white; border: 1px solid #eee; border-radius: 0 0 8px 8px;">
-            <h2>Hi {user.username},</h2>
-            
-            <p>Thank you for submitting your suspension appeal. We've received your request and our team will review it carefully.</p>
-            
-            <div style="background: #e3f2fd; padding: 15px; margin: 20px 0; border-radius: 6px;">
-              <h3 style="margin-top: 0;">Your Appeal Details:</h3>
-              <p><strong>Appeal Type:</strong> {appeal_type_display}</p>
-              <p><strong>Submitted:</strong> {appeal.created_at.strftime('%B %d, %Y at %I:%M %p UTC')}</p>
-              <p><strong>Reference ID:</strong> #{appeal.id}</p>
-            </div>
-            
-            <h3>What happens next?</h3>
-            <ul>
-              <li>📋 Our team will review your appeal within 24-48 hours</li>
-              <li>🔍 We'll investigate the circumstances of your suspension</li>
-              <li>📧 You'll receive an email with our decision</li>
-              <li>✅ If approved, your account will be restored immediately</li>
-            </ul>
-            
-            <div style="background: #fff3cd; padding: 15px; margin: 20px 0; border-radius: 6px;">
-              <p style="margin: 0;"><strong>⏰ Average Review Time:</strong> 24-48 hours</p>
-              <p>Complex cases may require additional investigation time.</p>
-            </div>
-            
-            <p>Please don't submit additional appeals as this may delay the review process.</p>
-            
-            <p>Thank you for your patience,</p>
-            <p><strong>The GiverAI Appeals Team</strong></p>
-          </div>
-        </div>
-      </body>
-    </html>
-    """
-    
-    return self.send_simple_email(
-        user.email,
-        f"Appeal Submitted - Reference #{appeal.id} | GiverAI",
-        html_body
-    )
 
 # Initialize email service
 email_service = EmailService()
@@ -1723,79 +1699,769 @@ class ScheduledEmail(Base):
     scheduled_for = Column(DateTime)
     sent = Column(Boolean, default=False)
     sent_at = Column(DateTime, nullable=True)
+    locked_until = Column(DateTime, nullable=True)  # lease held by a dispatcher working on the row
     created_at = Column(DateTime, default=datetime.utcnow)
     user = relationship("User")
+    __table_args__ = (
+        Index("ix_scheduled_emails_due", "scheduled_for", postgresql_where=text("sent = false")),
+    )
     
-async def send_scheduled_emails():
-    """Background task to send scheduled emails"""
-    while True:
-        try:
+class EmailOutbox(Base):
+    """Rendered emails waiting to be sent. Rows are added in the same
+    transaction as the change that triggers them, so a rolled back request
+    never emails anyone and a committed one always does."""
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True)
+    email_type = Column(String, nullable=False)  # EmailService method without send_/_email, e.g. 'password_reset'
+    to_email = Column(String, nullable=False)
+    bcc = Column(Text, nullable=True)  # JSON list
+    subject = Column(String, nullable=False)
+    html_body = Column(Text, nullable=True)
+    text_body = Column(Text, nullable=True)
+    priority = Column(Integer, nullable=False, default=5)  # lower sends first
+    status = Column(String, nullable=False, default="pending")  # 'pending', 'sending', 'sent', 'dead', 'suppressed'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_email_outbox_due", "priority", "next_attempt_at", "id",
+              postgresql_where=text("status = 'pending'")),
+        Index("ix_email_outbox_leases", "locked_until", postgresql_where=text("status = 'sending'")),
+        Index("ix_email_outbox_status_created", "status", "created_at"),
+    )
+
+class EmailSuppression(Base):
+    """Addresses we must not email: hard bounces and spam complaints reported
+    by the mail provider, or added by hand"""
+    __tablename__ = "email_suppressions"
+    email = Column(String, primary_key=True)  # lowercased
+    reason = Column(String, nullable=False)  # 'hard_bounce', 'complaint' or 'manual'
+    source = Column(String, nullable=True)  # 'smtp', 'webhook', an admin's email...
+    detail = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+# Security and account emails go out ahead of lifecycle and marketing mail
+EMAIL_PRIORITIES = {
+    "password_reset": 0,
+    "account_locked": 0,
+    "verification": 0,
+    "username_reminder": 0,
+    "account_recovery": 0,
+    "suspension": 1,
+    "subscription_cancellation": 1,
+    "subscription_downgrade": 1,
+    "subscription_upgrade": 1,
+    "welcome": 3,
+}
+EMAIL_DEFAULT_PRIORITY = 5
+
+EMAIL_OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", 4))
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 20))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", 10))
+EMAIL_OUTBOX_LEASE_SECONDS = int(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", 120))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 6))
+EMAIL_OUTBOX_BACKOFF_SECONDS = int(os.getenv("EMAIL_OUTBOX_BACKOFF_SECONDS", 30))
+EMAIL_OUTBOX_BACKOFF_MAX_SECONDS = int(os.getenv("EMAIL_OUTBOX_BACKOFF_MAX_SECONDS", 3600))
+EMAIL_OUTBOX_KEEP_SENT_DAYS = int(os.getenv("EMAIL_OUTBOX_KEEP_SENT_DAYS", 7))
+
+EMAIL_SUPPRESSION_REASONS = ("hard_bounce", "complaint", "manual")
+# Emails a user explicitly asks for still reach someone who once marked us as spam
+EMAIL_SUPPRESSION_COMPLAINT_EXEMPT = frozenset({
+    "password_reset", "verification", "username_reminder", "account_recovery", "email_change_verification",
+})
+EMAIL_SUPPRESSION_BLOOM_CAPACITY = int(os.getenv("EMAIL_SUPPRESSION_BLOOM_CAPACITY", 100000))
+EMAIL_SUPPRESSION_BLOOM_ERROR_RATE = float(os.getenv("EMAIL_SUPPRESSION_BLOOM_ERROR_RATE", 0.001))
+EMAIL_SUPPRESSION_REFRESH_SECONDS = float(os.getenv("EMAIL_SUPPRESSION_REFRESH_SECONDS", 60))
+EMAIL_SUPPRESSION_RELOAD_SECONDS = float(os.getenv("EMAIL_SUPPRESSION_RELOAD_SECONDS", 6 * 3600))
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings. Membership tests cost
+    hash_count bit lookups whatever the number of entries; a miss is
+    definite, a hit may be a false positive at roughly error_rate once
+    capacity entries have been added."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.bit_count = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(round(self.bit_count / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, value: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, value: str):
+        positions = self._positions(value)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+class EmailSuppressionList:
+    """In-process view of email_suppressions used to skip sends early.
+
+    blocks() is called before an email is rendered or an SMTP connection is
+    taken. A Bloom filter miss, the answer for nearly every address, needs no
+    I/O; a hit is confirmed with a primary-key lookup, which also screens out
+    false positives and rows that have since been removed. Rows added by
+    other processes are picked up by refresh() every
+    EMAIL_SUPPRESSION_REFRESH_SECONDS, and the filter is rebuilt from scratch
+    periodically (or when it outgrows its capacity) to drop removed rows.
+    """
+
+    def __init__(self, capacity: int = EMAIL_SUPPRESSION_BLOOM_CAPACITY,
+                 error_rate: float = EMAIL_SUPPRESSION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = None
+        self._load_lock = threading.Lock()
+        self._loaded_through = None
+        self._last_reload = None
+        self._task = None
+        self.checks = 0
+        self.filter_hits = 0
+        self.blocked = 0
+        self.false_positives = 0
+
+    @staticmethod
+    def normalize(email: str) -> str:
+        return (email or "").strip().lower()
+
+    def load(self):
+        """Build a fresh filter from every suppressed address"""
+        with self._load_lock:
             db = SessionLocal()
-            now = datetime.utcnow()
+            try:
+                rows = db.query(EmailSuppression.email, EmailSuppression.created_at).all()
+            finally:
+                db.close()
+            bloom = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+            for email, _ in rows:
+                bloom.add(email)
+            self._filter = bloom
+            self._loaded_through = max((created_at for _, created_at in rows), default=None)
+            self._last_reload = time.monotonic()
+        print(f"✅ Loaded {len(rows)} suppressed email addresses")
+
+    def refresh(self):
+        """Add rows created since the last load. The window overlaps by a few
+        minutes so rows committed late by another process aren't missed;
+        adding an address twice is harmless."""
+        if self._last_reload is None or time.monotonic() - self._last_reload > EMAIL_SUPPRESSION_RELOAD_SECONDS:
+            self.load()
+            return
+        db = SessionLocal()
+        try:
+            query = db.query(EmailSuppression.email, EmailSuppression.created_at)
+            if self._loaded_through is not None:
+                query = query.filter(EmailSuppression.created_at >= self._loaded_through - timedelta(minutes=5))
+            rows = query.all()
+        finally:
+            db.close()
+        for email, created_at in rows:
+            self._filter.add(email)
+            if self._loaded_through is None or created_at > self._loaded_through:
+                self._loaded_through = created_at
+        if self._filter.count > self._filter.capacity:
+            self.load()
+
+    def ensure_loaded(self):
+        if self._filter is not None:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            # Better to send to a suppressed address than to stop sending;
+            # refresh() retries the full load
+            print(f"❌ Failed to load email suppressions: {e}")
+            self._filter = BloomFilter(1, self.error_rate)
+            self._last_reload = None
+
+    def might_be_suppressed(self, email: str) -> bool:
+        """O(1), no I/O. False means the address is definitely not suppressed"""
+        if self._filter is None:
+            self.ensure_loaded()
+        self.checks += 1
+        if self.normalize(email) in self._filter:
+            self.filter_hits += 1
+            return True
+        return False
 
-            emails_to_send = db.query(ScheduledEmail).filter(
-                ScheduledEmail.sent == False,
-                ScheduledEmail.scheduled_for <= now
-            ).all()
+    def lookup(self, email: str) -> Optional[str]:
+        """The suppression reason for email, from the database"""
+        db = SessionLocal()
+        try:
+            return db.query(EmailSuppression.reason).filter(
+                EmailSuppression.email == self.normalize(email)
+            ).scalar()
+        finally:
+            db.close()
 
-            for scheduled_email in emails_to_send:
-                user = db.query(User).filter(User.id == scheduled_email.user_id).first()
-                if not user:
-                    continue
+    def blocks(self, email: str, email_type: Optional[str] = None, checked: bool = False) -> bool:
+        """Whether an email of email_type must not be sent to email. Pass
+        checked=True when might_be_suppressed() has already returned True."""
+        if not checked and not self.might_be_suppressed(email):
+            return False
+        reason = self.lookup(email)
+        if reason is None:
+            self.false_positives += 1
+            return False
+        if reason == "complaint" and email_type in EMAIL_SUPPRESSION_COMPLAINT_EXEMPT:
+            return False
+        self.blocked += 1
+        print(f"🚫 Not sending {email_type or 'email'} to suppressed address {email} ({reason})")
+        return True
 
-                try:
-                    # Atomic update — mark sent FIRST to prevent double sends
-                    updated = db.query(ScheduledEmail).filter(
-                        ScheduledEmail.id == scheduled_email.id,
-                        ScheduledEmail.sent == False
-                    ).update({"sent": True, "sent_at": datetime.utcnow()})
-                    db.commit()
+    async def blocks_async(self, email: str, email_type: Optional[str] = None) -> bool:
+        """blocks() that only leaves the event loop for the database lookup"""
+        if not self.might_be_suppressed(email):
+            return False
+        return await asyncio.to_thread(self.blocks, email, email_type, True)
+
+    def add(self, db, email: str, reason: str, source: Optional[str] = None, detail: Optional[str] = None):
+        """Suppress email in db's transaction. A hard bounce is never
+        downgraded to a complaint."""
+        email = self.normalize(email)
+        values = {"email": email, "reason": reason, "source": source,
+                  "detail": detail[:2000] if detail else None, "created_at": datetime.utcnow()}
+        dialect_insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        stmt = dialect_insert(EmailSuppression).values(**values)
+        db.execute(stmt.on_conflict_do_update(index_elements=["email"], set_={
+            "reason": case((EmailSuppression.reason == "hard_bounce", EmailSuppression.reason),
+                           else_=stmt.excluded.reason),
+            "source": stmt.excluded.source,
+            "detail": stmt.excluded.detail
+        }))
+        # Seen by this process right away; a rollback only costs a lookup
+        if self._filter is not None:
+            self._filter.add(email)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(EMAIL_SUPPRESSION_REFRESH_SECONDS)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"❌ Email suppression refresh error: {e}")
 
-                    if not updated:
-                        print(f"⚠️ Skipped {scheduled_email.email_type} — already sent")
-                        continue
+    async def start(self):
+        await asyncio.to_thread(self.ensure_loaded)
+        self._task = asyncio.create_task(self.run())
 
-                    if scheduled_email.email_type == 'day1_followup':
-                        today = datetime.utcnow().strftime("%Y-%m-%d")
-                        usage = db.query(Usage).filter(
-                            Usage.user_id == user.id,
-                            Usage.date == today
-                        ).first()
-                        tweets_created = usage.count if usage else 0
-                        tweets_remaining = max(0, 15 - tweets_created)
-                        hours_until_reset = 24 - datetime.utcnow().hour
-                        await email_service.send_day1_followup_email(
-                            user, tweets_created, tweets_remaining, hours_until_reset
-                        )
-                    elif scheduled_email.email_type == 'day3_nudge':
-                        last_login = user.last_login.strftime('%B %d') if user.last_login else 'a few days ago'
-                        missed_tweets = 15 * 3
-                        await email_service.send_day3_nudge_email(
-                            user, last_login, missed_tweets
-                        )
-                    elif scheduled_email.email_type == 'day7_reengagement':
-                        await email_service.send_day7_reengagement_email(user)
-                    elif scheduled_email.email_type == 'power_user_reward':
-                        today = datetime.utcnow().strftime("%Y-%m-%d")
-                        usage = db.query(Usage).filter(
-                            Usage.user_id == user.id,
-                            Usage.date == today
-                        ).first()
-                        tweets_remaining = max(0, 15 - (usage.count if usage else 0))
-                        await email_service.send_power_user_reward_email(user, tweets_remaining)
-
-                    print(f"✅ Sent {scheduled_email.email_type} to {user.email}")
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
 
-                except Exception as e:
-                    print(f"❌ Failed to send {scheduled_email.email_type} to {user.email}: {e}")
-                    db.rollback()
+    def stats(self) -> dict:
+        bloom = self._filter
+        return {
+            "filter_entries": bloom.count if bloom else None,
+            "filter_bits": bloom.bit_count if bloom else None,
+            "hash_count": bloom.hash_count if bloom else None,
+            "checks": self.checks,
+            "filter_hits": self.filter_hits,
+            "blocked": self.blocked,
+            "false_positives": self.false_positives
+        }
+
+email_suppressions = EmailSuppressionList()
+
+class EmailCapture(EmailService):
+    """An EmailService that records the messages it would send instead of
+    sending them, so the existing send_*_email methods double as renderers"""
+    def __init__(self):
+        self.smtp_server = email_service.smtp_server
+        self.smtp_port = email_service.smtp_port
+        self.smtp_username = email_service.smtp_username
+        self.smtp_password = email_service.smtp_password
+        self.from_email = email_service.from_email
+        self.sender_name = email_service.sender_name
+        self.transport = None
+        self.messages = []
+
+    def send_simple_email(self, to_email: str, subject: str, html_body: str, bcc: list[str] | None = None, text_body: str | None = None) -> bool:
+        self.messages.append({"to_email": to_email, "subject": subject, "html_body": html_body,
+                              "text_body": text_body, "bcc": bcc})
+        return True
+
+    async def send_simple_email_async(self, to_email: str, subject: str, html_body: str, bcc: list[str] | None = None, text_body: str | None = None) -> bool:
+        return self.send_simple_email(to_email, subject, html_body, bcc, text_body)
+
+    async def send_email(self, to_email: str, subject: str, body: str):
+        self.messages.append({"to_email": to_email, "subject": subject, "html_body": None,
+                              "text_body": body, "bcc": None})
+
+async def render_email(email_type: str, *args, **kwargs) -> list:
+    """Run email_service.send_<email_type>_email against a capture and return
+    the messages it produced"""
+    capture = EmailCapture()
+    result = getattr(capture, f"send_{email_type}_email")(*args, **kwargs)
+    if asyncio.iscoroutine(result):
+        await result
+    return capture.messages
+
+def _wake_email_outbox(session):
+    email_outbox.wake()
+
+async def queue_email(db, email_type: str, *args, priority: int | None = None, **kwargs) -> int:
+    """Render an email now and add it to db's current transaction as outbox
+    rows. Nothing is sent unless the caller commits; works with both Session
+    and AsyncSession. Returns the number of messages queued."""
+    try:
+        messages = await render_email(email_type, *args, **kwargs)
+    except Exception as e:
+        # A broken template shouldn't roll back the change that triggered it
+        print(f"❌ Failed to render {email_type} email: {e}")
+        return 0
+    if priority is None:
+        priority = EMAIL_PRIORITIES.get(email_type, EMAIL_DEFAULT_PRIORITY)
+
+    now = datetime.utcnow()
+    for message in messages:
+        bcc = [address for address in message["bcc"] or [] if address]
+        db.add(EmailOutbox(
+            email_type=email_type,
+            to_email=message["to_email"],
+            bcc=json.dumps(bcc) if bcc else None,
+            subject=message["subject"],
+            html_body=message["html_body"],
+            text_body=message["text_body"],
+            priority=priority,
+            status="pending",
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now
+        ))
+
+    if messages:
+        # Wake the dispatcher as soon as the rows are visible, rather than
+        # waiting for its next poll
+        session = db.sync_session if isinstance(db, AsyncSession) else db
+        sqlalchemy_event.listen(session, "after_commit", _wake_email_outbox, once=True)
+    return len(messages)
+
+def is_permanent_smtp_failure(error: Exception) -> bool:
+    """Errors that retrying won't fix: refused recipients and 5xx replies"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+def is_hard_bounce(error: Exception, address: str) -> bool:
+    """The server refused address itself (550 no such user, 551, 553), as
+    opposed to a full mailbox or a policy block on the message"""
+    if not isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    refusal = error.recipients.get(address)
+    return refusal is not None and refusal[0] in (550, 551, 553)
+
+def email_outbox_backoff(attempts: int) -> float:
+    """Exponential backoff with jitter: ~30s, 1m, 2m, 4m... capped"""
+    delay = min(EMAIL_OUTBOX_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)), EMAIL_OUTBOX_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+class EmailOutboxDispatcher:
+    """Drains email_outbox. One claimer leases due rows in priority order with
+    FOR UPDATE SKIP LOCKED (so several app processes can share the table) and
+    hands them to a pool of sender tasks that send over the SMTP pool. Failed
+    sends are retried with exponential backoff; permanent failures and rows
+    that run out of attempts are dead-lettered for an admin to look at."""
+
+    def __init__(self, workers: int = EMAIL_OUTBOX_WORKERS, batch_size: int = EMAIL_OUTBOX_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._queue = None
+        self._wakeup = None
+        self._loop = None
+        self._tasks = []
+        self._last_purge = 0.0
+        self.claimed = 0
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.suppressed = 0
+        self.recovered = 0
+
+    def wake(self):
+        """Thread-safe: make the claimer look for work now"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def claim(self, limit: int) -> list:
+        """Lease up to limit due rows and return what the senders need"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            # Rows whose sender died mid-send go back in the queue once their lease runs out
+            recovered = db.query(EmailOutbox).filter(
+                EmailOutbox.status == "sending",
+                EmailOutbox.locked_until < now
+            ).update({"status": "pending", "locked_until": None}, synchronize_session=False)
+            self.recovered += recovered
+
+            rows = db.query(EmailOutbox).filter(
+                EmailOutbox.status == "pending",
+                EmailOutbox.next_attempt_at <= now
+            ).order_by(
+                EmailOutbox.priority, EmailOutbox.next_attempt_at, EmailOutbox.id
+            ).limit(limit).with_for_update(skip_locked=True).all()
+
+            claimed = []
+            for row in rows:
+                row.status = "sending"
+                row.locked_until = now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS)
+                row.attempts = (row.attempts or 0) + 1
+                claimed.append({
+                    "id": row.id,
+                    "email_type": row.email_type,
+                    "to_email": row.to_email,
+                    "bcc": json.loads(row.bcc) if row.bcc else [],
+                    "subject": row.subject,
+                    "html_body": row.html_body,
+                    "text_body": row.text_body,
+                    "attempts": row.attempts
+                })
+            db.commit()
+            self.claimed += len(claimed)
+            return claimed
+        finally:
+            db.close()
 
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the earliest pending row is due, or None if there are none"""
+        db = SessionLocal()
+        try:
+            next_at = db.query(func.min(EmailOutbox.next_attempt_at)).filter(
+                EmailOutbox.status == "pending"
+            ).scalar()
+        finally:
             db.close()
+        if next_at is None:
+            return None
+        return max((next_at - datetime.utcnow()).total_seconds(), 0.0)
 
+    def deliver(self, row: dict):
+        """Send one claimed row and record the outcome"""
+        # Queued before the address was suppressed
+        if email_suppressions.blocks(row["to_email"], row["email_type"]):
+            self.record_suppressed(row)
+            return
+        try:
+            if not all([email_service.smtp_server, email_service.smtp_username, email_service.smtp_password]):
+                raise RuntimeError("Missing email configuration")
+            msg = email_service.build_message(row["to_email"], row["subject"], row["html_body"], row["text_body"])
+            email_service.transport.send(email_service.from_email, [row["to_email"]] + row["bcc"], msg.as_string())
         except Exception as e:
-            print(f"❌ Email scheduler error: {e}")
+            self.record_failure(row, e)
+        else:
+            self.record_sent(row)
+
+    def record_sent(self, row: dict):
+        db = SessionLocal()
+        try:
+            db.query(EmailOutbox).filter(EmailOutbox.id == row["id"]).update({
+                "status": "sent",
+                "sent_at": datetime.utcnow(),
+                "locked_until": None,
+                "last_error": None
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self.sent += 1
+        print(f"✅ Email sent to {row['to_email']} ({row['email_type']})")
+
+    def record_suppressed(self, row: dict):
+        db = SessionLocal()
+        try:
+            db.query(EmailOutbox).filter(EmailOutbox.id == row["id"]).update({
+                "status": "suppressed",
+                "locked_until": None
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self.suppressed += 1
+
+    def record_failure(self, row: dict, error: Exception):
+        now = datetime.utcnow()
+        dead = is_permanent_smtp_failure(error) or row["attempts"] >= EMAIL_OUTBOX_MAX_ATTEMPTS
+        values = {"locked_until": None, "last_error": f"{type(error).__name__}: {error}"[:2000]}
+        if dead:
+            values["status"] = "dead"
+        else:
+            values["status"] = "pending"
+            values["next_attempt_at"] = now + timedelta(seconds=email_outbox_backoff(row["attempts"]))
+
+        db = SessionLocal()
+        try:
+            db.query(EmailOutbox).filter(EmailOutbox.id == row["id"]).update(values, synchronize_session=False)
+            if is_hard_bounce(error, row["to_email"]):
+                email_suppressions.add(db, row["to_email"], "hard_bounce", "smtp", values["last_error"])
+            db.commit()
+        finally:
+            db.close()
+
+        if dead:
+            self.dead += 1
+            print(f"⛔ Email {row['id']} to {row['to_email']} dead-lettered after {row['attempts']} attempt(s): {error}")
+        else:
+            self.retried += 1
+            print(f"⚠️ Email {row['id']} to {row['to_email']} failed (attempt {row['attempts']}), will retry: {error}")
+            # Let the claimer recompute how long to sleep now that a retry is scheduled
+            self.wake()
+
+    def purge_sent(self):
+        """Drop sent and suppressed rows past the retention window"""
+        cutoff = datetime.utcnow() - timedelta(days=EMAIL_OUTBOX_KEEP_SENT_DAYS)
+        db = SessionLocal()
+        try:
+            deleted = db.query(EmailOutbox).filter(
+                EmailOutbox.status.in_(["sent", "suppressed"]),
+                EmailOutbox.created_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        if deleted:
+            print(f"🧹 Purged {deleted} sent outbox emails")
+
+    async def sender(self):
+        while True:
+            row = await self._queue.get()
+            try:
+                await asyncio.to_thread(self.deliver, row)
+            except Exception as e:
+                # Bookkeeping failed; the lease expires and the row is retried
+                print(f"❌ Email outbox sender error: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def run(self):
+        while True:
+            try:
+                if time.monotonic() - self._last_purge > 3600:
+                    self._last_purge = time.monotonic()
+                    await asyncio.to_thread(self.purge_sent)
+
+                # Keep at most one batch waiting so leases don't tick away in the queue
+                if self._queue.qsize() < self.batch_size:
+                    rows = await asyncio.to_thread(self.claim, self.batch_size)
+                    for row in rows:
+                        await self._queue.put(row)
+                    if len(rows) == self.batch_size:
+                        continue
+
+                wait = EMAIL_OUTBOX_POLL_SECONDS
+                due_in = await asyncio.to_thread(self.next_due_in)
+                if due_in is not None:
+                    wait = min(wait, due_in)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0.05))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Email outbox dispatcher error: {e}")
+                await asyncio.sleep(EMAIL_OUTBOX_POLL_SECONDS)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.batch_size * 2)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self.run())]
+        self._tasks += [asyncio.create_task(self.sender()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Claimed rows that don't finish are picked up again when their lease expires
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "claimed": self.claimed,
+            "sent": self.sent,
+            "retried": self.retried,
+            "dead": self.dead,
+            "suppressed": self.suppressed,
+            "recovered": self.recovered
+        }
+
+email_outbox = EmailOutboxDispatcher()
+
+SCHEDULED_EMAIL_BATCH_SIZE = int(os.getenv("SCHEDULED_EMAIL_BATCH_SIZE", 100))
+SCHEDULED_EMAIL_LEASE_SECONDS = int(os.getenv("SCHEDULED_EMAIL_LEASE_SECONDS", 300))
+SCHEDULED_EMAIL_MAX_SLEEP_SECONDS = float(os.getenv("SCHEDULED_EMAIL_MAX_SLEEP_SECONDS", 300))
+
+class ScheduledEmailDispatcher:
+    """Hands due scheduled_emails rows to the email outbox. Each pass leases a
+    batch with FOR UPDATE SKIP LOCKED (joined to users, so one query loads
+    everything), then marks the batch sent and queues the emails in a single
+    commit. Any number of app processes can run one: they skip each other's
+    locked and leased rows, and a crashed worker's lease simply expires.
+    Between batches it sleeps until the next scheduled_for."""
+
+    def __init__(self, batch_size: int = SCHEDULED_EMAIL_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._task = None
+        self.claimed = 0
+        self.queued = 0
+        self.lost_leases = 0
+
+    async def claim(self, db: AsyncSession, now: datetime, lease: datetime) -> list:
+        result = await db.execute(
+            select(ScheduledEmail, User)
+            .join(User, User.id == ScheduledEmail.user_id)
+            .where(
+                ScheduledEmail.sent == False,
+                ScheduledEmail.scheduled_for <= now,
+                or_(ScheduledEmail.locked_until.is_(None), ScheduledEmail.locked_until < now)
+            )
+            .order_by(ScheduledEmail.scheduled_for, ScheduledEmail.id)
+            .limit(self.batch_size)
+            .with_for_update(of=ScheduledEmail, skip_locked=True)
+        )
+        rows = result.all()
+        for scheduled_email, _ in rows:
+            scheduled_email.locked_until = lease
+        await db.commit()
+        self.claimed += len(rows)
+        return rows
+
+    async def email_args(self, db: AsyncSession, rows: list) -> dict:
+        """Arguments for each row's send_<type>_email, with today's usage
+        loaded for the whole batch in one query"""
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        user_ids = {user.id for _, user in rows}
+        result = await db.execute(
+            select(Usage.user_id, Usage.count).where(Usage.user_id.in_(user_ids), Usage.date == today)
+        )
+        usage = dict(result.all())
+
+        args = {}
+        for scheduled_email, user in rows:
+            tweets_created = usage.get(user.id) or 0
+            if scheduled_email.email_type == 'day1_followup':
+                hours_until_reset = 24 - datetime.utcnow().hour
+                args[scheduled_email.id] = (user, tweets_created, max(0, 15 - tweets_created), hours_until_reset)
+            elif scheduled_email.email_type == 'day3_nudge':
+                last_login = user.last_login.strftime('%B %d') if user.last_login else 'a few days ago'
+                args[scheduled_email.id] = (user, last_login, 15 * 3)
+            elif scheduled_email.email_type == 'day7_reengagement':
+                args[scheduled_email.id] = (user,)
+            elif scheduled_email.email_type == 'power_user_reward':
+                args[scheduled_email.id] = (user, max(0, 15 - tweets_created))
+        return args
+
+    async def dispatch_batch(self) -> int:
+        """Lease, queue and mark sent one batch; returns how many were claimed"""
+        now = datetime.utcnow()
+        lease = now + timedelta(seconds=SCHEDULED_EMAIL_LEASE_SECONDS)
+        async with AsyncSessionLocal() as db:
+            rows = await self.claim(db, now, lease)
+            if not rows:
+                return 0
+            args = await self.email_args(db, rows)
+
+            for scheduled_email, user in rows:
+                # Only the lease holder may finish the row; if this pass ran
+                # past its lease another worker may already own it
+                result = await db.execute(
+                    update(ScheduledEmail)
+                    .where(
+                        ScheduledEmail.id == scheduled_email.id,
+                        ScheduledEmail.sent == False,
+                        ScheduledEmail.locked_until == lease
+                    )
+                    .values(sent=True, sent_at=datetime.utcnow(), locked_until=None)
+                    .execution_options(synchronize_session=False)
+                )
+                if not result.rowcount:
+                    self.lost_leases += 1
+                    print(f"⚠️ Skipped {scheduled_email.email_type} for {user.email} — lease lost")
+                    continue
+                if scheduled_email.id not in args:
+                    print(f"⚠️ Unknown scheduled email type {scheduled_email.email_type}")
+                    continue
+                self.queued += await queue_email(db, scheduled_email.email_type, *args[scheduled_email.id])
+
+            # Marking sent and queueing the emails commit together
+            await db.commit()
+            print(f"✅ Queued {len(rows)} scheduled emails")
+            return len(rows)
+
+    async def next_due_in(self) -> Optional[float]:
+        """Seconds until the earliest unleased unsent email is due"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(func.min(ScheduledEmail.scheduled_for))
+                .join(User, User.id == ScheduledEmail.user_id)
+                .where(
+                    ScheduledEmail.sent == False,
+                    or_(ScheduledEmail.locked_until.is_(None), ScheduledEmail.locked_until < now)
+                )
+            )
+            next_at = result.scalar()
+        if next_at is None:
+            return None
+        return max((next_at - now).total_seconds(), 0.0)
+
+    async def run(self):
+        while True:
+            try:
+                if await self.dispatch_batch() == self.batch_size:
+                    continue
+                # New rows are scheduled at least a day out, so capping the
+                # sleep is enough to notice them
+                wait = SCHEDULED_EMAIL_MAX_SLEEP_SECONDS
+                due_in = await self.next_due_in()
+                if due_in is not None:
+                    wait = min(wait, due_in)
+                await asyncio.sleep(max(wait, 0.05))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Email scheduler error: {e}")
+                await asyncio.sleep(SCHEDULED_EMAIL_MAX_SLEEP_SECONDS)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
 
-        await asyncio.sleep(300)
+    async def stop(self):
+        # A batch interrupted mid-pass is retried when its lease expires
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"claimed": self.claimed, "queued": self.queued, "lost_leases": self.lost_leases}
+
+scheduled_email_dispatcher = ScheduledEmailDispatcher()
 
 # Security middleware to check for suspended accounts (STANDALONE FUNCTION)
 async def check_user_status(user: User):
@@ -1927,7 +2593,7 @@ def generate_reset_token():
     """Generate secure password reset token"""
     return secrets.token_urlsafe(32)
 
-def create_password_reset_record(user_id: int, db: Session):
+def create_password_reset_record(user_id: int, db: Session, commit: bool = True):
     """Create password reset record with hashed token storage"""
     # Invalidate any existing tokens for this user
     existing_tokens = db.query(PasswordReset).filter(
@@ -1951,7 +2617,10 @@ def create_password_reset_record(user_id: int, db: Session):
     )
     
     db.add(reset_record)
-    db.commit()
+    if commit:
+        db.commit()
+    else:
+        db.flush()
     
     # Add the raw token as a temporary attribute for email sending
     reset_record.raw_token = raw_token
@@ -1974,6 +2643,8 @@ def get_db():
         db.close()
         
 # Add this helper function for timezone conversion
+EASTERN_TZ = pytz.timezone('US/Eastern')
+
 def convert_to_eastern(utc_datetime):
     """Convert UTC datetime to Eastern Time"""
     if not utc_datetime:
@@ -1985,8 +2656,7 @@ def convert_to_eastern(utc_datetime):
             utc_datetime = pytz.utc.localize(utc_datetime)
         
         # Convert to Eastern Time
-        eastern = pytz.timezone('US/Eastern')
-        eastern_dt = utc_datetime.astimezone(eastern)
+        eastern_dt = utc_datetime.astimezone(EASTERN_TZ)
         
         return eastern_dt.strftime('%Y-%m-%d %H:%M:%S %Z')
     except Exception as e:
@@ -2032,7 +2702,7 @@ def generate_verification_token():
     """Generate secure verification token"""
     return secrets.token_urlsafe(32)
 
-def create_verification_record(user_id: int, db):
+def create_verification_record(user_id: int, db, commit: bool = True):
     """Create email verification record"""
     token = generate_verification_token()
     verification = EmailVerification(
@@ -2041,7 +2711,8 @@ def create_verification_record(user_id: int, db):
         expires_at=datetime.utcnow() + timedelta(hours=24)
     )
     db.add(verification)
-    db.commit()
+    if commit:
+        db.commit()
     return verification
 
 def get_client_ip(request: Request) -> str:
@@ -2263,6 +2934,28 @@ def authenticate_user(db, username: str, password: str):
     print(f"✅ Password verified successfully for user: {user.username}")
     return user
 
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    """Async version of authenticate_user; bcrypt runs off the event loop"""
+    result = await db.execute(
+        select(User).filter((User.username == username) | (User.email == username))
+    )
+    user = result.scalars().first()
+    
+    if not user:
+        print(f"❌ No user found for: {username}")
+        return None
+    
+    if not user.hashed_password:
+        print(f"❌ No password hash for user: {user.username}")
+        return None
+    
+    if not await asyncio.to_thread(verify_password, password, user.hashed_password):
+        print(f"❌ Password verification failed for user: {user.username}")
+        return None
+    
+    print(f"✅ Password verified successfully for user: {user.username}")
+    return user
+
 def get_plan_features(plan_name):
     # Normalize plan names (handle monthly/yearly variants)
     base_plan = plan_name
@@ -2333,11 +3026,9 @@ def get_plan_features(plan_name):
             "api_access": True
         }
     }
-    return features.get(plan_name, features["free"])
+    return features.get(base_plan, features["free"])
 
 def get_current_user(request: Request):
-    
-    db = SessionLocal()
     token = request.cookies.get("access_token")
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -2356,7 +3047,11 @@ def get_current_user(request: Request):
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+    finally:
+        db.close()
     if user is None:
         raise credentials_exception
     
@@ -2379,6 +3074,8 @@ async def get_current_user_or_none(request: Request) -> Optional[User]:
         return user
     except (JWTError, Exception):
         return None
+    finally:
+        db.close()
     
 def get_optional_user(request: Request, allow_suspended: bool = False):
     """Get optional user (returns None if not authenticated)"""
@@ -2416,6 +3113,65 @@ def get_optional_user(request: Request, allow_suspended: bool = False):
         print(f"Error in get_optional_user: {e}")
         return None
    
+async def get_current_user_async(request: Request, db: AsyncSession = Depends(get_async_db)) -> User:
+    """Async version of get_current_user for routes on the async data layer"""
+    token = request.cookies.get("access_token")
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    if not token:
+        raise credentials_exception
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+
+    result = await db.execute(select(User).filter(User.username == username))
+    user = result.scalars().first()
+    if user is None:
+        raise credentials_exception
+
+    return user
+
+async def get_optional_user_async(request: Request, db: AsyncSession, allow_suspended: bool = False):
+    """Async version of get_optional_user (returns None if not authenticated)"""
+    try:
+        token = request.cookies.get("access_token")
+        if not token:
+            return None
+
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            return None
+
+        result = await db.execute(select(User).filter(User.username == username))
+        user = result.scalars().first()
+        if user is None:
+            return None
+
+        if not allow_suspended:
+            if user.is_suspended:
+                return None
+            if user.account_locked_until and user.account_locked_until > datetime.utcnow():
+                return None
+
+        user.features = get_plan_features(user.plan)
+        return user
+
+    except JWTError:
+        return None
+    except Exception as e:
+        print(f"Error in get_optional_user_async: {e}")
+        return None
+
 def get_suspended_user(request: Request):
     """Special function to get user for suspended routes - allows suspended users"""
     return get_current_user(request, allow_suspended=True)
@@ -2478,13 +3234,12 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 # Start the background task when app starts
 @app.on_event("startup")
 async def startup_event():
-    global _scheduler_started
-    if not _scheduler_started:
-        _scheduler_started = True
-        asyncio.create_task(send_scheduled_emails())
-        print("✅ Email scheduler started")
-    else:
-        print("⚠️ Scheduler already running, skipping")
+    scheduled_email_dispatcher.start()
+    print("✅ Email scheduler started")
+
+@app.on_event("shutdown")
+async def stop_email_scheduler():
+    await scheduled_email_dispatcher.stop()
     
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -2499,21 +3254,26 @@ app.state.limiter = limiter
 limiter = Limiter(key_func=get_remote_address, default_limits=["100/hour"])
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY")
-)
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """OpenRouter client, built on first generation request"""
+    from openai import OpenAI
+    return OpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=os.getenv("OPENROUTER_API_KEY")
+    )
 
-# Add to your startup
-print("Hello!!")
-print("✓ STRIPE_SECRET_KEY:", "SET" if os.getenv("STRIPE_SECRET_KEY") else "MISSING")
-print("✓ DATABASE_URL:", "SET" if os.getenv("DATABASE_URL") else "MISSING")
-print("✓ SMTP configured:", "YES" if all([
-    os.getenv("SMTP_SERVER"),
-    os.getenv("SMTP_USERNAME"),
-    os.getenv("SMTP_PASSWORD")
-]) else "NO")
-print("✓ OPENROUTER_API_KEY:", "SET" if os.getenv("OPENROUTER_API_KEY") else "MISSING")
+@app.on_event("startup")
+async def report_config_status():
+    # Printed when the web app boots, not on every `import main`
+    print("✓ STRIPE_SECRET_KEY:", "SET" if os.getenv("STRIPE_SECRET_KEY") else "MISSING")
+    print("✓ DATABASE_URL:", "SET" if os.getenv("DATABASE_URL") else "MISSING")
+    print("✓ SMTP configured:", "YES" if all([
+        os.getenv("SMTP_SERVER"),
+        os.getenv("SMTP_USERNAME"),
+        os.getenv("SMTP_PASSWORD")
+    ]) else "NO")
+    print("✓ OPENROUTER_API_KEY:", "SET" if os.getenv("OPENROUTER_API_KEY") else "MISSING")
 
 @app.exception_handler(404)
 async def custom_404_handler(request: Request, exc: HTTPException):
@@ -2699,6 +3459,33 @@ def schedule_day7_reengagement(user_id: int, db: Session):
     db.add(scheduled_email)
     db.commit()
 
+async def get_usage_async(db: AsyncSession, user_id: int, day: str):
+    """Usage row for a user and day on the async data layer"""
+    result = await db.execute(
+        select(Usage).filter(Usage.user_id == user_id, Usage.date == day)
+    )
+    return result.scalars().first()
+
+async def get_user_by_customer_id_async(db: AsyncSession, customer_id: str):
+    """Look up a user by Stripe customer id on the async data layer"""
+    result = await db.execute(select(User).filter(User.stripe_customer_id == customer_id))
+    return result.scalars().first()
+
+async def schedule_onboarding_emails_async(user_id: int, db: AsyncSession):
+    """Schedule the Day 1, Day 3 and Day 7 emails on the async data layer"""
+    now = datetime.utcnow()
+    for email_type, delay in [
+        ('day1_followup', timedelta(hours=24)),
+        ('day3_nudge', timedelta(days=3)),
+        ('day7_reengagement', timedelta(days=7))
+    ]:
+        db.add(ScheduledEmail(
+            user_id=user_id,
+            email_type=email_type,
+            scheduled_for=now + delay
+        ))
+    await db.commit()
+
 def migrate_database_suspension():
     """Add suspension-related database updates"""
     global engine
@@ -2845,41 +3632,1024 @@ def fix_corrupted_user_data():
         traceback.print_exc()
         
 # Activity logging function
+# Batched activity logging
+ACTIVITY_QUEUE_MAX_SIZE = int(os.getenv("ACTIVITY_QUEUE_MAX_SIZE", 10000))
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", 500))
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", 1))
+ACTIVITY_MAX_FLUSH_ATTEMPTS = 3
+
+class ActivityLogQueue:
+    """Bounded in-process queue of UserActivity rows with a background flusher.
+
+    enqueue() never touches the database. Once the queue is half full the
+    flusher is woken early (back-pressure); when it is full new events are
+    dropped and counted rather than slowing the request down. A batch that
+    fails to insert is retried a few times before its rows are dropped.
+    """
+
+    def __init__(self, max_size: int, batch_size: int, flush_seconds: float):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._queue = deque()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+        self.backpressure_wakeups = 0
+        self.high_water_mark = 0
+
+    def enqueue(self, row: dict) -> bool:
+        with self._lock:
+            if len(self._queue) >= self.max_size:
+                self.dropped += 1
+                return False
+            self._queue.append((row, 0))
+            self.enqueued += 1
+            depth = len(self._queue)
+            self.high_water_mark = max(self.high_water_mark, depth)
+        if depth >= max(self.batch_size, self.max_size // 2):
+            self.backpressure_wakeups += 1
+            self._wake()
+        return True
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def depth(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def flush(self) -> int:
+        """Insert queued rows in batches; returns how many were written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    break
+                db = SessionLocal()
+                try:
+                    db.execute(insert(UserActivity), [row for row, _ in batch])
+                    db.commit()
+                    written += len(batch)
+                except Exception as e:
+                    db.rollback()
+                    self.failed_flushes += 1
+                    print(f"❌ Activity log flush failed ({len(batch)} rows): {e}")
+                    retry = [(row, attempts + 1) for row, attempts in batch if attempts + 1 < ACTIVITY_MAX_FLUSH_ATTEMPTS]
+                    with self._lock:
+                        self.dropped += len(batch) - len(retry)
+                        room = self.max_size - len(self._queue)
+                        self.dropped += max(0, len(retry) - room)
+                        self._queue.extendleft(reversed(retry[:room]))
+                    break
+                finally:
+                    db.close()
+        self.flushed += written
+        return written
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self.depth():
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    print(f"❌ Activity log flusher error: {e}")
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+            "backpressure_wakeups": self.backpressure_wakeups,
+            "high_water_mark": self.high_water_mark
+        }
+
+activity_queue = ActivityLogQueue(ACTIVITY_QUEUE_MAX_SIZE, ACTIVITY_BATCH_SIZE, ACTIVITY_FLUSH_SECONDS)
+
+# Live activity feed for admins
+ACTIVITY_BUS_REPLAY_SIZE = int(os.getenv("ACTIVITY_BUS_REPLAY_SIZE", 500))
+ACTIVITY_BUS_SUBSCRIBER_QUEUE = int(os.getenv("ACTIVITY_BUS_SUBSCRIBER_QUEUE", 1000))
+ACTIVITY_STREAM_HEARTBEAT_SECONDS = 15
+SUSPICIOUS_ACTIVITY_TYPES = {"failed_login", "suspicious_behavior", "rate_limit"}
+
+class ActivityBus:
+    """In-process publish/subscribe bus behind the live admin activity feed.
+
+    publish() is safe from any thread and only appends to a deque. A
+    dispatcher task on the event loop numbers events, resolves usernames,
+    keeps the last replay_size events for reconnecting clients and fans
+    them out to subscriber queues. A subscriber that falls a full queue
+    behind is disconnected and catches up from the replay buffer when it
+    reconnects. Each worker process has its own bus.
+    """
+
+    def __init__(self, replay_size: int, subscriber_queue_size: int):
+        self.subscriber_queue_size = subscriber_queue_size
+        # Event ids are "<epoch>-<seq>"; the epoch tells a reconnecting
+        # client whether its last id came from this process
+        self.epoch = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._pending = deque(maxlen=replay_size * 4)
+        self._replay = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._usernames = {}
+        self._seq = 0
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self.published = 0
+        self.lagging_disconnects = 0
+
+    @property
+    def last_event_id(self) -> str:
+        return f"{self.epoch}-{self._seq}"
+
+    def publish(self, event: dict):
+        if self._loop is None:
+            return  # not started (scripts, migrations)
+        with self._lock:
+            self._pending.append(event)
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _lookup_usernames(self, user_ids: set) -> dict:
+        db = ReadSessionLocal()
+        try:
+            return dict(db.query(User.id, User.username).filter(User.id.in_(user_ids)).all())
+        finally:
+            db.close()
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                batch = list(self._pending)
+                self._pending.clear()
+            if not batch:
+                continue
+
+            missing = {e["user_id"] for e in batch if e.get("user_id") and e["user_id"] not in self._usernames}
+            if missing:
+                try:
+                    self._usernames.update(await asyncio.to_thread(self._lookup_usernames, missing))
+                except Exception as e:
+                    print(f"❌ Activity bus username lookup failed: {e}")
+                while len(self._usernames) > 10000:
+                    self._usernames.pop(next(iter(self._usernames)))
+
+            for event in batch:
+                self._seq += 1
+                event = {
+                    **event,
+                    "id": self.last_event_id,
+                    "username": self._usernames.get(event.get("user_id")),
+                    "suspicious": event.get("activity_type") in SUSPICIOUS_ACTIVITY_TYPES
+                }
+                self._replay.append((self._seq, event))
+                self.published += 1
+                for queue in list(self._subscribers):
+                    try:
+                        queue.put_nowait(event)
+                    except asyncio.QueueFull:
+                        # Too far behind: swap the oldest event for a
+                        # disconnect marker and let the client replay
+                        self._subscribers.discard(queue)
+                        self.lagging_disconnects += 1
+                        queue.get_nowait()
+                        queue.put_nowait(None)
+
+    def subscribe(self, last_event_id: str = None):
+        """Returns (queue, backlog, reset). backlog holds replayed events
+        after last_event_id; reset means events were missed that are no
+        longer buffered, so the client should reload its snapshot."""
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        backlog, reset = [], False
+        if last_event_id:
+            epoch, _, seq = last_event_id.partition("-")
+            if epoch != self.epoch or not seq.isdigit():
+                reset = True
+            else:
+                seq = int(seq)
+                oldest = self._replay[0][0] if self._replay else self._seq + 1
+                reset = seq + 1 < oldest
+                backlog = [event for event_seq, event in self._replay if event_seq > seq]
+        self._subscribers.add(queue)
+        return queue, backlog, reset
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "replay_buffered": len(self._replay),
+            "lagging_disconnects": self.lagging_disconnects
+        }
+
+activity_bus = ActivityBus(ACTIVITY_BUS_REPLAY_SIZE, ACTIVITY_BUS_SUBSCRIBER_QUEUE)
+
+# Every activity_type the app logs, with its label in the admin activity
+# filter. Add new types here when logging them.
+ACTIVITY_TYPE_LABELS = {
+    "login": "Login",
+    "failed_login": "Failed Login",
+    "tweet_generated": "Tweet Generated",
+    "plan_change": "Plan Changed",
+    "admin_suspend": "Suspended (Admin)",
+    "admin_unsuspend": "Unsuspended (Admin)",
+    "admin_appeal_approved": "Appeal Approved",
+    "admin_appeal_denied": "Appeal Denied",
+    "password_reset_forced": "Password Reset Forced (Admin)",
+    "admin_ban_ip": "IP Banned (Admin)",
+    "admin_unban_ip": "IP Unbanned (Admin)",
+}
+
 def log_user_activity(
     user_id: int, 
     activity_type: str, 
     description: str = None, 
     ip_address: str = None,
     user_agent: str = None,
-    user_metadata: dict = None,
-    db: Session = None
+    user_metadata: dict = None
 ):
-    """Log user activity"""
-    if db is None:
-        db = SessionLocal()
-        should_close = True
-    else:
-        should_close = False
-    
-    try:
-        activity = UserActivity(
-            user_id=user_id,
-            activity_type=activity_type,
-            description=description,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            user_metadata=json.dumps(user_metadata) if user_metadata else None
+    """Log user activity (queued; written in batches by activity_queue) and
+    push it to the live admin feed"""
+    timestamp = datetime.utcnow()
+    activity_queue.enqueue({
+        "user_id": user_id,
+        "activity_type": activity_type,
+        "description": description,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "timestamp": timestamp,
+        "user_metadata": json.dumps(user_metadata) if user_metadata else None
+    })
+    activity_bus.publish({
+        "user_id": user_id,
+        "activity_type": activity_type,
+        "description": description,
+        "ip_address": ip_address,
+        "timestamp": timestamp.isoformat()
+    })
+
+def log_request_activity(request: Request, user_id: int, activity_type: str, description: str = None, user_metadata: dict = None):
+    """log_user_activity with IP and user agent taken from the request"""
+    log_user_activity(
+        user_id=user_id,
+        activity_type=activity_type,
+        description=description,
+        ip_address=get_client_ip(request),
+        user_agent=request.headers.get("user-agent"),
+        user_metadata=user_metadata
+    )
+
+def run_after_commit(session: Session, callback):
+    """Call callback once the session's current transaction commits. It is
+    dropped if that transaction, or a savepoint it was queued in, rolls back."""
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault("after_commit", []).append((transaction, callback))
+
+@sqlalchemy_event.listens_for(Session, "after_commit")
+def _run_after_commit_callbacks(session):
+    for _, callback in session.info.pop("after_commit", []):
+        try:
+            callback()
+        except Exception as e:
+            print(f"❌ After-commit callback failed: {e}")
+
+@sqlalchemy_event.listens_for(Session, "after_soft_rollback")
+def _discard_after_commit_callbacks(session, previous_transaction):
+    def rolled_back(transaction):
+        while transaction is not None:
+            if transaction is previous_transaction:
+                return True
+            transaction = transaction.parent
+        return False
+
+    callbacks = session.info.get("after_commit")
+    if callbacks:
+        session.info["after_commit"] = [entry for entry in callbacks if not rolled_back(entry[0])]
+
+# Plan changes are logged from one place instead of at each of the many
+# places that assign user.plan (webhooks, cancellation, expiry, admin tools).
+# They are collected when flushed and logged only once the transaction
+# commits, so a change that is rolled back never reaches the activity log.
+@sqlalchemy_event.listens_for(Session, "after_flush")
+def collect_plan_changes(session, flush_context):
+    for target in session.dirty:
+        if not isinstance(target, User) or target.id is None:
+            continue
+        history = inspect(target).attrs.plan.history
+        if not history.added:
+            continue
+        # Without active_history the old value is only known if it was loaded
+        old_plan = history.deleted[0] if history.deleted else None
+        new_plan = history.added[0]
+        if new_plan == old_plan:
+            continue
+        run_after_commit(session, partial(log_plan_change, target.id, old_plan, new_plan))
+
+def log_plan_change(user_id: int, old_plan: Optional[str], new_plan: Optional[str]):
+    log_user_activity(
+        user_id=user_id,
+        activity_type="plan_change",
+        description=f"Plan changed from {old_plan} to {new_plan}" if old_plan else f"Plan changed to {new_plan}",
+        user_metadata={"old_plan": old_plan, "new_plan": new_plan}
+    )
+
+def adjust_tweet_counts(db: Session, deltas: Counter):
+    """Add per-user deltas to users.tweet_count in db's transaction, which
+    must be the one that inserted or deleted the generated_tweets rows.
+    Updated in user id order so concurrent writers lock rows alike."""
+    users = User.__table__
+    params = [{"b_user_id": user_id, "b_delta": delta} for user_id, delta in sorted(deltas.items()) if delta]
+    if params:
+        db.execute(
+            users.update()
+            .where(users.c.id == bindparam("b_user_id"))
+            .values(tweet_count=users.c.tweet_count + bindparam("b_delta")),
+            params
+        )
+
+# Write-behind buffer for generated tweets
+TWEET_BUFFER_MAX_ROWS = int(os.getenv("TWEET_BUFFER_MAX_ROWS", 200))
+TWEET_BUFFER_FLUSH_SECONDS = float(os.getenv("TWEET_BUFFER_FLUSH_SECONDS", 2))
+
+class TweetWriteBuffer:
+    """Bulk-inserts generated tweets into generated_tweets.
+
+    Handlers add tweets to pending_tweets in their own transaction, so staging
+    costs no extra commit and commits or rolls back together with the usage
+    increment. Every process runs a flusher that moves staged rows, whoever
+    staged them, into generated_tweets with DELETE ... RETURNING and a
+    multi-row INSERT in one transaction; SKIP LOCKED keeps two flushers from
+    moving the same row. Readers call pending_for_user() for rows that are
+    still staged. On Postgres a staged row keeps its id when moved, so a read
+    that races a flush can drop the copy it sees twice (dedupe_tweets).
+    """
+
+    def __init__(self, max_rows: int, flush_seconds: float):
+        self.max_rows = max_rows
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._staged_since_flush = 0
+        self._wakeup = None
+        self._task = None
+        self.staged_rows = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+
+    def add(self, db: AsyncSession, user_id: int, tweet_texts: List[str]):
+        """Stage tweets in db's transaction; the caller commits"""
+        now = datetime.utcnow()
+        postgres = db.get_bind().dialect.name == "postgresql"
+        for tweet_text in tweet_texts:
+            db.add(PendingTweet(
+                id=func.nextval("generated_tweets_id_seq") if postgres else None,
+                user_id=user_id,
+                tweet_text=tweet_text,
+                generated_at=now
+            ))
+        with self._lock:
+            self.staged_rows += len(tweet_texts)
+            self._staged_since_flush += len(tweet_texts)
+            should_flush = self._staged_since_flush >= self.max_rows
+
+        # Wakes the flusher early; rows not yet committed go in the next flush
+        if should_flush and self._wakeup:
+            self._wakeup.set()
+
+    @staticmethod
+    async def pending_for_user(db: AsyncSession, user_id: int, since: datetime = None) -> List[PendingTweet]:
+        """Staged tweets for a user, newest first"""
+        result = await db.execute(TweetWriteBuffer.pending_query(user_id, since))
+        return list(result.scalars().all())
+
+    @staticmethod
+    def pending_query(user_id: int, since: datetime = None):
+        query = select(PendingTweet).where(PendingTweet.user_id == user_id)
+        if since is not None:
+            query = query.where(PendingTweet.generated_at >= since)
+        return query.order_by(PendingTweet.generated_at.desc(), PendingTweet.id.desc())
+
+    def flush(self) -> int:
+        """Move every committed staged row into generated_tweets"""
+        with self._flush_lock:
+            with self._lock:
+                self._staged_since_flush = 0
+            total = 0
+            try:
+                while True:
+                    moved = self._move()
+                    total += moved
+                    if moved < self.max_rows:
+                        break
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f"❌ Tweet buffer flush failed, will retry: {e}")
+            self.flushed_rows += total
+            return total
+
+    def _move(self) -> int:
+        """Move up to max_rows staged rows into generated_tweets in one transaction.
+
+        Rows locked or already moved by another process are skipped, so
+        nothing is inserted twice.
+        """
+        batch = (
+            select(PendingTweet.id)
+            .order_by(PendingTweet.id)
+            .limit(self.max_rows)
+            .with_for_update(skip_locked=True)
         )
-        db.add(activity)
-        if should_close:
+        db = SessionLocal()
+        rows = []
+        try:
+            rows = db.execute(
+                delete(PendingTweet)
+                .where(PendingTweet.id.in_(batch))
+                .returning(PendingTweet.id, PendingTweet.user_id, PendingTweet.tweet_text, PendingTweet.generated_at)
+            ).all()
+            if rows:
+                db.execute(insert(GeneratedTweet), [self._generated_row(db, row) for row in rows])
+                adjust_tweet_counts(db, Counter(row.user_id for row in rows))
             db.commit()
-    except Exception as e:
-        print(f"Error logging activity: {e}")
-        if should_close:
+            return len(rows)
+        except IntegrityError:
             db.rollback()
-    finally:
-        if should_close:
+            return self._move_individually(db, [row.id for row in rows])
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _generated_row(db: Session, row) -> dict:
+        values = {"user_id": row.user_id, "tweet_text": row.tweet_text, "generated_at": row.generated_at}
+        # Staged ids only come from generated_tweets' own sequence on Postgres
+        if db.get_bind().dialect.name == "postgresql":
+            values["id"] = row.id
+        return values
+
+    def _move_individually(self, db: Session, staged_ids: List[int]) -> int:
+        """Fallback when a batch violates a constraint, e.g. the user was deleted"""
+        moved = 0
+        for staged_id in staged_ids:
+            row = db.execute(
+                delete(PendingTweet)
+                .where(PendingTweet.id == staged_id)
+                .returning(PendingTweet.id, PendingTweet.user_id, PendingTweet.tweet_text, PendingTweet.generated_at)
+            ).first()
+            if row is None:
+                db.rollback()
+                continue
+            try:
+                db.execute(insert(GeneratedTweet), [self._generated_row(db, row)])
+                adjust_tweet_counts(db, Counter({row.user_id: 1}))
+                db.commit()
+                moved += 1
+            except IntegrityError as e:
+                db.rollback()
+                print(f"⚠️ Dropping buffered tweet for user {row.user_id}: {e}")
+                db.execute(delete(PendingTweet).where(PendingTweet.id == staged_id))
+                db.commit()
+        return moved
+
+    async def run(self):
+        """Background flusher: wakes on the size trigger or every flush_seconds"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"❌ Tweet buffer error: {e}")
+
+    def stats(self):
+        return {
+            "staged_rows": self.staged_rows,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes
+        }
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+            print("✅ Tweet write buffer started")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+def dedupe_tweets(tweets: list) -> list:
+    """Drop rows seen both staged and moved by a flush that ran between the reads"""
+    seen = set()
+    deduped = []
+    for tweet in tweets:
+        if tweet.id in seen:
+            continue
+        seen.add(tweet.id)
+        deduped.append(tweet)
+    return deduped
+
+tweet_buffer = TweetWriteBuffer(
+    TWEET_BUFFER_MAX_ROWS,
+    TWEET_BUFFER_FLUSH_SECONDS
+)
+
+async def get_recent_tweets_async(db: AsyncSession, user_id: int, limit: int = None, since: datetime = None):
+    """Async version of get_recent_tweets"""
+    query = select(GeneratedTweet).filter(GeneratedTweet.user_id == user_id)
+    # Staged rows first: a flush between the two reads then duplicates a row
+    # rather than hiding it
+    pending = await tweet_buffer.pending_for_user(db, user_id, since)
+    if since is not None:
+        query = query.filter(GeneratedTweet.generated_at >= since)
+    query = query.order_by(GeneratedTweet.generated_at.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    tweets = dedupe_tweets(pending + list(result.scalars().all()))
+    return tweets[:limit] if limit is not None else tweets
+
+# /history shows the same window on every plan
+HISTORY_DAYS = 90
+
+# Retention for generated tweets. On Postgres generated_tweets is range
+# partitioned by month (see the feb715b5ed41 migration); months older than the
+# longest retention window are dropped whole, everything else is deleted per
+# plan in small batches.
+TWEET_RETENTION_INTERVAL_SECONDS = int(os.getenv("TWEET_RETENTION_INTERVAL_SECONDS", 6 * 3600))
+TWEET_RETENTION_BATCH_SIZE = int(os.getenv("TWEET_RETENTION_BATCH_SIZE", 1000))
+TWEET_RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("TWEET_RETENTION_BATCH_PAUSE_SECONDS", 0.05))
+# Extra days kept past the plan window so a quick upgrade gets history back
+TWEET_RETENTION_GRACE_DAYS = int(os.getenv("TWEET_RETENTION_GRACE_DAYS", 7))
+# Detach expired partitions (for pg_dump + manual drop) instead of dropping them
+TWEET_RETENTION_ARCHIVE = os.getenv("TWEET_RETENTION_ARCHIVE", "false").lower() == "true"
+TWEET_PARTITION_MONTHS_AHEAD = 2
+# Moving default-partition rows locks generated_tweets; give up rather than
+# queue behind long readers (the next sweep retries)
+TWEET_PARTITION_LOCK_TIMEOUT_MS = int(os.getenv("TWEET_PARTITION_LOCK_TIMEOUT_MS", 5000))
+
+# Plans get_plan_features actually knows (see retention_days for the rest)
+RETENTION_PLANS = (
+    "free", "creator", "creator_monthly", "creator_yearly",
+    "small_team", "small_team_monthly", "small_team_yearly", "agency", "enterprise"
+)
+
+def add_months(month_start: date, months: int) -> date:
+    month_index = month_start.month - 1 + months
+    return date(month_start.year + month_index // 12, month_index % 12 + 1, 1)
+
+class TweetRetentionSweeper:
+    """Prunes generated_tweets past each user's plan history window and keeps
+    size / history-latency samples for the admin report."""
+
+    PARTITION_PREFIX = "generated_tweets_p"
+    DEFAULT_PARTITION = "generated_tweets_default"
+
+    def __init__(self, batch_size: int, grace_days: int, archive: bool):
+        self.batch_size = batch_size
+        self.grace_days = grace_days
+        self.archive = archive
+        self.last_run = None
+        self.last_result = None
+        self.size_history = deque(maxlen=120)
+        self.history_latency = {}  # "YYYY-MM-DD" -> LatencyHistogram
+        self._lock = threading.Lock()
+
+    def observe_history_query(self, seconds: float):
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        with self._lock:
+            if day not in self.history_latency:
+                self.history_latency[day] = LatencyHistogram()
+                for old_day in sorted(self.history_latency)[:-14]:
+                    del self.history_latency[old_day]
+            self.history_latency[day].observe(seconds)
+
+    def longest_retention_days(self) -> int:
+        return max(HISTORY_DAYS, *(get_plan_features(plan)["history_days"] for plan in RETENTION_PLANS))
+
+    def retention_days(self, plan: Optional[str], original_plan: Optional[str]) -> int:
+        """Days of tweets a user keeps, before the grace period.
+
+        One rule for row deletes and partition drops: never less than what
+        /history shows, canceling users keep their paid plan's window until
+        they are downgraded, and plans get_plan_features doesn't know keep
+        the longest window, which is exactly what partition drops enforce.
+        """
+        if plan == "canceling":
+            plan = original_plan
+        plan = plan or "free"
+        if plan not in RETENTION_PLANS:
+            return self.longest_retention_days()
+        return max(HISTORY_DAYS, get_plan_features(plan)["history_days"])
+
+    def max_window_days(self) -> int:
+        return self.longest_retention_days() + self.grace_days
+
+    def is_partitioned(self, db) -> bool:
+        if db.bind.dialect.name != "postgresql":
+            return False
+        return bool(db.execute(text("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                WHERE c.relname = 'generated_tweets'
+            )
+        """)).scalar())
+
+    def list_partitions(self, db):
+        rows = db.execute(text("""
+            SELECT c.relname, pg_total_relation_size(c.oid) AS bytes, c.reltuples::bigint AS row_estimate
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = 'generated_tweets'
+            ORDER BY c.relname
+        """)).all()
+        partitions = []
+        for name, size, row_estimate in rows:
+            month_start = None
+            if name.startswith(self.PARTITION_PREFIX):
+                try:
+                    month_start = datetime.strptime(name[len(self.PARTITION_PREFIX):], "%Y%m").date()
+                except ValueError:
+                    pass
+            partitions.append({
+                "name": name,
+                "month_start": month_start,
+                "bytes": size,
+                "row_estimate": max(row_estimate, 0)
+            })
+        return partitions
+
+    def ensure_partitions(self, db):
+        """Create this month's and the next few months' partitions ahead of
+        time. Returns (rows moved out of the default partition, months that
+        could not be created)."""
+        month_start = datetime.utcnow().date().replace(day=1)
+        moved, failed = 0, []
+        for offset in range(TWEET_PARTITION_MONTHS_AHEAD + 1):
+            start = add_months(month_start, offset)
+            end = add_months(start, 1)
+            name = f"{self.PARTITION_PREFIX}{start:%Y%m}"
+            try:
+                if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+                    continue
+                stranded = 0
+                if db.execute(text("SELECT to_regclass(:name)"), {"name": self.DEFAULT_PARTITION}).scalar():
+                    stranded = db.execute(text(
+                        f"SELECT count(*) FROM {self.DEFAULT_PARTITION} "
+                        f"WHERE generated_at >= :start AND generated_at < :end"
+                    ), {"start": start, "end": end}).scalar()
+                if stranded:
+                    self.move_default_rows(db, name, start, end)
+                    print(f"⚠️ Moved {stranded} rows from {self.DEFAULT_PARTITION} into new partition {name}")
+                else:
+                    db.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF generated_tweets "
+                        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+                    ))
+                db.commit()
+                moved += stranded
+            except Exception as e:
+                db.rollback()
+                failed.append(name)
+                print(f"🚨 Could not create tweet partition {name}; its rows keep landing in "
+                      f"{self.DEFAULT_PARTITION} and will not be dropped with their month: {e}")
+        return moved, failed
+
+    def move_default_rows(self, db, name: str, start: date, end: date):
+        """Rows for a month with no partition land in the default partition,
+        and while they sit there the month's partition can't be created.
+        Detach the default, create the partition, move the month's rows
+        into it and reattach the default, in the caller's transaction.
+        This holds ACCESS EXCLUSIVE on generated_tweets until commit."""
+        bounds = {"start": start, "end": end}
+        db.execute(text(f"SET LOCAL lock_timeout = {TWEET_PARTITION_LOCK_TIMEOUT_MS}"))
+        db.execute(text(f"ALTER TABLE generated_tweets DETACH PARTITION {self.DEFAULT_PARTITION}"))
+        db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF generated_tweets FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        db.execute(text(
+            f"INSERT INTO {name} (id, user_id, tweet_text, generated_at) "
+            f"SELECT id, user_id, tweet_text, generated_at FROM {self.DEFAULT_PARTITION} "
+            f"WHERE generated_at >= :start AND generated_at < :end"
+        ), bounds)
+        db.execute(text(
+            f"DELETE FROM {self.DEFAULT_PARTITION} WHERE generated_at >= :start AND generated_at < :end"
+        ), bounds)
+        db.execute(text(f"ALTER TABLE generated_tweets ATTACH PARTITION {self.DEFAULT_PARTITION} DEFAULT"))
+
+    def drop_expired_partitions(self, db, now: datetime):
+        """Drop (or detach) whole months that every plan window has moved past"""
+        cutoff = (now - timedelta(days=self.max_window_days())).date()
+        removed = []
+        for partition in self.list_partitions(db):
+            month_start = partition["month_start"]
+            if month_start is None or add_months(month_start, 1) > cutoff:
+                continue
+            # The month's rows leave generated_tweets with the partition
+            counts = db.execute(text(
+                f"SELECT user_id, count(*) FROM {partition['name']} WHERE user_id IS NOT NULL GROUP BY user_id"
+            )).all()
+            adjust_tweet_counts(db, Counter({user_id: -count for user_id, count in counts}))
+            if self.archive:
+                db.execute(text(f"ALTER TABLE generated_tweets DETACH PARTITION {partition['name']}"))
+            else:
+                db.execute(text(f"DROP TABLE {partition['name']}"))
+            db.commit()
+            removed.append(partition["name"])
+            print(f"🗑️ {'Detached' if self.archive else 'Dropped'} tweet partition {partition['name']}")
+        return removed
+
+    def delete_expired_rows(self, db, now: datetime) -> int:
+        """Batched deletes of rows older than each plan's history window"""
+        filters_by_days = {}
+        seen = set()
+        for plan, original_plan in db.execute(select(User.plan, User.original_plan).distinct()).all():
+            if plan != "canceling":
+                original_plan = None  # only matters while canceling
+            if (plan, original_plan) in seen:
+                continue
+            seen.add((plan, original_plan))
+            plan_filter = User.plan.is_(None) if plan is None else User.plan == plan
+            if plan == "canceling":
+                plan_filter = and_(plan_filter, User.original_plan.is_(None) if original_plan is None
+                                   else User.original_plan == original_plan)
+            filters_by_days.setdefault(self.retention_days(plan, original_plan), []).append(plan_filter)
+
+        deleted = 0
+        for days, plan_filters in sorted(filters_by_days.items()):
+            cutoff = now - timedelta(days=days + self.grace_days)
+            plan_filter = or_(*plan_filters)
+            while True:
+                ids = db.execute(
+                    select(GeneratedTweet.id)
+                    .join(User, User.id == GeneratedTweet.user_id)
+                    .where(plan_filter, GeneratedTweet.generated_at < cutoff)
+                    .limit(self.batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                # generated_at in the predicate lets Postgres prune partitions
+                removed = db.execute(
+                    delete(GeneratedTweet)
+                    .where(GeneratedTweet.id.in_(ids), GeneratedTweet.generated_at < cutoff)
+                    .returning(GeneratedTweet.user_id)
+                    .execution_options(synchronize_session=False)
+                ).scalars().all()
+                adjust_tweet_counts(db, Counter({user_id: -count for user_id, count in Counter(removed).items()}))
+                db.commit()
+                deleted += len(ids)
+                if len(ids) < self.batch_size:
+                    break
+                time.sleep(TWEET_RETENTION_BATCH_PAUSE_SECONDS)
+        return deleted
+
+    def record_size(self, db, partitioned: bool):
+        if partitioned:
+            partitions = self.list_partitions(db)
+            size = sum(p["bytes"] for p in partitions)
+            rows = sum(p["row_estimate"] for p in partitions)
+        elif db.bind.dialect.name == "postgresql":
+            size = db.execute(text("SELECT pg_total_relation_size('generated_tweets')")).scalar()
+            rows = db.execute(select(func.count(GeneratedTweet.id))).scalar()
+        else:
+            size = None
+            rows = db.execute(select(func.count(GeneratedTweet.id))).scalar()
+        self.size_history.append({
+            "timestamp": datetime.utcnow().isoformat(),
+            "bytes": size,
+            "rows": rows
+        })
+
+    def sweep(self):
+        started = time.monotonic()
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            partitioned = self.is_partitioned(db)
+            dropped, moved, failed = [], 0, []
+            if partitioned:
+                moved, failed = self.ensure_partitions(db)
+                dropped = self.drop_expired_partitions(db, now)
+            deleted = self.delete_expired_rows(db, now)
+            self.record_size(db, partitioned)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
             db.close()
+        self.last_run = now
+        self.last_result = {
+            "partitioned": partitioned,
+            "dropped_partitions": dropped,
+            "moved_default_rows": moved,
+            "failed_partitions": failed,
+            "deleted_rows": deleted,
+            "duration_seconds": round(time.monotonic() - started, 3)
+        }
+        if deleted or dropped:
+            print(f"🧹 Tweet retention: deleted {deleted} rows, removed {len(dropped)} partitions")
+        return self.last_result
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"❌ Tweet retention sweep failed: {e}")
+            await asyncio.sleep(TWEET_RETENTION_INTERVAL_SECONDS)
+
+    def report(self):
+        with self._lock:
+            latency = {day: hist.snapshot() for day, hist in sorted(self.history_latency.items())}
+        return {
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_result": self.last_result,
+            "grace_days": self.grace_days,
+            "max_window_days": self.max_window_days(),
+            "size_history": list(self.size_history),
+            "history_query_latency": latency
+        }
+
+tweet_retention = TweetRetentionSweeper(
+    TWEET_RETENTION_BATCH_SIZE,
+    TWEET_RETENTION_GRACE_DAYS,
+    TWEET_RETENTION_ARCHIVE
+)
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 50))
+
+def encode_history_cursor(generated_at: datetime, tweet_id: int) -> str:
+    raw = f"{generated_at.isoformat()}|{tweet_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_history_cursor(cursor: str):
+    """Inverse of encode_history_cursor; raises ValueError on garbage"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        generated_at, tweet_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(generated_at), int(tweet_id)
+    except Exception:
+        raise ValueError("Invalid history cursor")
+
+async def get_history_page_async(db: AsyncSession, user_id: int, since: datetime,
+                                 cursor: str = None, limit: int = HISTORY_PAGE_SIZE):
+    """One page of a user's history, newest first.
+
+    Keyset pagination on (generated_at, id) so every page costs the same
+    index range scan (ix_generated_tweets_user_history covers it) however
+    deep the user scrolls. The first page also includes still-buffered
+    tweets. Returns (tweets, next_cursor).
+    """
+    query = (
+        select(GeneratedTweet.id, GeneratedTweet.tweet_text, GeneratedTweet.generated_at)
+        .where(GeneratedTweet.user_id == user_id, GeneratedTweet.generated_at >= since)
+        .order_by(GeneratedTweet.generated_at.desc(), GeneratedTweet.id.desc())
+        .limit(limit + 1)
+    )
+    pending = []
+    if cursor:
+        cursor_at, cursor_id = decode_history_cursor(cursor)
+        query = query.where(
+            tuple_(GeneratedTweet.generated_at, GeneratedTweet.id) < tuple_(cursor_at, cursor_id)
+        )
+    else:
+        pending = await tweet_buffer.pending_for_user(db, user_id, since)
+
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_history_cursor(rows[-1].generated_at, rows[-1].id)
+    return dedupe_tweets(pending + rows), next_cursor
+
+@app.on_event("startup")
+async def start_tweet_buffer():
+    tweet_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_tweet_buffer():
+    await tweet_buffer.stop()
+    print("✅ Tweet write buffer flushed")
+
+@app.on_event("startup")
+async def start_pool_leak_monitor():
+    asyncio.create_task(monitor_pool_leaks())
+
+@app.on_event("startup")
+async def start_activity_queue():
+    activity_queue.start()
+
+@app.on_event("shutdown")
+async def stop_activity_queue():
+    await activity_queue.stop()
+    print("✅ Activity log flushed")
+
+@app.on_event("startup")
+async def start_activity_bus():
+    activity_bus.start()
+
+@app.on_event("shutdown")
+async def stop_activity_bus():
+    activity_bus.stop()
+
+@app.on_event("startup")
+async def warm_email_templates():
+    count = await asyncio.to_thread(compile_email_templates)
+    print(f"✅ Compiled {count} email templates")
+
+@app.on_event("startup")
+async def load_email_suppressions():
+    await email_suppressions.start()
+
+@app.on_event("shutdown")
+async def stop_email_suppressions():
+    await email_suppressions.stop()
+
+@app.on_event("startup")
+async def start_email_outbox():
+    email_outbox.start()
+
+@app.on_event("shutdown")
+async def stop_email_outbox():
+    await email_outbox.stop()
+
+@app.on_event("shutdown")
+async def close_smtp_pool():
+    await asyncio.to_thread(email_service.transport.close_all)
+
+@app.on_event("startup")
+async def start_tweet_retention():
+    asyncio.create_task(tweet_retention.run())
+
+@app.on_event("startup")
+async def start_replica_lag_monitor():
+    if replica_router.replica is not None:
+        asyncio.create_task(replica_router.run())
+
+@app.on_event("shutdown")
+async def check_pool_leaks_on_shutdown():
+    # In test mode every connection must be back in the pool by shutdown
+    if DB_POOL_TEST_MODE:
+        assert_no_leaked_connections()
 
 # ---- ROUTES ----
 @app.get("/")
@@ -2913,25 +4683,134 @@ def index(request: Request):
         "user": user
     })
 
-def verify_recaptcha(recaptcha_response):
+# reCAPTCHA verification
+RECAPTCHA_VERIFY_URL = os.getenv("RECAPTCHA_VERIFY_URL", "https://www.google.com/recaptcha/api/siteverify")
+RECAPTCHA_TIMEOUT_SECONDS = float(os.getenv("RECAPTCHA_TIMEOUT_SECONDS", 5))
+RECAPTCHA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("RECAPTCHA_CONNECT_TIMEOUT_SECONDS", 2))
+RECAPTCHA_MAX_CONCURRENCY = int(os.getenv("RECAPTCHA_MAX_CONCURRENCY", 20))
+# When Google can't be reached: true lets the request through, false rejects it
+RECAPTCHA_FAIL_OPEN = os.getenv("RECAPTCHA_FAIL_OPEN", "false").lower() == "true"
+
+class RecaptchaVerifier:
+    """Checks reCAPTCHA tokens against the siteverify endpoint without
+    blocking the event loop.
+
+    Requests share one keep-alive httpx.AsyncClient. At most
+    max_concurrency run at once; a caller that can't get a slot within
+    the timeout is treated like a timed-out request. Every attempt is
+    bounded by the timeout, including the wait for a slot.
+
+    A token Google rejects is always rejected. When Google's answer is
+    unavailable (timeout, connection error, 5xx, unreadable body),
+    fail_open decides the outcome. Latency and outcome counts are
+    reported by stats().
+    """
+
+    def __init__(self, secret_key: Optional[str] = None, url: str = RECAPTCHA_VERIFY_URL,
+                 timeout: float = RECAPTCHA_TIMEOUT_SECONDS, connect_timeout: float = RECAPTCHA_CONNECT_TIMEOUT_SECONDS,
+                 max_concurrency: int = RECAPTCHA_MAX_CONCURRENCY, fail_open: bool = RECAPTCHA_FAIL_OPEN):
+        self._secret_key = secret_key
+        self.url = url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self.fail_open = fail_open
+        self._client = None
+        self._slots = None
+        self.latency = LatencyHistogram()
+        self.in_flight = 0
+        self.counts = {"passed": 0, "rejected": 0, "missing_token": 0, "unavailable": 0,
+                       "failed_open": 0, "timeouts": 0, "saturated": 0}
+
+    @property
+    def secret_key(self) -> Optional[str]:
+        return self._secret_key or os.getenv("RECAPTCHA_SECRET_KEY")
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency,
+                                    keepalive_expiry=30)
+            )
+        return self._client
+
+    def _unavailable(self, reason: str) -> bool:
+        self.counts["unavailable"] += 1
+        if self.fail_open:
+            self.counts["failed_open"] += 1
+        print(f"⚠️ reCAPTCHA verification unavailable ({reason}), failing {'open' if self.fail_open else 'closed'}")
+        return self.fail_open
+
+    async def _post(self, token: str, remote_ip: Optional[str]):
+        data = {"secret": self.secret_key, "response": token}
+        if remote_ip:
+            data["remoteip"] = remote_ip
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                return await self.client.post(self.url, data=data)
+            finally:
+                self.in_flight -= 1
+
+    async def verify(self, token: str, remote_ip: Optional[str] = None) -> bool:
+        if not self.secret_key:
+            print("❌ Missing RECAPTCHA_SECRET_KEY")
+            return False
+        if not token:
+            self.counts["missing_token"] += 1
+            return False
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        if self._slots.locked():
+            self.counts["saturated"] += 1
+
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self._post(token, remote_ip), timeout=self.timeout)
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            self.counts["timeouts"] += 1
+            return self._unavailable("timeout")
+        except httpx.HTTPError as e:
+            return self._unavailable(f"{type(e).__name__}: {e}")
+        finally:
+            self.latency.observe(time.monotonic() - started)
+
+        if response.status_code >= 500:
+            return self._unavailable(f"HTTP {response.status_code}")
+        try:
+            success = response.json().get("success") is True
+        except ValueError:
+            return self._unavailable("invalid response body")
+
+        self.counts["passed" if success else "rejected"] += 1
+        return success
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            **self.counts,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "fail_open": self.fail_open,
+            "latency": self.latency.snapshot()
+        }
+
+recaptcha_verifier = RecaptchaVerifier()
+
+async def verify_recaptcha(recaptcha_response, remote_ip: Optional[str] = None) -> bool:
     """Verify reCAPTCHA response with Google"""
-    secret_key = os.getenv("RECAPTCHA_SECRET_KEY")
-    if not secret_key:
-        print("❌ Missing RECAPTCHA_SECRET_KEY")
-        return False
-    
-    data = {
-        'secret': secret_key,
-        'response': recaptcha_response
-    }
-    
-    try:
-        response = requests.post('https://www.google.com/recaptcha/api/siteverify', data=data)
-        result = response.json()
-        return result.get('success', False)
-    except Exception as e:
-        print(f"❌ reCAPTCHA verification error: {str(e)}")
-        return False    
+    return await recaptcha_verifier.verify(recaptcha_response, remote_ip)
+
+@app.on_event("shutdown")
+async def close_recaptcha_client():
+    await recaptcha_verifier.close()
 
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
@@ -3034,7 +4913,7 @@ async def register_post(
         print(f"🌐 Client IP for registration: {client_ip}")
         
         # Verify reCAPTCHA first
-        if not verify_recaptcha(g_recaptcha_response):
+        if not await verify_recaptcha(g_recaptcha_response, client_ip):
             print("❌ reCAPTCHA verification failed")
             csrf_response = csrf_protect.generate_csrf()
             new_csrf_token = csrf_response[0] if isinstance(csrf_response, tuple) else csrf_response
@@ -3119,22 +4998,13 @@ async def register_post(
         db.add(new_user)
         db.flush()
         user_id = new_user.id
-        db.commit()
-        
-        # Create verification and send emails
-        verification = create_verification_record(user_id, db)
-        
-        try:
-            await email_service.send_verification_email(new_user, verification.token)
-            print("✅ Verification email sent successfully")
-        except Exception as e:
-            print(f"❌ Failed to send verification email: {str(e)}")
         
-        try:
-            await email_service.send_welcome_email(new_user)
-            print("✅ Welcome email sent successfully")
-        except Exception as e:
-            print(f"❌ Failed to send welcome email: {str(e)}")
+        # The user, their verification token and both emails commit together
+        verification = create_verification_record(user_id, db, commit=False)
+        await queue_email(db, "verification", new_user, verification.token)
+        await queue_email(db, "welcome", new_user)
+        db.commit()
+        print("✅ Verification and welcome emails queued")
         
         print(f"User registered successfully with ID: {user_id}")
         csrf_response = csrf_protect.generate_csrf()
@@ -3356,7 +5226,7 @@ async def forgot_password_post(
         return response
     
     # CSRF is valid, continue with rest of the logic
-    if not verify_recaptcha(g_recaptcha_response):
+    if not await verify_recaptcha(g_recaptcha_response, client_ip):
         csrf_response = csrf_protect.generate_csrf()
         new_csrf_token = csrf_response[0] if isinstance(csrf_response, tuple) else csrf_response
         
@@ -3408,21 +5278,15 @@ async def forgot_password_post(
             return response
         
         if reset_type == "password":
-            reset_record = create_password_reset_record(user.id, db)
-            try:
-                await email_service.send_password_reset_email(user, reset_record.raw_token, client_ip)
-                success_message = "Password reset email sent! Check your inbox."
-            except Exception as e:
-                print(f"Failed to send password reset email: {str(e)}")
-                success_message = "If an account exists, we've sent a reset email."
+            reset_record = create_password_reset_record(user.id, db, commit=False)
+            await queue_email(db, "password_reset", user, reset_record.raw_token, client_ip)
+            db.commit()
+            success_message = "Password reset email sent! Check your inbox."
         
         elif reset_type == "username":
-            try:
-                await email_service.send_username_reminder_email(user)
-                success_message = "Username reminder sent! Check your inbox."
-            except Exception as e:
-                print(f"Failed to send username reminder: {str(e)}")
-                success_message = "If an account exists, we've sent a username reminder."
+            await queue_email(db, "username_reminder", user)
+            db.commit()
+            success_message = "Username reminder sent! Check your inbox."
         
         response = templates.TemplateResponse("forgot_password.html", {
             "request": request,
@@ -3467,7 +5331,7 @@ async def resend_verification_post(
     db = SessionLocal()
     try:
         # Verify reCAPTCHA
-        if not verify_recaptcha(g_recaptcha_response):
+        if not await verify_recaptcha(g_recaptcha_response, get_real_client_ip(request)):
             csrf_token = csrf_protect.generate_csrf() 
             return templates.TemplateResponse("resend_verification.html", {
                 "request": request,
@@ -3995,43 +5859,333 @@ async def ip_ban_middleware(request: Request, call_next):
     
     return await call_next(request)
 
-@app.get("/admin")
-async def admin_dashboard(
-    request: Request,
-    user: User = Depends(get_admin_user),
-    success: str = Query(None),
-    error: str = Query(None),
-    db: Session = Depends(get_db)
-):
-    print("The admin has arrived!")
-    """Admin dashboard page"""
-    try:
-        if not user or not is_admin_user(user):
-            raise HTTPException(status_code=404, detail="Page not found")
-        
-        last_login_eastern = convert_to_eastern(user.last_login) if user.last_login else None
-        
-        # Get statistics
-        total_users = db.query(User).count()
-        suspended_count = db.query(User).filter(User.is_suspended == True).count()
-        
-        # Recent signups (last 7 days)
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        recent_signups = db.query(User).filter(User.created_at >= seven_days_ago).count()
-        
-        # Active today (logged in last 24 hours)
-        one_day_ago = datetime.utcnow() - timedelta(days=1)
-        active_today = db.query(User).filter(User.last_login >= one_day_ago).count()
-        
-        return templates.TemplateResponse("admin/dashboard.html", {
-            "request": request,
-            "user": user,
-            "total_users": total_users,
-            "last_login_eastern": last_login_eastern,
-            "suspended_count": suspended_count,
-            "recent_signups": recent_signups,
-            "active_today": active_today,
-            "success": success,
+# ----- Admin stats rollup -----
+# Mapper events feed admin_stats / admin_stats_daily, so every code path that
+# adds a user, flips a suspension, reviews an appeal or (un)bans an IP is
+# covered without a call at each site. The events insert admin_stat_deltas
+# rows in the same transaction as the change, so a delta exists exactly when
+# its change committed, and admin_stats_rollup folds them in every
+# ADMIN_STATS_FLUSH_SECONDS; requests never queue on the admin_stats /
+# admin_stats_daily[today] rows. Bulk Core/Query updates bypass the events;
+# the periodic reconciliation, run by one process at a time, corrects that.
+ADMIN_STAT_KEYS = ("total_users", "suspended_users", "pending_appeals", "active_ip_bans")
+ADMIN_STATS_RECONCILE_SECONDS = int(os.getenv("ADMIN_STATS_RECONCILE_SECONDS", 900))
+ADMIN_STATS_FLUSH_SECONDS = float(os.getenv("ADMIN_STATS_FLUSH_SECONDS", 5))
+ADMIN_STATS_ROLLUP_BATCH_SIZE = 5000
+# pg_try_advisory_xact_lock key held by whichever process is reconciling
+ADMIN_STATS_RECONCILE_LOCK_ID = 7402113
+
+def _upsert(connection, model, index_column: str, values: dict, increments: dict = None, overwrite: dict = None):
+    """INSERT ... ON CONFLICT for Postgres and SQLite"""
+    dialect_insert = postgresql_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    stmt = dialect_insert(model).values(**values)
+    set_ = {name: getattr(model, name) + delta for name, delta in (increments or {}).items()}
+    set_.update(overwrite or {})
+    connection.execute(stmt.on_conflict_do_update(index_elements=[index_column], set_=set_))
+
+class AdminStatRollup:
+    """Folds committed admin_stat_deltas into the rollup tables"""
+
+    def __init__(self, flush_seconds: float, batch_size: int = ADMIN_STATS_ROLLUP_BATCH_SIZE):
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self._task = None
+        self.rolled_up = 0
+        self.failed_flushes = 0
+
+    def roll_up(self, db: Session) -> int:
+        """Move deltas into the rollup in db's transaction; the caller commits.
+        Deltas locked by another process's rollup are left to it."""
+        total = 0
+        while True:
+            batch = (
+                select(AdminStatDelta.id)
+                .order_by(AdminStatDelta.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = db.execute(
+                delete(AdminStatDelta)
+                .where(AdminStatDelta.id.in_(batch))
+                .returning(AdminStatDelta.key, AdminStatDelta.day, AdminStatDelta.delta)
+                .execution_options(synchronize_session=False)
+            ).all()
+            stats = Counter()
+            by_day = {}
+            for key, day, delta in rows:
+                if day is None:
+                    stats[key] += delta
+                else:
+                    by_day.setdefault(day, Counter())[key] += delta
+
+            connection = db.connection()
+            now = datetime.utcnow()
+            # Sorted so concurrent writers lock rows in the same order
+            for key in sorted(stats):
+                _upsert(connection, AdminStat, "key",
+                        {"key": key, "value": stats[key], "updated_at": now},
+                        increments={"value": stats[key]}, overwrite={"updated_at": now})
+            for day in sorted(by_day):
+                _upsert(connection, AdminStatsDaily, "day", {"day": day, **by_day[day]}, increments=dict(by_day[day]))
+            total += len(rows)
+            if len(rows) < self.batch_size:
+                return total
+
+    def flush(self) -> int:
+        db = SessionLocal()
+        try:
+            rolled_up = self.roll_up(db)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.failed_flushes += 1
+            print(f"❌ Admin stats rollup failed, will retry: {e}")
+            return 0
+        finally:
+            db.close()
+        self.rolled_up += rolled_up
+        return rolled_up
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"❌ Admin stats rollup error: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self):
+        return {"rolled_up": self.rolled_up, "failed_flushes": self.failed_flushes}
+
+admin_stats_rollup = AdminStatRollup(ADMIN_STATS_FLUSH_SECONDS)
+
+def bump_admin_stat(connection, key: str, delta: int):
+    if delta:
+        connection.execute(insert(AdminStatDelta).values(key=key, delta=delta))
+
+def bump_admin_daily(connection, day: date, column: str, delta: int = 1):
+    if delta:
+        connection.execute(insert(AdminStatDelta).values(key=column, day=day, delta=delta))
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+# The deltas need the value being replaced even when the attribute was
+# expired by an earlier commit, so make these attributes load it on set
+for _tracked_attribute in (User.is_suspended, User.last_login, SuspensionAppeal.status, IPban.is_active):
+    sqlalchemy_event.listen(_tracked_attribute, "set", _load_previous_value, active_history=True, retval=True)
+
+def _attribute_change(target, name: str):
+    """(old, new) if the attribute changed in this flush, else None"""
+    history = inspect(target).attrs[name].history
+    if not history.has_changes():
+        return None
+    return (history.deleted[0] if history.deleted else None,
+            history.added[0] if history.added else None)
+
+@sqlalchemy_event.listens_for(User, "after_insert")
+def _stats_user_inserted(mapper, connection, target):
+    bump_admin_stat(connection, "total_users", 1)
+    bump_admin_stat(connection, "suspended_users", int(bool(target.is_suspended)))
+    bump_admin_daily(connection, (target.created_at or datetime.utcnow()).date(), "signups")
+    if target.last_login:
+        bump_admin_daily(connection, target.last_login.date(), "active_users")
+
+@sqlalchemy_event.listens_for(User, "after_update")
+def _stats_user_updated(mapper, connection, target):
+    suspended = _attribute_change(target, "is_suspended")
+    if suspended:
+        bump_admin_stat(connection, "suspended_users", int(bool(suspended[1])) - int(bool(suspended[0])))
+    last_login = _attribute_change(target, "last_login")
+    if last_login and last_login[1] and (last_login[0] is None or last_login[0].date() < last_login[1].date()):
+        # First login of the day for this user
+        bump_admin_daily(connection, last_login[1].date(), "active_users")
+
+@sqlalchemy_event.listens_for(User, "after_delete")
+def _stats_user_deleted(mapper, connection, target):
+    bump_admin_stat(connection, "total_users", -1)
+    bump_admin_stat(connection, "suspended_users", -int(bool(target.is_suspended)))
+    # Daily figures count current users, matching what reconciliation recounts
+    if target.created_at:
+        bump_admin_daily(connection, target.created_at.date(), "signups", -1)
+    if target.last_login:
+        bump_admin_daily(connection, target.last_login.date(), "active_users", -1)
+
+@sqlalchemy_event.listens_for(SuspensionAppeal, "after_insert")
+def _stats_appeal_inserted(mapper, connection, target):
+    bump_admin_stat(connection, "pending_appeals", int((target.status or "pending") == "pending"))
+
+@sqlalchemy_event.listens_for(SuspensionAppeal, "after_update")
+def _stats_appeal_updated(mapper, connection, target):
+    status_change = _attribute_change(target, "status")
+    if status_change:
+        old, new = status_change
+        bump_admin_stat(connection, "pending_appeals", int(new == "pending") - int(old == "pending"))
+
+@sqlalchemy_event.listens_for(SuspensionAppeal, "after_delete")
+def _stats_appeal_deleted(mapper, connection, target):
+    bump_admin_stat(connection, "pending_appeals", -int(target.status == "pending"))
+
+@sqlalchemy_event.listens_for(IPban, "after_insert")
+def _stats_ip_ban_inserted(mapper, connection, target):
+    bump_admin_stat(connection, "active_ip_bans", int(target.is_active is not False))
+
+@sqlalchemy_event.listens_for(IPban, "after_update")
+def _stats_ip_ban_updated(mapper, connection, target):
+    active = _attribute_change(target, "is_active")
+    if active:
+        bump_admin_stat(connection, "active_ip_bans", int(bool(active[1])) - int(bool(active[0])))
+
+@sqlalchemy_event.listens_for(IPban, "after_delete")
+def _stats_ip_ban_deleted(mapper, connection, target):
+    bump_admin_stat(connection, "active_ip_bans", -int(bool(target.is_active)))
+
+def reconcile_admin_stats(db: Session) -> Optional[dict]:
+    """Recount everything from the source tables and overwrite the rollup.
+    Returns the drift that was corrected, keyed by stat, or None when
+    another process is already reconciling."""
+    if db.get_bind().dialect.name == "postgresql":
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:lock_id)"),
+                          {"lock_id": ADMIN_STATS_RECONCILE_LOCK_ID}).scalar():
+            db.rollback()
+            return None
+        # Waits for transactions that already inserted deltas to commit and
+        # holds off new ones until we commit, so the recount below sees
+        # exactly the changes whose deltas were folded in first. Writers
+        # stall for the length of the recount.
+        db.execute(text("LOCK TABLE admin_stat_deltas IN EXCLUSIVE MODE"))
+    admin_stats_rollup.roll_up(db)
+    now = datetime.utcnow()
+    today = now.date()
+    actual = {
+        "total_users": db.query(func.count(User.id)).scalar(),
+        "suspended_users": db.query(func.count(User.id)).filter(User.is_suspended == True).scalar(),
+        "pending_appeals": db.query(func.count(SuspensionAppeal.id)).filter(SuspensionAppeal.status == "pending").scalar(),
+        "active_ip_bans": db.query(func.count(IPban.id)).filter(IPban.is_active == True).scalar()
+    }
+    current = {row.key: row.value for row in db.query(AdminStat).all()}
+    drift = {key: value - current[key] for key, value in actual.items() if key in current and current[key] != value}
+
+    connection = db.connection()
+    for key, value in actual.items():
+        _upsert(connection, AdminStat, "key",
+                {"key": key, "value": value, "updated_at": now},
+                overwrite={"value": value, "updated_at": now})
+
+    # Signups for the last week can be recounted exactly from created_at;
+    # so can today's active users, since anyone active today has last_login today
+    week_start = today - timedelta(days=7)
+    signup_day = func.date(User.created_at)
+    signups = {
+        date.fromisoformat(str(day)[:10]): count
+        for day, count in db.query(signup_day, func.count(User.id))
+        .filter(User.created_at >= datetime.combine(week_start, datetime.min.time()))
+        .group_by(signup_day).all()
+    }
+    for offset in range(8):
+        day = week_start + timedelta(days=offset)
+        _upsert(connection, AdminStatsDaily, "day",
+                {"day": day, "signups": signups.get(day, 0)},
+                overwrite={"signups": signups.get(day, 0)})
+
+    active_today = db.query(func.count(User.id)).filter(
+        User.last_login >= datetime.combine(today, datetime.min.time())
+    ).scalar()
+    _upsert(connection, AdminStatsDaily, "day",
+            {"day": today, "active_users": active_today, **actual},
+            overwrite={"active_users": active_today, **actual})
+    db.commit()
+
+    if drift:
+        print(f"⚠️ Admin stats drift corrected: {drift}")
+    return drift
+
+def get_admin_stats(db: Session) -> dict:
+    """Dashboard numbers from the rollup: a handful of primary-key reads"""
+    stats = {row.key: row.value for row in db.query(AdminStat).all()}
+    if any(key not in stats for key in ADMIN_STAT_KEYS):
+        # First run before the reconciler has seeded the rollup; db may be a
+        # replica session, so seed through the primary
+        primary = SessionLocal()
+        try:
+            reconcile_admin_stats(primary)
+            # Zeros if another process is still seeding it
+            stats = {key: 0 for key in ADMIN_STAT_KEYS}
+            stats.update({row.key: row.value for row in primary.query(AdminStat).all()})
+        finally:
+            primary.close()
+
+    today = datetime.utcnow().date()
+    stats["recent_signups"] = db.query(func.coalesce(func.sum(AdminStatsDaily.signups), 0)).filter(
+        AdminStatsDaily.day > today - timedelta(days=7)
+    ).scalar()
+    # A rolling 24 hours like before the rollup, not the calendar day that
+    # admin_stats_daily.active_users counts; an index range scan on last_login
+    stats["active_today"] = db.query(func.count(User.id)).filter(
+        User.last_login >= datetime.utcnow() - timedelta(hours=24)
+    ).scalar()
+    return stats
+
+async def reconcile_admin_stats_periodically():
+    def run_once():
+        db = SessionLocal()
+        try:
+            reconcile_admin_stats(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            await asyncio.to_thread(run_once)
+        except Exception as e:
+            print(f"❌ Admin stats reconciliation failed: {e}")
+        await asyncio.sleep(ADMIN_STATS_RECONCILE_SECONDS)
+
+@app.on_event("startup")
+async def start_admin_stats_reconciler():
+    admin_stats_rollup.start()
+    asyncio.create_task(reconcile_admin_stats_periodically())
+
+@app.on_event("shutdown")
+async def stop_admin_stats_rollup():
+    await admin_stats_rollup.stop()
+
+@app.get("/admin")
+async def admin_dashboard(
+    request: Request,
+    user: User = Depends(get_admin_user),
+    success: str = Query(None),
+    error: str = Query(None),
+    db: Session = Depends(get_read_db)
+):
+    print("The admin has arrived!")
+    """Admin dashboard page"""
+    try:
+        if not user or not is_admin_user(user):
+            raise HTTPException(status_code=404, detail="Page not found")
+        
+        last_login_eastern = convert_to_eastern(user.last_login) if user.last_login else None
+        
+        stats = get_admin_stats(db)
+        
+        return templates.TemplateResponse("admin/dashboard.html", {
+            "request": request,
+            "user": user,
+            "total_users": stats["total_users"],
+            "last_login_eastern": last_login_eastern,
+            "suspended_count": stats["suspended_users"],
+            "recent_signups": stats["recent_signups"],
+            "active_today": stats["active_today"],
+            "success": success,
             "error": error
         })
         
@@ -4046,97 +6200,389 @@ async def admin_dashboard(
 @app.get("/admin/dashboard", response_class=HTMLResponse)
 def admin_dashboard_updated(
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     admin_user = Depends(get_admin_user)
 ):
     """Enhanced admin dashboard with suspension appeals and IP bans"""
     
-    # Get user statistics
-    total_users = db.query(User).count()
-    suspended_count = db.query(User).filter(User.is_suspended == True).count()
-    recent_signups = db.query(User).filter(
-        User.created_at > datetime.utcnow() - timedelta(days=7)
-    ).count()
-    active_today = db.query(User).filter(
-        User.last_login > datetime.utcnow() - timedelta(hours=24)
-    ).count()
-    
-    # Get pending appeals
-    pending_appeals = db.query(SuspensionAppeal).filter(
-        SuspensionAppeal.status == "pending"
-    ).count()
-    
-    # Get active IP bans
-    active_ip_bans = db.query(IPban).filter(IPban.is_active == True).count()
-    last_login_eastern = convert_to_eastern(User.last_login) if User.last_login else None
+    stats = get_admin_stats(db)
+    last_login_eastern = convert_to_eastern(admin_user.last_login) if admin_user.last_login else None
     
     return templates.TemplateResponse("admin/dashboard.html", {
         "request": request,
         "user": admin_user,
-        "total_users": total_users,
-        "suspended_count": suspended_count,
-        "recent_signups": recent_signups,
-        "active_today": active_today,
+        "total_users": stats["total_users"],
+        "suspended_count": stats["suspended_users"],
+        "recent_signups": stats["recent_signups"],
+        "active_today": stats["active_today"],
         "last_login_eastern": last_login_eastern,
-        "pending_appeals": pending_appeals,
-        "active_ip_bans": active_ip_bans
+        "pending_appeals": stats["pending_appeals"],
+        "active_ip_bans": stats["active_ip_bans"]
     })
 
+# Sort options for the admin user listing: key -> (expression, cursor value type).
+# NULLs are coalesced so the keyset comparison stays a simple row comparison.
+ADMIN_USERS_EPOCH = datetime(1970, 1, 1)
+ADMIN_USER_SORTS = {
+    "created_at": (func.coalesce(User.created_at, ADMIN_USERS_EPOCH), "datetime"),
+    "last_login": (func.coalesce(User.last_login, ADMIN_USERS_EPOCH), "datetime"),
+    "username": (func.coalesce(User.username, ""), "str"),
+    "total_tweets": (User.tweet_count, "int")
+}
+
+def encode_admin_users_cursor(value, user_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, user_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_admin_users_cursor(cursor: str, value_type: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, user_id = json.loads(raw)
+        if value_type == "datetime":
+            value = datetime.fromisoformat(value)
+        elif value_type == "int":
+            value = int(value)
+        elif value_type == "search":
+            # Matched value in the prefix tier, score in the substring tier
+            if not isinstance(value, (str, int)):
+                raise ValueError
+        else:
+            value = str(value)
+        return value, int(user_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def fetch_admin_users_page(db: Session, limit: int = 100, sort: str = "created_at",
+                           order: str = "desc", cursor: str = None):
+    """One page of the admin user listing in a single query.
+
+    Tweet counts are read from users.tweet_count, so sorting by them is a
+    keyset scan of ix_users_tweet_count. Returns (users_data, next_cursor).
+    """
+    sort_expr, value_type = ADMIN_USER_SORTS[sort]
+    descending = order == "desc"
+
+    query = db.query(User, sort_expr.label("sort_value"))
+    if cursor:
+        cursor_value, cursor_id = decode_admin_users_cursor(cursor, value_type)
+        keyset = tuple_(sort_expr, User.id)
+        bound = tuple_(cursor_value, cursor_id)
+        query = query.filter(keyset < bound if descending else keyset > bound)
+
+    rows = query.order_by(
+        sort_expr.desc() if descending else sort_expr.asc(),
+        User.id.desc() if descending else User.id.asc()
+    ).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_admin_users_cursor(last.sort_value, last.User.id)
+
+    now = datetime.utcnow()
+    users_data = [serialize_admin_user(user, now) for user, _ in rows]
+    return users_data, next_cursor
+
+def serialize_admin_user(user: User, now: datetime) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "plan": user.plan or "free",
+        "is_active": user.is_active,
+        "is_suspended": user.is_suspended,
+        "suspension_reason": user.suspension_reason,
+        "suspended_at": user.suspended_at.isoformat() if user.suspended_at else None,
+        "suspended_at_eastern": convert_to_eastern(user.suspended_at),
+        "suspended_by": user.suspended_by,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        "created_at_eastern": convert_to_eastern(user.created_at),
+        "last_login": user.last_login.isoformat() if user.last_login else None,
+        "last_login_eastern": convert_to_eastern(user.last_login),
+        "total_tweets": user.tweet_count or 0,
+        "last_known_ip": user.last_known_ip,
+        "registration_ip": user.registration_ip,
+        "is_ip_banned": user.is_ip_banned or False,
+        "failed_login_attempts": user.failed_login_attempts or 0,
+        "account_locked": bool(user.account_locked_until and user.account_locked_until > now)
+    }
+
+# ----- Admin user search -----
+# Postgres searches lower(column) through the prefix indexes, btrees on
+# (lower(column) COLLATE "C", id), and the trigram (gin_trgm_ops) indexes
+# declared on User. Other databases (SQLite in development) use
+# UserSearchIndex, an in-process equivalent.
+#
+# Results come as [(key, user_id)], best first. Users with a field starting
+# with the term come first, ordered by their smallest such value (an exact
+# match sorts before its extensions), keyed by that value. Users matching
+# only inside a field follow, keyed by their search_match_score.
+ADMIN_SEARCH_FIELDS = ("username", "email", "last_known_ip", "registration_ip")
+ADMIN_SEARCH_MIN_TERM = 3  # trigrams need 3 characters
+ADMIN_SEARCH_SUBSTRING_TIER = 2000
+ADMIN_SEARCH_NO_MATCH = 1000000
+
+def search_match_score(value: str, term: str):
+    """Rank of one field against a lowercased term, lower is better: exact,
+    then prefix, then substring, shorter values first within each tier.
+    None if the field doesn't match. search_match_score_sql is the SQL twin."""
+    if not value:
+        return None
+    value = value.lower()
+    if value == term:
+        return 0
+    if value.startswith(term):
+        return 1000 + len(value)
+    if term in value:
+        return ADMIN_SEARCH_SUBSTRING_TIER + len(value)
+    return None
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_match_score_sql(column, term: str):
+    lowered = func.lower(column)
+    pattern = escape_like(term)
+    return case(
+        (lowered == term, 0),
+        (lowered.like(f"{pattern}%", escape="\\"), 1000 + func.length(lowered)),
+        (lowered.like(f"%{pattern}%", escape="\\"), ADMIN_SEARCH_SUBSTRING_TIER + func.length(lowered)),
+        else_=ADMIN_SEARCH_NO_MATCH,
+    )
+
+def _search_prefix_sql(db: Session, term: str, limit: int, after: tuple):
+    """Prefix tier: one bounded scan of each field's prefix index, in
+    index order, combined with UNION ALL. A user's key is their smallest
+    matching value over all fields, so candidates are re-keyed before
+    ranking. A scan that filled its limit only vouches for keys up to its
+    last row; past that the scans are repeated with a larger limit."""
+    pattern = f"{escape_like(term)}%"
+    keys = [func.lower(getattr(User, field)).collate("C") for field in ADMIN_SEARCH_FIELDS]
+    fetch = limit
+    while True:
+        scans = []
+        for n, key in enumerate(keys):
+            scan = select(literal(n).label("field"), key.label("key"), User.id).where(key.like(pattern, escape="\\"))
+            if after:
+                scan = scan.where(tuple_(key, User.id) > tuple_(*after))
+            scans.append(scan.order_by(key, User.id).limit(fetch))
+        rows = db.execute(union_all(*scans)).all()
+
+        last = {}
+        for field, key, user_id in rows:
+            last[field] = max(last.get(field, (key, user_id)), (key, user_id))
+        counts = Counter(field for field, _, _ in rows)
+        full = [last[field] for field in counts if counts[field] == fetch]
+        settled_up_to = min(full) if full else None
+
+        user_ids = {user_id for _, _, user_id in rows}
+        best = func.least(*[case((key.like(pattern, escape="\\"), key)) for key in keys])
+        ranked = sorted(
+            (key, user_id)
+            for user_id, key in db.execute(select(User.id, best).where(User.id.in_(user_ids))).all()
+            if key is not None and (not after or (key, user_id) > after)
+            and (settled_up_to is None or (key, user_id) <= settled_up_to)
+        ) if user_ids else []
+        if len(ranked) >= limit or settled_up_to is None:
+            return ranked[:limit]
+        fetch *= 2
+
+def _search_substring_sql(db: Session, term: str, limit: int, after: tuple):
+    """Substring tier: users with no prefix match, through the trigram indexes"""
+    least = func.least if db.get_bind().dialect.name == "postgresql" else func.min
+    score = least(*[search_match_score_sql(getattr(User, field), term) for field in ADMIN_SEARCH_FIELDS])
+    pattern = f"%{escape_like(term)}%"
+    query = db.query(score, User.id).filter(
+        or_(*[func.lower(getattr(User, field)).like(pattern, escape="\\") for field in ADMIN_SEARCH_FIELDS]),
+        tuple_(score, User.id) > tuple_(*after),
+    )
+    return [tuple(row) for row in query.order_by(score, User.id).limit(limit).all()]
+
+def search_users_sql(db: Session, term: str, limit: int, after: tuple = None):
+    """[(key, user_id)] best first, see above. Prefix matches always
+    outrank substring matches, so the trigram pass only runs when the
+    prefix pass can't fill the page."""
+    in_prefix_tier = not after or isinstance(after[0], str)
+    ranked = _search_prefix_sql(db, term, limit, after) if in_prefix_tier else []
+    if len(ranked) < limit:
+        substring_after = (ADMIN_SEARCH_SUBSTRING_TIER, 0) if in_prefix_tier else after
+        ranked += _search_substring_sql(db, term, limit - len(ranked), substring_after)
+    return ranked
+
+def _trigrams(value: str) -> set:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+class UserSearchIndex:
+    """In-process search index over ADMIN_SEARCH_FIELDS for databases
+    without pg_trgm. A sorted list of (value, user id) answers prefix
+    lookups by bisection and a trigram -> user ids map narrows substring
+    lookups. Built from the users table on first search, then kept current
+    by User mapper events. Meant for single-process development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built = False
+        self._values = {}
+        self._sorted = []
+        self._trigrams = {}
+
+    def _add(self, user_id: int, values, keep_sorted: bool = True):
+        values = tuple(value.lower() if value else None for value in values)
+        self._values[user_id] = values
+        for value in set(filter(None, values)):
+            if keep_sorted:
+                bisect.insort(self._sorted, (value, user_id))
+            else:
+                self._sorted.append((value, user_id))
+            for trigram in _trigrams(value):
+                self._trigrams.setdefault(trigram, set()).add(user_id)
+
+    def _remove(self, user_id: int):
+        values = self._values.pop(user_id, None)
+        for value in set(filter(None, values or ())):
+            i = bisect.bisect_left(self._sorted, (value, user_id))
+            if i < len(self._sorted) and self._sorted[i] == (value, user_id):
+                del self._sorted[i]
+            for trigram in _trigrams(value):
+                ids = self._trigrams.get(trigram)
+                if ids is not None:
+                    ids.discard(user_id)
+                    if not ids:
+                        del self._trigrams[trigram]
+
+    def build(self, db: Session):
+        rows = db.query(User.id, *[getattr(User, field) for field in ADMIN_SEARCH_FIELDS]).all()
+        with self._lock:
+            self._values, self._sorted, self._trigrams = {}, [], {}
+            for user_id, *values in rows:
+                self._add(user_id, values, keep_sorted=False)
+            self._sorted.sort()
+            self._built = True
+
+    def update(self, user: User):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(user.id)
+            self._add(user.id, [getattr(user, field) for field in ADMIN_SEARCH_FIELDS])
+
+    def remove(self, user_id: int):
+        if not self._built:
+            return
+        with self._lock:
+            self._remove(user_id)
+
+    def _rank(self, user_ids, term: str, limit: int, after: tuple):
+        ranked = []
+        for user_id in user_ids:
+            scores = [s for s in (search_match_score(v, term) for v in self._values[user_id]) if s is not None]
+            if scores and (min(scores), user_id) > after:
+                ranked.append((min(scores), user_id))
+        return heapq.nsmallest(limit, ranked)
+
+    def search(self, db: Session, term: str, limit: int, after: tuple = None):
+        """Same contract as search_users_sql"""
+        if not self._built:
+            self.build(db)
+        after = tuple(after) if after else None
+        in_prefix_tier = not after or isinstance(after[0], str)
+        with self._lock:
+            prefix_keys = {}
+            i = bisect.bisect_left(self._sorted, (term,))
+            while i < len(self._sorted) and self._sorted[i][0].startswith(term):
+                value, user_id = self._sorted[i]
+                prefix_keys.setdefault(user_id, value)  # sorted, so the user's smallest
+                i += 1
+            ranked = []
+            if in_prefix_tier:
+                ranked = heapq.nsmallest(limit, [
+                    (value, user_id) for user_id, value in prefix_keys.items()
+                    if not after or (value, user_id) > after
+                ])
+            if len(ranked) < limit:
+                posting_lists = sorted((self._trigrams.get(t, set()) for t in _trigrams(term)), key=len)
+                substring_ids = set.intersection(*posting_lists) - set(prefix_keys)
+                substring_after = (ADMIN_SEARCH_SUBSTRING_TIER, 0) if in_prefix_tier else after
+                ranked += self._rank(substring_ids, term, limit - len(ranked), substring_after)
+        return ranked
+
+user_search_index = UserSearchIndex()
+
+@sqlalchemy_event.listens_for(User, "after_insert")
+@sqlalchemy_event.listens_for(User, "after_update")
+def _search_index_user_saved(mapper, connection, target):
+    user_search_index.update(target)
+
+@sqlalchemy_event.listens_for(User, "after_delete")
+def _search_index_user_deleted(mapper, connection, target):
+    user_search_index.remove(target.id)
+
+def search_admin_users(db: Session, q: str, limit: int = 50, cursor: str = None):
+    """Ranked admin user search over username, email and both IPs.
+    Returns (users_data, next_cursor); each user carries its match_rank."""
+    term = q.strip().lower()
+    if len(term) < ADMIN_SEARCH_MIN_TERM:
+        raise ValueError(f"Search term must be at least {ADMIN_SEARCH_MIN_TERM} characters")
+    after = decode_admin_users_cursor(cursor, "search") if cursor else None
+
+    if db.get_bind().dialect.name == "postgresql":
+        ranked = search_users_sql(db, term, limit + 1, after)
+    else:
+        ranked = user_search_index.search(db, term, limit + 1, after)
+
+    next_cursor = None
+    if len(ranked) > limit:
+        ranked = ranked[:limit]
+        next_cursor = encode_admin_users_cursor(*ranked[-1])
+
+    user_ids = [user_id for _, user_id in ranked]
+    rows = db.query(User).filter(User.id.in_(user_ids)).all() if user_ids else []
+    by_id = {user.id: user for user in rows}
+
+    now = datetime.utcnow()
+    users_data = []
+    for _, user_id in ranked:
+        if user_id in by_id:  # may have been deleted since it was ranked
+            user = by_id[user_id]
+            scores = [search_match_score(getattr(user, field), term) for field in ADMIN_SEARCH_FIELDS]
+            match_rank = min((score for score in scores if score is not None), default=None)
+            users_data.append({**serialize_admin_user(user, now), "match_rank": match_rank})
+    return users_data, next_cursor
+
 @app.get("/admin/api/users")
 def get_users_admin_api(
     request: Request,
-    limit: int = Query(100, le=500),
-    db: Session = Depends(get_db),
+    limit: int = Query(100, ge=1, le=500),
+    sort: str = Query("created_at"),
+    order: str = Query("desc"),
+    cursor: str = Query(None),
+    db: Session = Depends(get_read_db),
     admin_user = Depends(get_admin_user)
 ):
     """API endpoint to get users with enhanced info including IPs"""
+    if sort not in ADMIN_USER_SORTS or order not in ("asc", "desc"):
+        return JSONResponse({
+            "success": False,
+            "error": f"sort must be one of {', '.join(ADMIN_USER_SORTS)} and order asc or desc"
+        }, status_code=400)
+    
     try:
-        # Get users with their data
-        users = db.query(User).order_by(User.created_at.desc()).limit(limit).all()
-        
-        users_data = []
-        for user in users:
-            # Calculate statistics
-            total_tweets = db.query(GeneratedTweet).filter(
-                GeneratedTweet.user_id == user.id
-            ).count()
-            
-            # Format dates in Eastern Time
-            created_at_eastern = convert_to_eastern(user.created_at) if user.created_at else None
-            last_login_eastern = convert_to_eastern(user.last_login) if user.last_login else None
-            suspended_at_eastern = convert_to_eastern(user.suspended_at) if hasattr(user, 'suspended_at') and user.suspended_at else None
-            
-            user_data = {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "plan": user.plan or "free",
-                "is_active": user.is_active,
-                "is_suspended": user.is_suspended,
-                "suspension_reason": user.suspension_reason,
-                "suspended_at": user.suspended_at.isoformat() if user.suspended_at else None,
-                "suspended_at_eastern": suspended_at_eastern,
-                "suspended_by": user.suspended_by,
-                "created_at": user.created_at.isoformat() if user.created_at else None,
-                "created_at_eastern": created_at_eastern,
-                "last_login": user.last_login.isoformat() if user.last_login else None,
-                "last_login_eastern": last_login_eastern,
-                "total_tweets": total_tweets,
-                "last_known_ip": getattr(user, 'last_known_ip', None),
-                "registration_ip": getattr(user, 'registration_ip', None),
-                "is_ip_banned": getattr(user, 'is_ip_banned', False),
-                "failed_login_attempts": getattr(user, 'failed_login_attempts', 0),
-                "account_locked": bool(getattr(user, 'account_locked_until', None) and user.account_locked_until > datetime.utcnow())
-
-            }
-            users_data.append(user_data)
+        users_data, next_cursor = fetch_admin_users_page(db, limit, sort, order, cursor)
         
         return JSONResponse({
             "success": True,
             "users": users_data,
-            "total": len(users_data)
+            "total": len(users_data),
+            "next_cursor": next_cursor
         })
         
+    except ValueError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=400)
     except Exception as e:
         print(f"Error fetching users: {e}")
         return JSONResponse({
@@ -4144,6 +6590,38 @@ def get_users_admin_api(
             "error": str(e)
         }, status_code=500)
     
+@app.get("/admin/api/users/search")
+def search_users_admin_api(
+    request: Request,
+    q: str = Query(..., min_length=ADMIN_SEARCH_MIN_TERM, max_length=320),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str = Query(None),
+    db: Session = Depends(get_read_db),
+    admin_user = Depends(get_admin_user)
+):
+    """Search users by username, email, last known IP or registration IP"""
+    try:
+        users_data, next_cursor = search_admin_users(db, q, limit, cursor)
+        
+        return JSONResponse({
+            "success": True,
+            "users": users_data,
+            "total": len(users_data),
+            "next_cursor": next_cursor
+        })
+        
+    except ValueError as e:
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=400)
+    except Exception as e:
+        print(f"Error searching users: {e}")
+        return JSONResponse({
+            "success": False,
+            "error": str(e)
+        }, status_code=500)
+
 @app.get("/admin/api/ip-bans")
 def get_ip_bans(admin: User = Depends(get_admin_user), db: Session = Depends(get_db)):
     """Get all active IP bans (API endpoint)"""
@@ -4211,11 +6689,284 @@ def admin_health_check(admin: User = Depends(get_admin_user)):
             "status": "healthy",
             "user_count": user_count,
             "recent_errors": recent_errors,
+            "tweet_buffer": tweet_buffer.stats(),
+            "admin_stats": admin_stats_rollup.stats(),
+            "activity_queue": activity_queue.stats(),
+            "activity_bus": activity_bus.stats(),
+            "smtp_pool": email_service.transport.stats(),
+            "email_outbox": email_outbox.stats(),
+            "email_scheduler": scheduled_email_dispatcher.stats(),
+            "email_domains": email_domain_validator.stats(),
+            "email_suppressions": email_suppressions.stats(),
+            "stripe_events": stripe_event_processor.stats(),
+            "subscription_sweeper": subscription_expiry_sweeper.stats(),
+            "recaptcha": recaptcha_verifier.stats(),
             "timestamp": datetime.utcnow()
         }
     finally:
         db.close()
 
+@app.get("/admin/api/db-pool")
+def admin_db_pool_stats(admin: User = Depends(get_admin_user)):
+    """Connection pool telemetry: checkouts, wait/hold histograms and leaks"""
+    return {
+        "pools": [db_pool_telemetry.snapshot(), async_pool_telemetry.snapshot()],
+        "replica": replica_router.status(),
+        "leak_threshold_seconds": DB_LEAK_THRESHOLD_SECONDS,
+        "timestamp": datetime.utcnow()
+    }
+
+@app.get("/admin/api/email-outbox")
+def admin_email_outbox(
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
+):
+    """Outbox depth by status, age of the oldest pending email and recent dead letters"""
+    counts = dict(db.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all())
+    oldest_pending = db.query(func.min(EmailOutbox.created_at)).filter(EmailOutbox.status == "pending").scalar()
+    dead = db.query(EmailOutbox).filter(EmailOutbox.status == "dead").order_by(
+        EmailOutbox.created_at.desc()
+    ).limit(50).all()
+    return {
+        "counts": {status_name: counts.get(status_name, 0) for status_name in ["pending", "sending", "sent", "dead", "suppressed"]},
+        "oldest_pending_seconds": (datetime.utcnow() - oldest_pending).total_seconds() if oldest_pending else None,
+        "dispatcher": email_outbox.stats(),
+        "dead_letters": [
+            {
+                "id": row.id,
+                "email_type": row.email_type,
+                "to_email": row.to_email,
+                "subject": row.subject,
+                "attempts": row.attempts,
+                "last_error": row.last_error,
+                "created_at": row.created_at
+            }
+            for row in dead
+        ],
+        "timestamp": datetime.utcnow()
+    }
+
+@app.post("/admin/api/email-outbox/{email_id}/retry")
+def admin_retry_outbox_email(email_id: int, admin: User = Depends(get_admin_user)):
+    """Put a dead-lettered email back in the queue with a fresh set of attempts"""
+    db = SessionLocal()
+    try:
+        updated = db.query(EmailOutbox).filter(
+            EmailOutbox.id == email_id,
+            EmailOutbox.status == "dead"
+        ).update({
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow(),
+            "last_error": None
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if not updated:
+        return JSONResponse({"success": False, "message": "No dead-lettered email with that id"}, status_code=404)
+    email_outbox.wake()
+    return {"success": True}
+
+EMAIL_FEEDBACK_SECRET = os.getenv("EMAIL_FEEDBACK_SECRET")
+
+def parse_email_feedback_event(event: dict) -> Optional[tuple]:
+    """(email, reason) for a provider bounce/complaint event, or None for
+    events that shouldn't suppress anything (soft bounces, deliveries)"""
+    email = event.get("email") or event.get("recipient")
+    kind = (event.get("type") or event.get("event") or "").lower()
+    if not email or "@" not in email:
+        return None
+    if kind in ("complaint", "spamreport", "spam_report"):
+        return email, "complaint"
+    if kind in ("bounce", "bounced", "hard_bounce"):
+        bounce_type = (event.get("bounce_type") or "hard").lower()
+        if kind == "hard_bounce" or bounce_type in ("hard", "permanent"):
+            return email, "hard_bounce"
+    return None
+
+@app.post("/email-feedback")
+async def email_feedback_webhook(request: Request):
+    """Bounce and complaint notifications from the mail provider, as
+    {"source": "...", "events": [{"email", "type", "bounce_type", "detail"}]}
+    with the shared secret as a bearer token"""
+    token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not EMAIL_FEEDBACK_SECRET or not secrets.compare_digest(token, EMAIL_FEEDBACK_SECRET):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    try:
+        payload = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Invalid payload"}, status_code=400)
+    events = payload.get("events", []) if isinstance(payload, dict) else payload
+    source = payload.get("source", "webhook") if isinstance(payload, dict) else "webhook"
+    if not isinstance(events, list):
+        return JSONResponse({"error": "Invalid payload"}, status_code=400)
+
+    suppress = []
+    for event in events:
+        parsed = parse_email_feedback_event(event) if isinstance(event, dict) else None
+        if parsed:
+            suppress.append((*parsed, event.get("detail")))
+
+    def store():
+        db = SessionLocal()
+        try:
+            for email, reason, detail in suppress:
+                email_suppressions.add(db, email, reason, source, detail)
+            db.commit()
+        finally:
+            db.close()
+
+    if suppress:
+        await asyncio.to_thread(store)
+    return {"received": len(events), "suppressed": len(suppress)}
+
+@app.get("/admin/api/email-suppressions")
+def admin_email_suppressions(
+    q: Optional[str] = Query(None, max_length=320),
+    limit: int = Query(100, ge=1, le=500),
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
+):
+    """Recently suppressed addresses, optionally filtered by an address prefix"""
+    query = db.query(EmailSuppression)
+    if q:
+        query = query.filter(EmailSuppression.email.startswith(q.strip().lower(), autoescape=True))
+    rows = query.order_by(EmailSuppression.created_at.desc()).limit(limit).all()
+    counts = dict(db.query(EmailSuppression.reason, func.count()).group_by(EmailSuppression.reason).all())
+    return {
+        "counts": {reason: counts.get(reason, 0) for reason in EMAIL_SUPPRESSION_REASONS},
+        "filter": email_suppressions.stats(),
+        "suppressions": [
+            {
+                "email": row.email,
+                "reason": row.reason,
+                "source": row.source,
+                "detail": row.detail,
+                "created_at": row.created_at
+            }
+            for row in rows
+        ]
+    }
+
+@app.post("/admin/api/email-suppressions")
+def admin_add_email_suppression(
+    email: str = Form(...),
+    reason: str = Form("manual"),
+    admin: User = Depends(get_admin_user)
+):
+    if reason not in EMAIL_SUPPRESSION_REASONS or "@" not in email:
+        return JSONResponse({"success": False, "message": "Invalid email or reason"}, status_code=400)
+    db = SessionLocal()
+    try:
+        email_suppressions.add(db, email, reason, admin.email)
+        db.commit()
+    finally:
+        db.close()
+    return {"success": True}
+
+@app.delete("/admin/api/email-suppressions/{email}")
+def admin_remove_email_suppression(email: str, admin: User = Depends(get_admin_user)):
+    """Let an address receive email again. The Bloom filter keeps matching
+    it until the next rebuild, which only costs a lookup per send."""
+    db = SessionLocal()
+    try:
+        deleted = db.query(EmailSuppression).filter(
+            EmailSuppression.email == email_suppressions.normalize(email)
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if not deleted:
+        return JSONResponse({"success": False, "message": "Address is not suppressed"}, status_code=404)
+    return {"success": True}
+
+@app.get("/admin/api/stripe-events")
+def admin_stripe_events(
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
+):
+    """Stripe event backlog by status, age of the oldest pending event and recent dead letters"""
+    counts = dict(db.query(StripeEvent.status, func.count(StripeEvent.id)).group_by(StripeEvent.status).all())
+    oldest_pending = db.query(func.min(StripeEvent.received_at)).filter(StripeEvent.status == "pending").scalar()
+    dead = db.query(StripeEvent).filter(StripeEvent.status == "dead").order_by(
+        StripeEvent.received_at.desc()
+    ).limit(50).all()
+    return {
+        "counts": {status_name: counts.get(status_name, 0) for status_name in ["pending", "processing", "processed", "dead"]},
+        "oldest_pending_seconds": (datetime.utcnow() - oldest_pending).total_seconds() if oldest_pending else None,
+        "processor": stripe_event_processor.stats(),
+        "dead_letters": [
+            {
+                "id": row.id,
+                "type": row.type,
+                "customer_id": row.customer_id,
+                "attempts": row.attempts,
+                "last_error": row.last_error,
+                "received_at": row.received_at
+            }
+            for row in dead
+        ],
+        "timestamp": datetime.utcnow()
+    }
+
+@app.post("/admin/api/stripe-events/{event_id}/retry")
+def admin_retry_stripe_event(event_id: str, admin: User = Depends(get_admin_user)):
+    """Put a dead-lettered Stripe event back in the queue with a fresh set of attempts"""
+    db = SessionLocal()
+    try:
+        updated = db.query(StripeEvent).filter(
+            StripeEvent.id == event_id,
+            StripeEvent.status == "dead"
+        ).update({
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow(),
+            "last_error": None
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if not updated:
+        return JSONResponse({"success": False, "message": "No dead-lettered event with that id"}, status_code=404)
+    stripe_event_processor.wake()
+    return {"success": True}
+
+@app.get("/admin/api/stats/timeseries")
+def admin_stats_timeseries(
+    days: int = Query(30, ge=1, le=365),
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
+):
+    """Daily admin stats for trend charts, oldest first"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = db.query(AdminStatsDaily).filter(AdminStatsDaily.day >= since).order_by(AdminStatsDaily.day).all()
+    return {
+        "days": [
+            {
+                "day": row.day.isoformat(),
+                "signups": row.signups,
+                "active_users": row.active_users,
+                "total_users": row.total_users,
+                "suspended_users": row.suspended_users,
+                "pending_appeals": row.pending_appeals,
+                "active_ip_bans": row.active_ip_bans
+            }
+            for row in rows
+        ]
+    }
+
+@app.get("/admin/api/tweet-retention")
+def admin_tweet_retention(admin: User = Depends(get_admin_user), db: Session = Depends(get_read_db)):
+    """generated_tweets partitions, size trend and /history latency by day"""
+    report = tweet_retention.report()
+    if tweet_retention.is_partitioned(db):
+        report["partitions"] = [
+            {**p, "month_start": p["month_start"].isoformat() if p["month_start"] else None}
+            for p in tweet_retention.list_partitions(db)
+        ]
+    return report
+
 @app.get("/admin/ban-ip", response_class=HTMLResponse)
 def ban_ip_page(request: Request, admin: User = Depends(get_admin_user)):
     """Display IP ban management page"""
@@ -4292,6 +7043,8 @@ async def ban_ip_address(
         
         ban_type = f"for {duration_hours} hours" if duration_hours else "permanently"
         print(f"🚫 IP {clean_ip} banned {ban_type} by {admin.email}")
+        log_request_activity(request, admin.id, "admin_ban_ip", f"Banned IP {clean_ip} {ban_type}",
+                             {"ip_address": clean_ip, "reason": reason.strip(), "duration_hours": duration_hours})
         
         return RedirectResponse("/admin/ban-ip?success=banned", status_code=302)
         
@@ -4336,6 +7089,8 @@ async def unban_ip_address(
             print(f"✅ CACHE CLEARED: {ip_ban.ip_address}")
         
         print(f"✅ IP {ip_ban.ip_address} unbanned by {admin.email}")
+        log_request_activity(request, admin.id, "admin_unban_ip", f"Unbanned IP {ip_ban.ip_address}",
+                             {"ip_address": ip_ban.ip_address, "ban_id": ban_id})
         return RedirectResponse("/admin/ban-ip?success=unbanned", status_code=302)
         
     except Exception as e:
@@ -4471,13 +7226,10 @@ async def suspend_user_enhanced(
                 db
             )
         
+        await queue_email(db, "suspension", user.email, reason)
         db.commit()
-        
-        # Send suspension email
-        try:
-            await email_service.send_suspension_email(user.email, reason)
-        except Exception as e:
-            print(f"Failed to send suspension email: {e}")
+        log_request_activity(request, user.id, "admin_suspend", f"Suspended by admin: {reason}",
+                             {"admin": admin_user.email, "reason": reason, "ban_ip": ban_ip})
         
         message = f"User {user.username} has been suspended"
         if ban_ip:
@@ -4524,6 +7276,8 @@ async def unsuspend_user_enhanced(
             user.is_ip_banned = False
         
         db.commit()
+        log_request_activity(request, user.id, "admin_unsuspend", "Unsuspended by admin",
+                             {"admin": admin_user.email, "unban_ip": unban_ip})
         
         # Send restoration email
         try:
@@ -4617,6 +7371,8 @@ async def process_suspension_appeal(
                 print(f"Failed to send appeal denial email: {e}")
         
         db.commit()
+        log_request_activity(request, appeal.user_id, f"admin_appeal_{appeal.status}", f"Suspension appeal {appeal.status}",
+                             {"admin": admin_user.email, "appeal_id": appeal_id})
         
         return JSONResponse({
             "success": True,
@@ -4648,7 +7404,8 @@ async def approve_appeal(
     appeal.reviewed_by = admin.username
     appeal.reviewed_at = datetime.utcnow()
     db.commit()
-    
+    log_user_activity(appeal.user_id, "admin_appeal_approved", "Suspension appeal approved",
+                      user_metadata={"admin": admin.email, "appeal_id": appeal_id})
     
     return RedirectResponse("/admin/appeals", status_code=302)
 
@@ -4669,6 +7426,8 @@ async def deny_appeal(
     appeal.reviewed_by = admin.username
     appeal.reviewed_at = datetime.utcnow()
     db.commit()
+    log_user_activity(appeal.user_id, "admin_appeal_denied", "Suspension appeal denied",
+                      user_metadata={"admin": admin.email, "appeal_id": appeal_id, "reason": denial_reason})
     
     # Send denial email to user
     try:
@@ -4763,8 +7522,7 @@ async def force_password_reset_endpoint(
             activity_type="password_reset_forced",
             description="Password reset forced by admin",
             ip_address=request.client.host if request.client else None,
-            user_metadata={"admin": current_user.email},
-            db=db
+            user_metadata={"admin": current_user.email}
         )
         
         return {"message": "Password reset email sent"}
@@ -4972,111 +7730,273 @@ def log_login_attempt(user_id: int, ip_address: str, success: bool, db: Session)
     except Exception as e:
         print(f"Error logging login attempt: {str(e)}")
         
-@app.get("/admin/user/{user_id}/activity")
-async def admin_user_activity(
-    user_id: int,
+@app.get("/admin/live-activity", response_class=HTMLResponse)
+def admin_live_activity(
     request: Request,
-    page: int = Query(default=1, ge=1),
-    current_user: User = Depends(get_current_user)
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
 ):
-    """Get user activity log with Eastern Time conversion"""
-    
-    if current_user.email not in ADMIN_USERS:
-        raise HTTPException(status_code=403, detail="Admin access required")
-    
-    db = SessionLocal()
-    try:
-        # Get the user
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Try to get real activity data first
-        real_activities = []
+    """Live activity monitor: the last hour from the database, then deltas over SSE"""
+    # Taken before querying so nothing published meanwhile is skipped
+    stream_from = activity_bus.last_event_id
+    one_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    recent_activities = db.query(UserActivity).options(joinedload(UserActivity.user)).filter(
+        UserActivity.timestamp >= one_hour_ago
+    ).order_by(UserActivity.timestamp.desc()).limit(200).all()
+    suspicious = [a for a in recent_activities if a.activity_type in SUSPICIOUS_ACTIVITY_TYPES]
+
+    return templates.TemplateResponse("admin/live_activity.html", {
+        "request": request,
+        "user": admin,
+        "active_users": get_admin_stats(db)["active_today"],
+        "recent_activities": recent_activities,
+        "suspicious": suspicious,
+        "stream_from": stream_from
+    })
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: activity\ndata: {json.dumps(event)}\n\n"
+
+@app.get("/admin/api/activity/stream")
+async def admin_activity_stream(
+    request: Request,
+    last_event_id: str = Query(None),
+    admin: User = Depends(get_admin_user)
+):
+    """Server-sent events for the live activity monitor. Browsers resend the
+    last id they saw in the Last-Event-ID header when reconnecting."""
+    queue, backlog, reset = activity_bus.subscribe(request.headers.get("last-event-id") or last_event_id)
+
+    async def events():
         try:
-            activities = db.query(UserActivity).filter(
-                UserActivity.user_id == user_id
-            ).order_by(UserActivity.timestamp.desc()).limit(50).all()
-            
-            for activity in activities:
-                real_activities.append({
-                    "id": activity.id,
-                    "type": activity.activity_type,
-                    "description": activity.description,
-                    "timestamp": activity.timestamp,
-                    "ip_address": activity.ip_address,  # Real IP from database
-                    "metadata": json.loads(activity.user_metadata) if activity.user_metadata else {}
-                })
-        except Exception as e:
-            print(f"Could not get real activities: {e}")
-        
-        # If no real activities, create sample data with REAL IPs from user record
-        if not real_activities:
-            sample_activities = [
-                {
-                    "id": 1,
-                    "type": "login",
-                    "description": "User logged in",
-                    "timestamp": user.last_login,
-                    "ip_address": getattr(user, 'last_known_ip', None) or "Unknown",  # REAL IP
-                    "metadata": {"user_agent": "Unknown"}
-                },
-                {
-                    "id": 2,
-                    "type": "account_created",
-                    "description": "Account created",
-                    "timestamp": user.created_at,
-                    "ip_address": getattr(user, 'registration_ip', None) or "Unknown",  # REAL IP
-                    "metadata": {"signup_method": "email"}
-                }
-            ]
-            activities_to_use = sample_activities
-        else:
-            activities_to_use = real_activities
-        
-        # Convert timestamps to Eastern Time
-        for activity in activities_to_use:
-            ts = activity["timestamp"]
-            activity["timestamp_eastern"] = convert_to_eastern(ts) if ts else None
-            activity["timestamp"] = ts.isoformat() if ts else None
-        
-        return {
-            "user": {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "created_at": user.created_at.isoformat() if user.created_at else None,
-            "created_at_eastern": convert_to_eastern(user.created_at) if user.created_at else None,
-            "last_login": convert_to_eastern(user.last_login) if user.last_login else None,
-    },
-    "activities": activities_to_use,
-    "pagination": {
-        "page": page,
-        "pages": 1,
-        "total": len(activities_to_use),
-    },
-    "timezone": "America/New_York" if TIMEZONE_AVAILABLE else "UTC",
-}
-    finally:
-        db.close()
+            yield "retry: 3000\n\n"
+            if reset:
+                yield "event: reset\ndata: {}\n\n"
+            for event in backlog:
+                yield format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=ACTIVITY_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break  # fell behind; the client reconnects and replays
+                yield format_sse(event)
+        finally:
+            activity_bus.unsubscribe(queue)
 
-@app.get("/auth/google")
-async def google_login(request: Request):
-    redirect_uri = "https://giverai.me/auth/google/callback"
-    return await oauth.google.authorize_redirect(request, redirect_uri)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
+ADMIN_ACTIVITY_PAGE_SIZE = 50
 
-@app.get("/auth/google/callback")
-async def google_callback(request: Request):
-    db = SessionLocal()
+def encode_activity_cursor(timestamp: datetime, activity_id: int) -> str:
+    raw = json.dumps([timestamp.isoformat() if timestamp else None, activity_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_activity_cursor(cursor: str):
     try:
-        token = await oauth.google.authorize_access_token(request)
-        userinfo = token.get('userinfo')
-        
-        if not userinfo:
-            return RedirectResponse("/login?error=google_failed", status_code=302)
-        
-        email = userinfo.get('email')
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, activity_id = json.loads(raw)
+        return (datetime.fromisoformat(timestamp) if timestamp else None), int(activity_id)
+    except Exception:
+        raise ValueError("Invalid activity cursor")
+
+def fetch_user_activity_page(db: Session, user_id: int, limit: int = ADMIN_ACTIVITY_PAGE_SIZE,
+                             cursor: str = None, activity_types: list = None, ip_address: str = None,
+                             start: datetime = None, end: datetime = None, include_metadata: bool = False):
+    """One page of a user's activity log, newest first. Returns (activities, next_cursor).
+
+    Keyset pagination on (timestamp, id) over ix_user_activity_user_timeline
+    (or the per-type index when filtering by type), so page 1,000 costs the
+    same as page 1. Rows logged before timestamps were recorded have a NULL
+    timestamp; they come after everything else, ordered by id. The
+    user_metadata blob is only loaded and decoded when include_metadata is
+    set; otherwise each row just says whether it has any.
+    """
+    after_timestamp, after_id = decode_activity_cursor(cursor) if cursor else (None, None)
+
+    columns = [UserActivity.id, UserActivity.activity_type, UserActivity.description,
+               UserActivity.timestamp, UserActivity.ip_address,
+               UserActivity.user_metadata.isnot(None).label("has_metadata")]
+    if include_metadata:
+        columns.append(UserActivity.user_metadata)
+
+    base = db.query(*columns).filter(UserActivity.user_id == user_id)
+    if activity_types:
+        base = base.filter(UserActivity.activity_type.in_(activity_types))
+    if ip_address:
+        base = base.filter(UserActivity.ip_address == ip_address)
+
+    rows = []
+    # Timestamped rows first; a cursor with a NULL timestamp is already past them
+    if not (cursor and after_timestamp is None):
+        query = base.filter(UserActivity.timestamp.isnot(None))
+        if start:
+            query = query.filter(UserActivity.timestamp >= start)
+        if end:
+            query = query.filter(UserActivity.timestamp < end)
+        if cursor:
+            query = query.filter(tuple_(UserActivity.timestamp, UserActivity.id) < tuple_(after_timestamp, after_id))
+        rows = query.order_by(UserActivity.timestamp.desc(), UserActivity.id.desc()).limit(limit + 1).all()
+
+    # Then undated rows, which no date range can match
+    if len(rows) <= limit and not (start or end):
+        query = base.filter(UserActivity.timestamp.is_(None))
+        if cursor and after_timestamp is None:
+            query = query.filter(UserActivity.id < after_id)
+        rows += query.order_by(UserActivity.id.desc()).limit(limit + 1 - len(rows)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_activity_cursor(rows[-1].timestamp, rows[-1].id)
+
+    activities = []
+    for row in rows:
+        activity = {
+            "id": row.id,
+            "type": row.activity_type,
+            "description": row.description,
+            "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+            "timestamp_eastern": convert_to_eastern(row.timestamp) if row.timestamp else None,
+            "ip_address": row.ip_address,
+            "has_metadata": bool(row.has_metadata)
+        }
+        if include_metadata:
+            activity["metadata"] = json.loads(row.user_metadata) if row.user_metadata else {}
+        activities.append(activity)
+    return activities, next_cursor
+
+@app.get("/admin/user/{user_id}/activity")
+def admin_user_activity(
+    user_id: int,
+    request: Request,
+    limit: int = Query(ADMIN_ACTIVITY_PAGE_SIZE, ge=1, le=200),
+    cursor: str = Query(None),
+    activity_type: List[str] = Query(None, alias="type"),
+    ip: str = Query(None),
+    start: date = Query(None),
+    end: date = Query(None),
+    include_metadata: bool = Query(False),
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get user activity log with Eastern Time conversion.
+
+    Browsers navigating here get the activity page (admin/activity.html),
+    which calls back to this URL for JSON. start/end are UTC dates and end
+    is inclusive.
+    """
+    if "text/html" in request.headers.get("accept", ""):
+        return templates.TemplateResponse("admin/activity.html", {
+            "request": request, "user": admin, "activity_types": ACTIVITY_TYPE_LABELS
+        })
+
+    # Get the user
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    start_at = datetime.combine(start, datetime.min.time()) if start else None
+    end_at = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    try:
+        activities, next_cursor = fetch_user_activity_page(
+            db, user_id, limit, cursor, activity_type, ip, start_at, end_at, include_metadata
+        )
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    filtered = bool(activity_type or ip or start or end)
+    # If no real activities, create sample data with REAL IPs from user record
+    if not activities and not cursor and not filtered:
+        activities = [
+            {
+                "id": None,
+                "type": "login",
+                "description": "User logged in",
+                "timestamp": user.last_login.isoformat() if user.last_login else None,
+                "timestamp_eastern": convert_to_eastern(user.last_login) if user.last_login else None,
+                "ip_address": getattr(user, 'last_known_ip', None) or "Unknown",  # REAL IP
+                "has_metadata": False
+            },
+            {
+                "id": None,
+                "type": "account_created",
+                "description": "Account created",
+                "timestamp": user.created_at.isoformat() if user.created_at else None,
+                "timestamp_eastern": convert_to_eastern(user.created_at) if user.created_at else None,
+                "ip_address": getattr(user, 'registration_ip', None) or "Unknown",  # REAL IP
+                "has_metadata": False
+            }
+        ]
+
+    return {
+        "user": {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "created_at": user.created_at.isoformat() if user.created_at else None,
+            "created_at_eastern": convert_to_eastern(user.created_at) if user.created_at else None,
+            "last_login": convert_to_eastern(user.last_login) if user.last_login else None,
+        },
+        "activities": activities,
+        "pagination": {
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
+        },
+        "filters": {
+            "type": activity_type or [],
+            "ip": ip,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None
+        },
+        "timezone": "America/New_York" if TIMEZONE_AVAILABLE else "UTC",
+    }
+
+@app.get("/admin/user/{user_id}/activity/{activity_id}/metadata")
+def admin_user_activity_metadata(
+    user_id: int,
+    activity_id: int,
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_read_db)
+):
+    """Decoded user_metadata for one activity row, fetched when an admin expands it"""
+    raw = db.query(UserActivity.user_metadata).filter(
+        UserActivity.id == activity_id,
+        UserActivity.user_id == user_id
+    ).first()
+    if raw is None:
+        raise HTTPException(status_code=404, detail="Activity not found")
+    try:
+        metadata = json.loads(raw.user_metadata) if raw.user_metadata else {}
+    except ValueError:
+        metadata = {"raw": raw.user_metadata}
+    return {"id": activity_id, "metadata": metadata}
+
+@app.get("/auth/google")
+async def google_login(request: Request):
+    redirect_uri = "https://giverai.me/auth/google/callback"
+    return await get_oauth().google.authorize_redirect(request, redirect_uri)
+
+
+@app.get("/auth/google/callback")
+async def google_callback(request: Request):
+    db = SessionLocal()
+    try:
+        token = await get_oauth().google.authorize_access_token(request)
+        userinfo = token.get('userinfo')
+        
+        if not userinfo:
+            return RedirectResponse("/login?error=google_failed", status_code=302)
+        
+        email = userinfo.get('email')
         google_id = userinfo.get('sub')
         name = userinfo.get('given_name') or userinfo.get('name', '').split()[0]
         
@@ -5138,6 +8058,8 @@ async def google_callback(request: Request):
             db.commit()
             print(f"✅ Google login for existing user: {email}")
         
+        log_request_activity(request, user.id, "login", "Google login")
+        
         # Create session token
         access_token = create_access_token(
             data={"sub": user.username},
@@ -5180,22 +8102,23 @@ async def login_post(
     request: Request, 
     username: str = Form(...), 
     password: str = Form(...),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db = SessionLocal()
     try:
         # Get real client IP
         client_ip = get_real_client_ip(request)
         print(f"🔐 Login attempt from IP: {client_ip}")
         
         # Get user record first (for failed attempt tracking)
-        user_record = db.query(User).filter(
-            (User.username == username) | (User.email == username)
-        ).first()
+        result = await db.execute(
+            select(User).filter((User.username == username) | (User.email == username))
+        )
+        user_record = result.scalars().first()
         
         # Check if account is temporarily locked
         if user_record and user_record.account_locked_until:
-            if user_record.account_locked_until > datetime.now(timezone.utc):
-                time_remaining = user_record.account_locked_until - datetime.now(timezone.utc)
+            if user_record.account_locked_until > datetime.utcnow():
+                time_remaining = user_record.account_locked_until - datetime.utcnow()
                 hours_remaining = int(time_remaining.total_seconds() / 3600) + 1
                 response = templates.TemplateResponse("login.html", {
                     "request": request,
@@ -5207,15 +8130,15 @@ async def login_post(
                 # Lock period has expired, clear it
                 user_record.account_locked_until = None
                 user_record.failed_login_attempts = 0
-                db.commit()
+                await db.commit()
         
         # Authenticate user
-        user = authenticate_user(db, username, password)
+        user = await authenticate_user_async(db, username, password)
         
         if user:  # successful login
             user.last_known_ip = client_ip
-            user.last_login = datetime.now(timezone.utc)
-            db.commit()
+            user.last_login = datetime.utcnow()
+            await db.commit()
             
             days_since_signup = (datetime.utcnow() - user.created_at).days
             days_since_last_login = (datetime.utcnow() - user.last_login).days
@@ -5229,28 +8152,27 @@ async def login_post(
                 db.add(scheduled_email)
             
                 # Cancel Day 3 nudge since they're active
-                db.query(ScheduledEmail).filter(
-                    ScheduledEmail.user_id == user.id,
-                    ScheduledEmail.email_type == 'day3_nudge',
-                    ScheduledEmail.sent == False
-                ).delete()
-                db.commit()
+                await db.execute(
+                    delete(ScheduledEmail).where(
+                        ScheduledEmail.user_id == user.id,
+                        ScheduledEmail.email_type == 'day3_nudge',
+                        ScheduledEmail.sent == False
+                    )
+                )
+                await db.commit()
         if not user:
             # Track failed login attempts
             if user_record:
                 user_record.failed_login_attempts = (user_record.failed_login_attempts or 0) + 1
-                user_record.last_failed_login = datetime.now(timezone.utc)
+                user_record.last_failed_login = datetime.utcnow()
+                log_request_activity(request, user_record.id, "failed_login",
+                                     f"Failed password login (attempt {user_record.failed_login_attempts})")
                 
                 # Lock account after 4 failed attempts
                 if user_record.failed_login_attempts >= 4:
-                    user_record.account_locked_until = datetime.now(timezone.utc) + timedelta(hours=24)
-                    db.commit()
-                    
-                    try:
-                        await email_service.send_account_locked_email(user_record.email, 24)
-                        print(f"✅ Account locked email sent to {user_record.email}")
-                    except Exception as e:
-                        print(f"❌ Failed to send account locked email: {e}")
+                    user_record.account_locked_until = datetime.utcnow() + timedelta(hours=24)
+                    await queue_email(db, "account_locked", user_record.email, 24)
+                    await db.commit()
                     
                     response = templates.TemplateResponse("login.html", {
                         "request": request,
@@ -5260,7 +8182,7 @@ async def login_post(
                     return response
                 else:
                     attempts_left = 4 - user_record.failed_login_attempts
-                    db.commit()
+                    await db.commit()
                     
                     response = templates.TemplateResponse("login.html", {
                         "request": request,
@@ -5299,7 +8221,7 @@ async def login_post(
         user.failed_login_attempts = 0
         user.last_failed_login = None
         user.account_locked_until = None
-        db.commit()
+        await db.commit()
         
         # Create access token
         access_token = create_access_token(
@@ -5308,6 +8230,7 @@ async def login_post(
         )
         
         print(f"✅ Successful login for user: {user.username} at {datetime.utcnow()}")
+        log_request_activity(request, user.id, "login", "Password login")
         
         response = RedirectResponse("/dashboard", status_code=302)
         response.set_cookie(
@@ -5332,8 +8255,6 @@ async def login_post(
             "error": "Invalid credentials"
         })
         return response
-    finally:
-        db.close()
 
 # Optional: Add a route to unlock accounts manually
 @app.get("/unlock-account")
@@ -5351,7 +8272,7 @@ async def unlock_account_request(
     g_recaptcha_response: str = Form(alias="g-recaptcha-response", default="")
 ):
     """Allow users to request account unlock"""
-    if not verify_recaptcha(g_recaptcha_response):
+    if not await verify_recaptcha(g_recaptcha_response, get_real_client_ip(request)):
         return templates.TemplateResponse("unlock_account.html", {
             "request": request,
             "error": "Invalid credentials",
@@ -5451,7 +8372,7 @@ async def handle_contact_form(
         })
 
     try:
-        if not verify_recaptcha(g_recaptcha_response):
+        if not await verify_recaptcha(g_recaptcha_response, get_real_client_ip(request)):
             return templates.TemplateResponse("contact.html", {
                 "request": request,
                 "user": user,
@@ -5479,7 +8400,7 @@ async def handle_contact_form(
         if "@" not in form_data["email"]:
             raise ValueError("Please enter a valid email address")
 
-        if not is_valid_email_domain(form_data["email"]):
+        if not await is_valid_email_domain(form_data["email"]):
             raise ValueError("Please enter a valid email address")
 
         user_info = None
@@ -5490,7 +8411,7 @@ async def handle_contact_form(
                 f"Member since: {user.created_at.strftime('%Y-%m-%d')}"
             )
 
-        support_sent = email_service.send_contact_form_notification(
+        support_sent = await asyncio.to_thread(email_service.send_contact_form_notification,
             form_data["name"],
             form_data["email"],
             form_data["subject"],
@@ -5498,7 +8419,7 @@ async def handle_contact_form(
             user_info
         )
 
-        confirmation_sent = email_service.send_contact_confirmation_email(
+        confirmation_sent = await asyncio.to_thread(email_service.send_contact_confirmation_email,
             form_data["name"],
             form_data["email"],
             form_data["subject"]
@@ -5603,7 +8524,7 @@ async def suspended_page_post(request: Request):
         g_recaptcha_response = form.get("g-recaptcha-response", "")
         
         # Verify reCAPTCHA
-        if not verify_recaptcha(g_recaptcha_response):
+        if not await verify_recaptcha(g_recaptcha_response, get_real_client_ip(request)):
             print("❌ reCAPTCHA verification failed")
             return templates.TemplateResponse("suspended.html", {
                 "request": request,
@@ -5671,14 +8592,14 @@ async def suspended_page_post(request: Request):
         
         # Send appeal notification to admin
         try:
-            await send_suspension_appeal_notification(user, appeal)
+            await email_service.send_suspension_appeal_notification(user, appeal)
             print("📧 Admin notification sent")
         except Exception as e:
             print(f"⚠️ Failed to send suspension appeal notification: {str(e)}")
         
         # Send confirmation to user
         try:
-            await send_appeal_confirmation_email(user, appeal)
+            await email_service.send_appeal_confirmation_email(user, appeal)
             print("📧 User confirmation sent")
         except Exception as e:
             print(f"⚠️ Failed to send appeal confirmation: {str(e)}")
@@ -5787,7 +8708,8 @@ def update_database_for_suspension_appeals():
 @app.get("/account", response_class=HTMLResponse)
 async def account_page(
     request: Request,
-    user: Optional[User] = Depends(get_current_user_or_none)
+    user: Optional[User] = Depends(get_current_user_or_none),
+    db: AsyncSession = Depends(get_async_read_db)
     #user: User = Depends(get_current_user)  
 ):
     if user is None:
@@ -5796,53 +8718,98 @@ async def account_page(
             "user": None
         }, status_code=404)
     
-    """Account page with Stripe billing portal"""
+    """Account page; billing state comes from the local subscription mirror"""
     
-    # Get Stripe billing portal URL for paid users
+    # The portal session itself is only created when the link is followed
     billing_portal_url = None
-    billing_error = None
+    subscription = None
     
-    if user.stripe_customer_id and user.plan not in ["free", "canceling"]:
-        try:
-            print(f"Creating billing portal for customer: {user.stripe_customer_id}")
-            session = stripe.billing_portal.Session.create(
-                customer=user.stripe_customer_id,
-                return_url="https://giverai.me/account"
-            )
-            billing_portal_url = session.url
-            print(f"✅ Billing portal URL created: {billing_portal_url}")
-        except Exception as e:
-            print(f"❌ Failed to create billing portal session: {e}")
-            billing_error = str(e)
+    if user.stripe_customer_id:
+        subscription = await get_current_subscription_async(db, user.stripe_customer_id)
+        if user.plan not in ["free", "canceling"]:
+            billing_portal_url = "/account/billing-portal"
     
     return templates.TemplateResponse("account.html", {
         "request": request,
         "user": user,
+        "subscription": subscription,
         "billing_portal_url": billing_portal_url,
-        "billing_error": billing_error
+        "error": request.query_params.get("error")
     })
 
+@app.get("/account/billing-portal")
+async def billing_portal_redirect(
+    request: Request,
+    user: Optional[User] = Depends(get_current_user_or_none)
+):
+    """Create a Stripe billing portal session and send the user to it"""
+    if user is None:
+        return RedirectResponse("/login", status_code=302)
+    if not user.stripe_customer_id:
+        return RedirectResponse("/account?error=No+billing+account+found", status_code=302)
+    try:
+        session = await asyncio.to_thread(
+            stripe.billing_portal.Session.create,
+            customer=user.stripe_customer_id,
+            return_url="https://giverai.me/account"
+        )
+    except Exception as e:
+        print(f"❌ Failed to create billing portal session: {e}")
+        return RedirectResponse("/account?error=Billing+portal+unavailable.+Please+try+again+later.", status_code=302)
+    return RedirectResponse(session.url, status_code=303)
+
 # Fix history route
 @app.get("/history", response_class=HTMLResponse)
-def tweet_history(request: Request, user: User = Depends(get_current_user)):
-    db = SessionLocal()
+async def tweet_history(
+    request: Request,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    days = HISTORY_DAYS
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    
+    started = time.monotonic()
+    tweets, next_cursor = await get_history_page_async(db, user.id, cutoff_date)
+    tweet_retention.observe_history_query(time.monotonic() - started)
+    
+    return templates.TemplateResponse("history.html", {
+        "request": request,
+        "user": user,
+        "history_days": days, 
+        "tweets": tweets,
+        "next_cursor": next_cursor
+    })
+
+@app.get("/api/history")
+async def tweet_history_api(
+    cursor: str = Query(None),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=200),
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Next page of /history for infinite scroll"""
+    days = HISTORY_DAYS
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    
+    started = time.monotonic()
     try:
-        days = 90
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        
-        tweets = db.query(GeneratedTweet).filter(
-            GeneratedTweet.user_id == user.id,
-            GeneratedTweet.generated_at >= cutoff_date
-        ).order_by(GeneratedTweet.generated_at.desc()).all()
-        
-        return templates.TemplateResponse("history.html", {
-            "request": request,
-            "user": user,
-            "history_days": days, 
-            "tweets": tweets
-        })
-    finally:
-        db.close()
+        tweets, next_cursor = await get_history_page_async(db, user.id, cutoff_date, cursor, limit)
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    tweet_retention.observe_history_query(time.monotonic() - started)
+    
+    return JSONResponse({
+        "success": True,
+        "tweets": [
+            {
+                "id": tweet.id,
+                "text": tweet.tweet_text,
+                "generated_at": tweet.generated_at.strftime('%Y-%m-%d %H:%M')
+            }
+            for tweet in tweets
+        ],
+        "next_cursor": next_cursor
+    })
 
 @app.get("/team", response_class=HTMLResponse)
 def team_management(request: Request, user: User = Depends(get_current_user)):
@@ -5937,7 +8904,7 @@ async def change_password(
 
         # Send email notification using global email_service
         try:
-            email_service.send_account_changed_email(
+            await asyncio.to_thread(email_service.send_account_changed_email,
                 db_user,
                 change_details="Your password was changed successfully.",
                 ip_address=ip_address
@@ -5994,7 +8961,7 @@ async def change_email(
         
         # Send verification email to NEW address
         try:
-            email_service.send_email_change_verification(
+            await asyncio.to_thread(email_service.send_email_change_verification,
                 db_user, 
                 new_email, 
                 change_request.token
@@ -6069,7 +9036,7 @@ async def delete_account(request: Request):
         
         # Send goodbye email before deleting
         try:
-            email_service.send_goodbye_email(user, total_tweets, days_active, plan_for_email)
+            await asyncio.to_thread(email_service.send_goodbye_email, user, total_tweets, days_active, plan_for_email)
             print("✅ Goodbye email sent")
         except Exception as e:
             print(f"⚠ Failed to send goodbye email: {str(e)}")
@@ -6077,6 +9044,7 @@ async def delete_account(request: Request):
         # Delete all foreign key references first
         print("🗑️ Deleting user data...")
         db.query(Usage).filter(Usage.user_id == user_id).delete()
+        db.query(PendingTweet).filter(PendingTweet.user_id == user_id).delete()
         db.query(GeneratedTweet).filter(GeneratedTweet.user_id == user_id).delete()
         db.query(TeamMember).filter(TeamMember.user_id == user_id).delete()
         db.query(EmailVerification).filter(EmailVerification.user_id == user_id).delete()
@@ -6204,37 +9172,130 @@ async def llms():
     file_path = "static/llms.txt"  
     return FileResponse(file_path, media_type="text/plain")
 
-@app.get("/export-tweets")
-def export_tweets(user: User = Depends(get_current_user)):
-    db = SessionLocal()
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = {
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv")
+}
+
+def iter_export_rows(user_id: int, start: date = None, end: date = None, force_primary: bool = False):
+    """Yield (text, date string) for a user's tweets, newest first, without
+    holding more than one yield_per batch in memory"""
+    # The session is opened here rather than injected: the generator runs
+    # while the response streams, after request dependencies have finished
+    db = ReadSessionLocal(read_bind=replica_router.read_bind(force_primary))
     try:
-        features = get_plan_features(user.plan)
-        if not features["export"]:
-            return Response(
-                "Export feature not available for your plan",
-                status_code=403,
-                media_type="text/plain"
-            )
-        
-        tweets = db.query(GeneratedTweet).filter(
-            GeneratedTweet.user_id == user.id
-        ).order_by(GeneratedTweet.generated_at.desc()).all()
-        
-        tweet_data = [{
-            "text": tweet.tweet_text, 
-            "date": tweet.generated_at.strftime("%Y-%m-%d %H:%M:%S")
-        } for tweet in tweets]
-        
-        filename = f"tweets_export_{user.username}_{datetime.utcnow().strftime('%Y%m%d')}.json"
-        
-        return Response(
-            content=json.dumps(tweet_data, indent=2),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        query = (
+            select(GeneratedTweet.tweet_text, GeneratedTweet.generated_at)
+            .where(GeneratedTweet.user_id == user_id)
+            .order_by(GeneratedTweet.generated_at.desc(), GeneratedTweet.id.desc())
         )
+        start_at = datetime.combine(start, datetime.min.time()) if start else None
+        end_before = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+        if start_at:
+            query = query.where(GeneratedTweet.generated_at >= start_at)
+        if end_before:
+            query = query.where(GeneratedTweet.generated_at < end_before)
+
+        staged_ids = set()
+        for tweet in db.execute(tweet_buffer.pending_query(user_id, start_at)).scalars():
+            if end_before is None or tweet.generated_at < end_before:
+                staged_ids.add(tweet.id)
+                yield tweet.tweet_text, tweet.generated_at.strftime("%Y-%m-%d %H:%M:%S")
+
+        # yield_per streams through a server-side cursor on Postgres
+        query = query.add_columns(GeneratedTweet.id)
+        result = db.execute(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for tweet_text, generated_at, tweet_id in result:
+            if tweet_id in staged_ids:
+                continue
+            yield tweet_text, generated_at.strftime("%Y-%m-%d %H:%M:%S")
     finally:
         db.close()
 
+def iter_export_lines(rows, export_format: str):
+    """Serialize export rows one record at a time"""
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["date", "text"])
+        for text_value, date_value in rows:
+            writer.writerow([date_value, text_value])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    elif export_format == "ndjson":
+        for text_value, date_value in rows:
+            yield json.dumps({"text": text_value, "date": date_value}, ensure_ascii=False) + "\n"
+    else:
+        yield "["
+        first = True
+        for text_value, date_value in rows:
+            yield ("\n  " if first else ",\n  ") + json.dumps({"text": text_value, "date": date_value}, ensure_ascii=False)
+            first = False
+        yield "\n]\n"
+
+def iter_export_chunks(lines, compress: bool):
+    """Group serialized lines into ~64KB chunks, gzip-compressed if asked"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size = [], 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = "".join(pending).encode("utf-8")
+            pending, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = "".join(pending).encode("utf-8")
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+@app.get("/export-tweets")
+def export_tweets(
+    request: Request,
+    export_format: str = Query("json", alias="format"),
+    compress: bool = Query(False, alias="gzip"),
+    start: date = Query(None),
+    end: date = Query(None),
+    user: User = Depends(get_current_user)
+):
+    features = get_plan_features(user.plan)
+    if not features["export"]:
+        return Response(
+            "Export feature not available for your plan",
+            status_code=403,
+            media_type="text/plain"
+        )
+    
+    if export_format not in EXPORT_FORMATS:
+        return Response(
+            f"Unsupported export format. Use one of: {', '.join(EXPORT_FORMATS)}",
+            status_code=400,
+            media_type="text/plain"
+        )
+    if start and end and start > end:
+        return Response("start must be on or before end", status_code=400, media_type="text/plain")
+    
+    media_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"tweets_export_{user.username}_{datetime.utcnow().strftime('%Y%m%d')}.{extension}"
+    if compress:
+        media_type = "application/gzip"
+        filename += ".gz"
+    
+    rows = iter_export_rows(user.id, start, end, force_primary=wants_primary_reads(request))
+    return StreamingResponse(
+        iter_export_chunks(iter_export_lines(rows, export_format), compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 # Add routes
 @app.post("/add-team-member")
 async def add_team_member(
@@ -6489,7 +9550,7 @@ async def cancel_subscription(
         try:
             # Use the original plan for the email, not "canceling"
             plan_for_email = db_user.original_plan if db_user.original_plan else "free"
-            email_service.send_subscription_cancellation_email(
+            await asyncio.to_thread(email_service.send_subscription_cancellation_email,
                 db_user, 
                 plan_for_email, 
                 cancellation_date
@@ -6526,49 +9587,6 @@ async def cancel_subscription(
         db.close()
 
 
-async def verify_cancellation(stripe_customer_id: str):
-    """Verify cancellation and downgrade when period ends"""
-    db = SessionLocal()
-    try:
-        # Check every day until period ends
-        while True:
-            await asyncio.sleep(86400)  # 24 hours
-            
-            subscriptions = stripe.Subscription.list(
-                customer=stripe_customer_id,
-                status="all"
-            )
-            
-            active_subs = [sub for sub in subscriptions.data if sub.status == "active"]
-            
-            # If no active subs, downgrade to free
-            if not active_subs:
-                user = db.query(User).filter(
-                    User.stripe_customer_id == stripe_customer_id
-                ).first()
-                
-                if user and user.plan == "canceling":
-                    user.plan = "free"
-                    user.cancellation_date = subscriptions.current_period_end  # from Stripe
-                    db.commit()
-                    print(f"Downgraded user {user.id} to free plan")
-                    break
-            
-            # Check if any subscription is still active but ending soon
-            ending_soon = False
-            for sub in active_subs:
-                if sub.cancel_at_period_end and sub.current_period_end > time.time():
-                    ending_soon = True
-                    break
-                    
-            if not ending_soon:
-                break
-                
-    except Exception as e:
-        print(f"Verification failed: {str(e)}")
-    finally:
-        db.close()
-        
 @app.post("/checkout/{plan_type}")
 async def create_checkout_session(request: Request, plan_type: str):
     # Use get_optional_user instead of try/except
@@ -6699,16 +9717,17 @@ async def generate_tweet_api(
     job: str = Form(...),
     goal: str = Form(...),
     tone: str = Form('balanced'),  # Add tone with default
-    api_key: str = Header(None)
+    api_key: str = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """API endpoint for generating tweets with tone control"""
-    db = SessionLocal()
     try:
         # Validate API key
         if not api_key:
             raise HTTPException(status_code=401, detail="API key required")
         
-        user = db.query(User).filter(User.api_key == api_key).first()
+        result = await db.execute(select(User).filter(User.api_key == api_key))
+        user = result.scalars().first()
         if not user:
             raise HTTPException(status_code=401, detail="Invalid API key")
         
@@ -6732,10 +9751,7 @@ async def generate_tweet_api(
         
         # Check daily usage limits
         today = str(date.today())
-        usage = db.query(Usage).filter(
-            Usage.user_id == user.id,
-            Usage.date == today
-        ).first()
+        usage = await get_usage_async(db, user.id, today)
         
         daily_limit = features["daily_limit"]
         if usage and daily_limit != float("inf") and usage.count >= daily_limit:
@@ -6754,13 +9770,9 @@ async def generate_tweet_api(
                 detail="Failed to generate tweet"
             )
         
-        # Save to history
-        generated_tweet = GeneratedTweet(
-            user_id=user.id,
-            tweet_text=tweets[0],
-            generated_at=datetime.utcnow()
-        )
-        db.add(generated_tweet)
+        # Save to history (bulk-inserted by the write buffer)
+        tweet_buffer.add(db, user.id, tweets[:1])
+        log_request_activity(request, user.id, "tweet_generated", "Generated via API", {"count": 1})
         
         # Update usage
         if not usage:
@@ -6769,7 +9781,7 @@ async def generate_tweet_api(
         else:
             usage.count += 1
         
-        db.commit()
+        await db.commit()
         
         return {
             "tweet": tweets[0],
@@ -6781,13 +9793,11 @@ async def generate_tweet_api(
         raise  # Re-raise HTTP exceptions
     except Exception as e:
         logger.error(f"API error: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, 
             detail="An error occurred. Please try again."
         )
-    finally:
-        db.close()
 
 # Update success handler to change user's plan
 @app.get("/checkout/success")
@@ -6829,6 +9839,7 @@ async def checkout_success(request: Request, session_id: str = None):
         
         next_billing_date = None
         amount = 0
+        subscription = None
         
         if subscription_id:
             try:
@@ -6903,6 +9914,10 @@ async def checkout_success(request: Request, session_id: str = None):
                 db_user.plan = plan_name
                 db_user.stripe_subscription_id = subscription_id
                 db_user.subscription_status = 'active'
+
+                # Mirror the subscription now so /account is right before the webhook lands
+                if subscription is not None:
+                    db.execute(stripe_subscription_upsert(db.get_bind().dialect.name, subscription, int(time.time())))
                 
                 if next_billing_date:
                     db_user.subscription_end_date = next_billing_date
@@ -7057,7 +10072,7 @@ async def get_ai_tweets(prompt, count=5, tone='balanced'):
         system_prompt = build_system_prompt(tone)
         
 
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="openai/gpt-4o-mini",
             messages=[
                 {
@@ -7103,17 +10118,14 @@ def complete_onboarding_get(request: Request, user: User = Depends(get_current_u
     return templates.TemplateResponse("onboarding.html", {"request": request, "user": user})
 
 @app.get("/blog", response_class=HTMLResponse)
-async def blog_index(request: Request, db: Session = Depends(get_db_session)):
+async def blog_index(request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """Blog listing page"""
-    posts = db.query(BlogPost).filter(BlogPost.published == True).order_by(BlogPost.created_at.desc()).all()
+    result = await db.execute(
+        select(BlogPost).filter(BlogPost.published == True).order_by(BlogPost.created_at.desc())
+    )
+    posts = result.scalars().all()
     
-    user = None
-    token = request.cookies.get("access_token")
-    if token:
-        try:
-            user = get_current_user(token.replace("Bearer ", ""), db)
-        except:
-            pass
+    user = await get_optional_user_async(request, db)
     
     return templates.TemplateResponse("blog_index.html", {
         "request": request,
@@ -7122,28 +10134,31 @@ async def blog_index(request: Request, db: Session = Depends(get_db_session)):
     })
 
 @app.get("/blog/{slug}", response_class=HTMLResponse)
-async def blog_post(slug: str, request: Request, db: Session = Depends(get_db_session)):
+async def blog_post(slug: str, request: Request, db: AsyncSession = Depends(get_async_read_db)):
     """Individual blog post page"""
-    post = db.query(BlogPost).filter(BlogPost.slug == slug, BlogPost.published == True).first()
+    result = await db.execute(
+        select(BlogPost).filter(BlogPost.slug == slug, BlogPost.published == True)
+    )
+    post = result.scalars().first()
     
     if not post:
         raise HTTPException(status_code=404, detail="Blog post not found")
     
-    post.views += 1
-    db.commit()
+    # Atomic increment on the primary; the post itself may come from the replica
+    await db.execute(
+        update(BlogPost).where(BlogPost.id == post.id).values(views=BlogPost.views + 1)
+    )
+    await db.commit()
     
-    related_posts = db.query(BlogPost).filter(
-        BlogPost.published == True,
-        BlogPost.id != post.id
-    ).order_by(BlogPost.created_at.desc()).limit(3).all()
+    result = await db.execute(
+        select(BlogPost).filter(
+            BlogPost.published == True,
+            BlogPost.id != post.id
+        ).order_by(BlogPost.created_at.desc()).limit(3)
+    )
+    related_posts = result.scalars().all()
     
-    user = None
-    token = request.cookies.get("access_token")
-    if token:
-        try:
-            user = get_current_user(token.replace("Bearer ", ""), db)
-        except:
-            pass
+    user = await get_optional_user_async(request, db)
     
     return templates.TemplateResponse("blog_post.html", {
         "request": request,
@@ -7153,28 +10168,21 @@ async def blog_post(slug: str, request: Request, db: Session = Depends(get_db_se
     })
 
 @app.get("/dashboard", response_class=HTMLResponse)
-def user_dashboard(
+async def user_dashboard(
     request: Request,
     success: str = None,
     error: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     csrf_protect: CsrfProtect = Depends()
 ):
     # Get user without requiring authentication
-    current_user = get_optional_user(request)
+    current_user = await get_optional_user_async(request, db)
 
     if current_user is None:
         return RedirectResponse(url="/login", status_code=303)
     
     show_verification_banner = not current_user.is_active
     
-    # Redirect to 404 if not authenticated
-    if not current_user:
-        return templates.TemplateResponse("404.html", {
-            "request": request,
-            "user": None
-        }, status_code=404)
-    
     """User dashboard - For regular users (NOT admin)"""
     # Generate CSRF token ONCE
     csrf_response = csrf_protect.generate_csrf()
@@ -7185,11 +10193,11 @@ def user_dashboard(
     
     # Get user's usage for today
     today = str(date.today())
-    usage = db.query(Usage).filter(Usage.user_id == current_user.id, Usage.date == today).first()
+    usage = await get_usage_async(db, current_user.id, today)
     if not usage:
         usage = Usage(user_id=current_user.id, date=today, count=0)
         db.add(usage)
-        db.commit()
+        await db.commit()
     
     # Calculate tweets left properly handling unlimited
     daily_limit = current_user.features["daily_limit"]
@@ -7201,20 +10209,16 @@ def user_dashboard(
         tweets_used = usage.count
     
     # Get recent tweets
-    recent_tweets = db.query(GeneratedTweet).filter(
-        GeneratedTweet.user_id == current_user.id
-    ).order_by(GeneratedTweet.generated_at.desc()).limit(10).all()
+    recent_tweets = await get_recent_tweets_async(db, current_user.id, limit=10)
 
     # Check if this is their first tweet ever
-    total_usage = db.query(Usage).filter(Usage.user_id == current_user.id).all()
-    total_tweets = sum([u.count for u in total_usage])
+    total_tweets = await db.scalar(
+        select(func.coalesce(func.sum(Usage.count), 0)).filter(Usage.user_id == current_user.id)
+    )
 
     if total_tweets == 1:  # Just generated their first tweet
-        # Schedule Day 1 follow-up
-        schedule_day1_followup(current_user.id, db)
-        # Also schedule Day 3 and Day 7 (will be cancelled if they stay active)
-        schedule_day3_nudge(current_user.id, db)
-        schedule_day7_reengagement(current_user.id, db)
+        # Schedule Day 1 follow-up, plus Day 3 and Day 7 (cancelled if they stay active)
+        await schedule_onboarding_emails_async(current_user.id, db)
 
     response = templates.TemplateResponse("dashboard.html", {
         "request": request,
@@ -7246,12 +10250,14 @@ def user_dashboard(
 
 @app.post("/dashboard", response_class=HTMLResponse)
 @limiter.limit("30/hour")
-async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
-    db = SessionLocal()
-    
+async def generate(
+    request: Request,
+    csrf_protect: CsrfProtect = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
         # Get user first
-        user = get_current_user(request)
+        user = await get_current_user_async(request, db)
         if user is None:
             return RedirectResponse(url="/login?next=/dashboard", status_code=303)
         
@@ -7270,7 +10276,7 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
                 existing_token = existing_token[0]
             
             today = str(date.today())
-            usage = db.query(Usage).filter(Usage.user_id == user.id, Usage.date == today).first()
+            usage = await get_usage_async(db, user.id, today)
             
             daily_limit = user.features["daily_limit"]
             tweets_left = "Unlimited" if daily_limit == float('inf') else max(0, daily_limit - (usage.count if usage else 0))
@@ -7290,7 +10296,7 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
         if csrf_token_from_cookie != csrf_token_from_form:
             existing_token = request.cookies.get("fastapi-csrf-token")
             today = str(date.today())
-            usage = db.query(Usage).filter(Usage.user_id == user.id, Usage.date == today).first()
+            usage = await get_usage_async(db, user.id, today)
             
             daily_limit = user.features["daily_limit"]
             tweets_left = "Unlimited" if daily_limit == float('inf') else max(0, daily_limit - (usage.count if usage else 0))
@@ -7326,7 +10332,7 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
 
             existing_token = request.cookies.get("fastapi-csrf-token")
             today = str(date.today())
-            usage = db.query(Usage).filter(Usage.user_id == user.id, Usage.date == today).first()
+            usage = await get_usage_async(db, user.id, today)
             
             daily_limit = user.features["daily_limit"]
             tweets_left = "Unlimited" if daily_limit == float('inf') else max(0, daily_limit - (usage.count if usage else 0))
@@ -7343,11 +10349,11 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
 
         # Get usage for today
         today = str(date.today())
-        usage = db.query(Usage).filter(Usage.user_id == user.id, Usage.date == today).first()
+        usage = await get_usage_async(db, user.id, today)
         if not usage:
             usage = Usage(user_id=user.id, date=today, count=0)
             db.add(usage)
-            db.commit()
+            await db.commit()
 
         # Calculate tweets left
         daily_limit = user.features["daily_limit"]
@@ -7379,24 +10385,19 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
         prompt = f"I'm a {job} trying to {goal}."
         tweets = await get_ai_tweets(prompt, count=tweet_count, tone=tone)  # ← PASS TONE
 
-        # Save to history
-        for tweet_text in tweets:
-            generated_tweet = GeneratedTweet(
-                user_id=user.id,
-                tweet_text=tweet_text,
-                generated_at=datetime.utcnow()
-            )
-            db.add(generated_tweet)
+        # Save to history (bulk-inserted by the write buffer)
+        tweet_buffer.add(db, user.id, tweets)
+        log_request_activity(request, user.id, "tweet_generated", f"Generated {len(tweets)} tweets", {"count": len(tweets)})
 
         # Update usage
         usage.count += len(tweets)
-        db.commit()
+        await db.commit()
 
         # Calculate remaining
         new_tweets_left = "Unlimited" if daily_limit == float('inf') else max(0, daily_limit - usage.count)
         existing_token = request.cookies.get("fastapi-csrf-token")
 
-        return templates.TemplateResponse("dashboard.html", {
+        response = templates.TemplateResponse("dashboard.html", {
             "request": request,
             "user": user,
             "features": user.features,
@@ -7407,6 +10408,8 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
             "csrf_token": existing_token,
             "recaptcha_site_key": os.getenv("RECAPTCHA_SITE_KEY")
         })
+        # /history right after generating must see these tweets
+        return mark_read_your_writes(response)
         
     except Exception as e:
         print(f"Dashboard generation error: {str(e)}")
@@ -7416,7 +10419,8 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
         existing_token = request.cookies.get("fastapi-csrf-token")
         
         try:
-            user = get_current_user(request)
+            await db.rollback()
+            user = await get_current_user_async(request, db)
             user = apply_plan_features(user)
         except:
             user = None
@@ -7431,20 +10435,10 @@ async def generate(request: Request, csrf_protect: CsrfProtect = Depends()):
             "csrf_token": existing_token,
             "recaptcha_site_key": os.getenv("RECAPTCHA_SITE_KEY")
         })
-        
-    finally:
-        db.close()
 
 @app.get("/quiz", response_class=HTMLResponse)
 async def quiz_page(request: Request):
-    db = SessionLocal()
-    user = None
-    token = request.cookies.get("access_token")
-    if token:
-        try:
-            user = get_current_user(token.replace("Bearer ", ""), db)
-        except:
-            pass
+    user = get_optional_user(request)
     return templates.TemplateResponse("quiz.html", {
         "request": request,
         "user": user
@@ -7452,14 +10446,7 @@ async def quiz_page(request: Request):
     
 @app.get("/quiz", response_class=HTMLResponse)
 async def quiz_page(request: Request):
-    db = SessionLocal()
-    user = None
-    token = request.cookies.get("access_token")
-    if token:
-        try:
-            user = get_current_user(token.replace("Bearer ", ""), db)
-        except:
-            pass
+    user = get_optional_user(request)
     return templates.TemplateResponse("quiz.html", {
         "request": request,
         "user": user
@@ -7467,662 +10454,12 @@ async def quiz_page(request: Request):
 
 @app.get("/what-type-of-bluesky-creator-are-you-quiz", response_class=HTMLResponse)
 async def quiz_page(request: Request):
-    db = SessionLocal()
-    user = None
-    token = request.cookies.get("access_token")
-    if token:
-        try:
-            user = get_current_user(token.replace("Bearer ", ""), db)
-        except:
-            pass
+    user = get_optional_user(request)
     return templates.TemplateResponse("bluesky1.html", {
         "request": request,
         "user": user
     })
 
-# Fixed Email Templates with simpler CSS
-EMAIL_TEMPLATES = {
-    "welcome": {
-        "subject": "Welcome to GiverAI! Your Twitter Content Creation Journey Starts Now 🚀",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { 
-                    font-family: Arial, sans-serif; 
-                    line-height: 1.6; 
-                    color: #333; 
-                    margin: 0; 
-                    padding: 0; 
-                }
-                .container { 
-                    max-width: 600px; 
-                    margin: 0 auto; 
-                    padding: 20px; 
-                }
-                .header { 
-                    background: #667eea; 
-                    color: white; 
-                    padding: 30px; 
-                    text-align: center; 
-                    border-radius: 8px 8px 0 0; 
-                }
-                .content { 
-                    background: white; 
-                    padding: 30px; 
-                    border-radius: 0 0 8px 8px; 
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1); 
-                }
-                .button { 
-                    display: inline-block; 
-                    background: #667eea; 
-                    color: white; 
-                    padding: 12px 24px; 
-                    text-decoration: none; 
-                    border-radius: 6px; 
-                    margin: 15px 0; 
-                }
-                .feature-box { 
-                    background: #f8f9fa; 
-                    padding: 15px; 
-                    margin: 10px 0; 
-                    border-left: 4px solid #667eea; 
-                    border-radius: 4px; 
-                }
-                .footer { 
-                    text-align: center; 
-                    margin-top: 30px; 
-                    color: #666; 
-                    font-size: 12px; 
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Welcome to GiverAI! 🎉</h1>
-                    <p>Your AI-powered Twitter content creation platform</p>
-                </div>
-                <div class="content">
-                    <h2>Hi {username}! 👋</h2>
-                    <div class="feature-box">
-                    <h3>📧 Your Account Details</h3>
-                    <p><strong>👤 Username:</strong> {username}</p>
-                    <p><strong>📧 Email:</strong> {email}</p>
-                    <p>Use either to log in anytime!</p>
-                </div>
-
-                    <p>We're thrilled to have you join our community of content creators who are transforming their Twitter presence with AI.</p>
-                    
-                    <div class="feature-box">
-                        <h3>🚀 What's Next?</h3>
-                        <p>Complete your profile setup and start generating engaging tweets tailored to your industry and goals.</p>
-                    </div>
-                    
-                    <div class="feature-box">
-                        <h3>✨ Your Free Plan Includes:</h3>
-                        <ul>
-                            <li>15 AI-generated tweets per day</li>
-                            <li>Basic customization options</li>
-                            <li>1-day tweet history</li>
-                        </ul>
-                    </div>
-                    
-                    <p>Ready to create your first viral tweet?</p>
-                    <a href="{login_url}" class="button">Start Creating Tweets</a>
-                    
-                    <p>Need help getting started? Check out our <a href="{help_url}">quick start guide</a> or reply to this email with any questions.</p>
-                    
-                    <p>Happy tweeting!</p>
-                    <p><strong>The GiverAI Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>You received this email because you signed up for GiverAI.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    },
-    
-    "verification": {
-        "subject": "Verify Your GiverAI Account - Almost Ready! ✅",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { 
-                    font-family: Arial, sans-serif; 
-                    line-height: 1.6; 
-                    color: #333; 
-                    margin: 0; 
-                    padding: 0; 
-                }
-                .container { 
-                    max-width: 600px; 
-                    margin: 0 auto; 
-                    padding: 20px; 
-                }
-                .header { 
-                    background: #667eea; 
-                    color: white; 
-                    padding: 30px; 
-                    text-align: center; 
-                    border-radius: 8px 8px 0 0; 
-                }
-                .content { 
-                    background: white; 
-                    padding: 30px; 
-                    border-radius: 0 0 8px 8px; 
-                    box-shadow: 0 2px 10px rgba(0,0,0,0.1); 
-                }
-                .verify-button { 
-                    display: inline-block; 
-                    background: #28a745; 
-                    color: white; 
-                    padding: 15px 30px; 
-                    text-decoration: none; 
-                    border-radius: 6px; 
-                    margin: 20px 0; 
-                    font-size: 18px; 
-                    font-weight: bold; 
-                }
-                .verification-code { 
-                    background: #f8f9fa; 
-                    padding: 20px; 
-                    margin: 20px 0; 
-                    text-align: center; 
-                    border-radius: 8px; 
-                    border: 2px dashed #667eea; 
-                }
-                .footer { 
-                    text-align: center; 
-                    margin-top: 30px; 
-                    color: #666; 
-                    font-size: 12px; 
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Verify Your Email 📧</h1>
-                    <p>One more step to unlock GiverAI</p>
-                </div>
-                <div class="content">
-                    <h2>Hi {username}!</h2>
-                    <p>Thanks for signing up for GiverAI! To complete your registration and start creating amazing tweets, please verify your email address.</p>
-                    
-                    <div style="text-align: center;">
-                        <a href="{verification_url}" class="verify-button">Verify Email Address</a>
-                    </div>
-                    
-                    <div class="verification-code">
-                        <p><strong>Verification Code:</strong></p>
-                        <h2 style="color: #667eea; font-size: 24px; margin: 10px 0;">{verification_code}</h2>
-                        <p><small>Use this code if the button above doesn't work</small></p>
-                    </div>
-                    
-                    <p><strong>This verification link expires in 24 hours.</strong></p>
-                    
-                    <p>If you didn't create an account with GiverAI, please ignore this email.</p>
-                    
-                    <p>Best regards,<br><strong>The GiverAI Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>This verification email was sent to {email}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    },
-    
-    "account_changed": {
-        "subject": "Your GiverAI Account Was Updated 🔐",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); color: white; padding: 25px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
-                .alert-box { background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; margin: 20px 0; border-radius: 6px; }
-                .change-details { background: #f8f9fa; padding: 15px; margin: 15px 0; border-radius: 6px; }
-                .button { display: inline-block; background: #dc3545; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 15px 0; }
-                .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Account Security Alert 🔐</h1>
-                    <p>Important changes to your GiverAI account</p>
-                </div>
-                <div class="content">
-                    <h2>Hi {username},</h2>
-                    
-                    <div class="alert-box">
-                        <p><strong>⚠️ Your account information was recently updated</strong></p>
-                    </div>
-                    
-                    <div class="change-details">
-                        <h3>What Changed:</h3>
-                        <p>{change_details}</p>
-                        <p><strong>When:</strong> {timestamp}</p>
-                        <p><strong>IP Address:</strong> {ip_address}</p>
-                    </div>
-                    
-                    <h3>Was this you?</h3>
-                    <p>If you made this change, no action is needed. Your account is secure.</p>
-                    
-                    <p><strong>If you didn't make this change:</strong></p>
-                    <ol>
-                        <li>Change your password immediately</li>
-                        <li>Review your account settings</li>
-                        <li>Contact our support team</li>
-                    </ol>
-                    
-                    <a href="{account_url}" class="button">Secure My Account</a>
-                    
-                    <p>For your security, we recommend using a strong, unique password and enabling two-factor authentication.</p>
-                    
-                    <p>If you need help, please contact us at support@giverai.me</p>
-                    
-                    <p>Stay secure,<br><strong>The GiverAI Security Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>This security alert was sent to {email}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    },
-    
-    "subscription_changed": {
-        "subject": "Your GiverAI Subscription Has Been Updated 💼",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
-                .plan-box { background: linear-gradient(135deg, #667eea, #764ba2); color: white; padding: 20px; margin: 20px 0; border-radius: 8px; text-align: center; }
-                .feature-list { background: #f8f9fa; padding: 20px; margin: 15px 0; border-radius: 6px; }
-                .button { display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 15px 0; }
-                .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Subscription Updated! 🎉</h1>
-                    <p>Your GiverAI plan has changed</p>
-                </div>
-                <div class="content">
-                    <h2>Hi {username}!</h2>
-                    
-                    <div class="plan-box">
-                        <h2>🚀 Welcome to {new_plan}!</h2>
-                        <p>{plan_description}</p>
-                    </div>
-                    
-                    <h3>What's New in Your Plan:</h3>
-                    <div class="feature-list">
-                        {new_features}
-                    </div>
-                    
-                    <h3>Billing Details:</h3>
-                    <ul>
-                        <li><strong>Plan:</strong> {new_plan}</li>
-                        <li><strong>Next Billing Date:</strong> {next_billing_date}</li>
-                        <li><strong>Amount:</strong> {amount}</li>
-                    </ul>
-                    
-                    <p>Your new features are active immediately. Start exploring them now!</p>
-                    
-                    <a href="{dashboard_url}" class="button">Explore New Features</a>
-                    
-                    <p>Questions about your subscription? Check our <a href="{billing_url}">billing FAQ</a> or contact support.</p>
-                    
-                    <p>Thanks for choosing GiverAI!</p>
-                    <p><strong>The GiverAI Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>Manage your subscription: {billing_url}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    },
-    
-    "team_invitation": {
-        "subject": "You've Been Invited to Join {team_owner}'s GiverAI Team! 👥",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
-                .invitation-box { background: #e3f2fd; padding: 20px; margin: 20px 0; border-radius: 8px; border-left: 4px solid #2196f3; }
-                .accept-button { display: inline-block; background: #28a745; color: white; padding: 15px 30px; text-decoration: none; border-radius: 6px; margin: 15px 10px 15px 0; font-weight: bold; }
-                .decline-button { display: inline-block; background: #6c757d; color: white; padding: 15px 30px; text-decoration: none; border-radius: 6px; margin: 15px 0; font-weight: bold; }
-                .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Team Invitation 📨</h1>
-                    <p>You've been invited to collaborate!</p>
-                </div>
-                <div class="content">
-                    <h2>Hi there! 👋</h2>
-                    
-                    <div class="invitation-box">
-                        <h3>🎉 You're Invited!</h3>
-                        <p><strong>{team_owner}</strong> has invited you to join their GiverAI team as a <strong>{role}</strong>.</p>
-                    </div>
-                    
-                    <h3>What This Means:</h3>
-                    <ul>
-                        <li>✅ Access to the team's GiverAI workspace</li>
-                        <li>✅ Collaborate on tweet generation and content strategy</li>
-                        <li>✅ Share and manage team-generated content</li>
-                        <li>✅ {role_permissions}</li>
-                    </ul>
-                    
-                    <h3>About the Team:</h3>
-                    <p><strong>Team:</strong> {team_name}<br>
-                    <strong>Plan:</strong> {team_plan}<br>
-                    <strong>Industry:</strong> {team_industry}</p>
-                    
-                    <p>Ready to start collaborating on amazing Twitter content?</p>
-                    
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="{accept_url}" class="accept-button">Accept Invitation</a>
-                        <a href="{decline_url}" class="decline-button">Decline</a>
-                    </div>
-                    
-                    <p><small>This invitation expires in 7 days. If you don't have a GiverAI account, you'll be prompted to create one.</small></p>
-                    
-                    <p>Questions? Contact {team_owner} or our support team at support@giverai.me</p>
-                    
-                    <p>Looking forward to having you on the team!</p>
-                    <p><strong>The GiverAI Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>This invitation was sent to {email} by {team_owner}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    },
-
-    "forgot_password": {
-        "subject": "Reset Your GiverAI Password 🔐",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: #667eea; color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
-                .reset-button { display: inline-block; background: #28a745; color: white; padding: 15px 30px; text-decoration: none; border-radius: 6px; margin: 20px 0; font-size: 18px; font-weight: bold; }
-                .security-notice { background: #fff3cd; padding: 15px; margin: 20px 0; border-radius: 6px; border: 1px solid #ffeaa7; }
-                .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Password Reset Request 🔐</h1>
-                    <p>Reset your GiverAI password</p>
-                </div>
-                <div class="content">
-                    <h2>Hi {username}!</h2>
-                    <p>We received a request to reset your password for your GiverAI account.</p>
-                    
-                    <div style="text-align: center;">
-                        <a href="{reset_url}" class="reset-button">Reset My Password</a>
-                    </div>
-                    
-                    <div class="security-notice">
-                        <h3>🛡️ Security Information:</h3>
-                        <ul>
-                            <li>This link expires in <strong>1 hour</strong></li>
-                            <li>Request made from IP: <strong>{ip_address}</strong></li>
-                            <li>If you didn't request this, please ignore this email</li>
-                        </ul>
-                    </div>
-                    
-                    <p>If the button above doesn't work, copy and paste this link into your browser:</p>
-                    <p style="word-break: break-all; background: #f8f9fa; padding: 10px; border-radius: 4px;">
-                        {reset_url}
-                    </p>
-                    
-                    <p>If you didn't request a password reset, your account is still secure and no action is needed.</p>
-                    
-                    <p>Need help? Contact us at support@giverai.me</p>
-                    
-                    <p>Best regards,<br><strong>The GiverAI Security Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>This password reset email was sent to {email}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    },
-    
-    "forgot_username": {
-        "subject": "Your GiverAI Username Reminder 👤",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: #667eea; color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
-                .username-box { background: #e3f2fd; padding: 20px; margin: 20px 0; text-align: center; border-radius: 8px; border: 2px solid #2196f3; }
-                .login-button { display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 15px 0; }
-                .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Username Reminder 👤</h1>
-                    <p>Here's your GiverAI username</p>
-                </div>
-                <div class="content">
-                    <h2>Hi there!</h2>
-                    <p>You requested a reminder of your GiverAI username. Here it is:</p>
-                    
-                    <div class="username-box">
-                        <h3>Your Username:</h3>
-                        <h2 style="color: #667eea; font-size: 24px; margin: 10px 0;">{username}</h2>
-                    </div>
-                    
-                    <p>Now you can log in to your GiverAI account:</p>
-                    <div style="text-align: center;">
-                        <a href="{login_url}" class="login-button">Log In to GiverAI</a>
-                    </div>
-                    
-                    <p><strong>Account Details:</strong></p>
-                    <ul>
-                        <li>Username: <strong>{username}</strong></li>
-                        <li>Email: <strong>{email}</strong></li>
-                        <li>Plan: <strong>{plan}</strong></li>
-                        <li>Member since: <strong>{member_since}</strong></li>
-                    </ul>
-                    
-                    <p>If you also forgot your password, you can <a href="{forgot_password_url}">reset it here</a>.</p>
-                    
-                    <p>If you didn't request this reminder, please ignore this email.</p>
-                    
-                    <p>Happy tweeting!</p>
-                    <p><strong>The GiverAI Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>This username reminder was sent to {email}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    },
-    
-    "password_reset_success": {
-        "subject": "Your GiverAI Password Has Been Changed ✅",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: #28a745; color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
-                .success-box { background: #d4edda; padding: 15px; margin: 20px 0; border-radius: 6px; border: 1px solid #c3e6cb; }
-                .security-tips { background: #f8f9fa; padding: 20px; margin: 20px 0; border-radius: 6px; }
-                .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Password Changed Successfully! ✅</h1>
-                    <p>Your GiverAI account is secure</p>
-                </div>
-                <div class="content">
-                    <h2>Hi {username}!</h2>
-                    
-                    <div class="success-box">
-                        <h3>🎉 Password Updated!</h3>
-                        <p>Your GiverAI password has been successfully changed.</p>
-                        <p><strong>When:</strong> {timestamp}</p>
-                        <p><strong>IP Address:</strong> {ip_address}</p>
-                    </div>
-                    
-                    <div class="security-tips">
-                        <h3>🛡️ Security Tips:</h3>
-                        <ul>
-                            <li>Keep your password private and secure</li>
-                            <li>Use a unique password for your GiverAI account</li>
-                            <li>Consider using a password manager</li>
-                            <li>Log out from shared or public computers</li>
-                        </ul>
-                    </div>
-                    
-                    <p>If you didn't change your password, please contact our support team immediately at support@giverai.me</p>
-                    
-                    <p>Your account security is our priority. Thank you for keeping your account safe!</p>
-                    
-                    <p>Best regards,<br><strong>The GiverAI Security Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>This notification was sent to {email}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-          },
-    
-    "goodbye": {
-        "subject": "We're Sorry to See You Go - Your GiverAI Account Has Been Deleted 👋",
-        "body": """
-        <html>
-        <head>
-            <style>
-                body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); color: white; padding: 30px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
-                .data-box { background: #fff3cd; padding: 15px; margin: 20px 0; border-radius: 6px; border: 1px solid #ffeaa7; }
-                .feedback-box { background: #e3f2fd; padding: 20px; margin: 20px 0; border-radius: 8px; }
-                .button { display: inline-block; background: #667eea; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; margin: 15px 0; }
-                .footer { text-align: center; margin-top: 30px; color: #666; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Account Deleted 😢</h1>
-                    <p>We're sorry to see you go, {username}</p>
-                </div>
-                <div class="content">
-                    <h2>Your GiverAI account has been successfully deleted</h2>
-                    
-                    <div class="data-box">
-                        <h3>🗑️ Data Removal</h3>
-                        <p>As requested, we have permanently deleted:</p>
-                        <ul>
-                            <li>Your account profile and settings</li>
-                            <li>All generated tweets and content history</li>
-                            <li>Usage data and analytics</li>
-                            <li>Team memberships and collaborations</li>
-                            <li>Billing and subscription information</li>
-                        </ul>
-                        <p><strong>This action cannot be undone.</strong></p>
-                    </div>
-                    
-                    <h3>Thank You for Using GiverAI</h3>
-                    <p>We appreciate the time you spent with us. During your journey, you:</p>
-                    <ul>
-                        <li>📝 Generated {total_tweets} tweets</li>
-                        <li>📅 Were with us for {days_active} days</li>
-                        <li>🎯 Used the {plan_name} plan</li>
-                    </ul>
-                    
-                    <div class="feedback-box">
-                        <h3>💬 Help Us Improve</h3>
-                        <p>We'd love to hear why you decided to leave. Your feedback helps us make GiverAI better for everyone.</p>
-                        <a href="{feedback_url}" class="button">Share Feedback</a>
-                        <p><small>This survey takes less than 2 minutes and is completely anonymous.</small></p>
-                    </div>
-                    
-                    <h3>Changed Your Mind?</h3>
-                    <p>You're always welcome back! If you decide to return, you can create a new account anytime, though your previous data cannot be restored.</p>
-                    
-                    <a href="{signup_url}" class="button">Return to GiverAI</a>
-                    
-                    <p>We hope our paths cross again in the future. Until then, we wish you all the best with your content creation journey!</p>
-                    
-                    <p>Farewell and best wishes,</p>
-                    <p><strong>The GiverAI Team</strong></p>
-                </div>
-                <div class="footer">
-                    <p>GiverAI - AI-Powered Twitter Content Creation</p>
-                    <p>This confirmation was sent to {email}</p>
-                    <p>You will not receive any further emails from us.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-    }
-}
-
 @app.post("/complete-onboarding")
 def complete_onboarding_post(request: Request,
                             role: str = Form(...),
@@ -8150,176 +10487,675 @@ def complete_onboarding_post(request: Request,
 async def stripe_webhook_health():
     return {"status": "Webhook endpoint active"}
 
-@app.api_route("/stripe-webhook", methods=["POST"])
-async def stripe_webhook(request: Request):
-    db = SessionLocal()
-    try:
-        payload = await request.body()
-        sig_header = request.headers.get("stripe-signature")
-        
+STRIPE_EVENT_WORKERS = int(os.getenv("STRIPE_EVENT_WORKERS", 4))
+STRIPE_EVENT_BATCH_SIZE = int(os.getenv("STRIPE_EVENT_BATCH_SIZE", 20))
+STRIPE_EVENT_POLL_SECONDS = float(os.getenv("STRIPE_EVENT_POLL_SECONDS", 30))
+STRIPE_EVENT_LEASE_SECONDS = int(os.getenv("STRIPE_EVENT_LEASE_SECONDS", 120))
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", 8))
+STRIPE_EVENT_BACKOFF_SECONDS = int(os.getenv("STRIPE_EVENT_BACKOFF_SECONDS", 15))
+STRIPE_EVENT_BACKOFF_MAX_SECONDS = int(os.getenv("STRIPE_EVENT_BACKOFF_MAX_SECONDS", 3600))
+# Stripe redelivers for up to 3 days; processed ids are kept well past that
+STRIPE_EVENT_KEEP_DAYS = int(os.getenv("STRIPE_EVENT_KEEP_DAYS", 30))
+
+def stripe_event_customer(event: dict) -> Optional[str]:
+    obj = event.get("data", {}).get("object", {})
+    customer = obj.get("customer")
+    if isinstance(customer, dict):
+        customer = customer.get("id")
+    if not customer and obj.get("object") == "customer":
+        customer = obj.get("id")
+    return customer
+
+STRIPE_LIVE_SUBSCRIPTION_STATUSES = ("active", "trialing", "past_due", "unpaid")
+
+def _stripe_timestamp(value) -> Optional[datetime]:
+    return datetime.utcfromtimestamp(value) if value else None
+
+def stripe_subscription_upsert(dialect_name: str, subscription, stripe_updated: int):
+    """INSERT ... ON CONFLICT for a subscription object (event payload dict or
+    StripeObject). Rows only move forward: a state older than stripe_updated
+    of the stored row is ignored."""
+    items = (subscription.get("items") or {}).get("data") or []
+    first_item = items[0] if items else {}
+    # Newer API versions report the billing period on the items
+    period_end = subscription.get("current_period_end") or first_item.get("current_period_end")
+    values = {
+        "id": subscription["id"],
+        "customer_id": subscription["customer"],
+        "status": subscription["status"],
+        "price_id": (first_item.get("price") or {}).get("id"),
+        "cancel_at_period_end": bool(subscription.get("cancel_at_period_end")),
+        "current_period_end": _stripe_timestamp(period_end),
+        "canceled_at": _stripe_timestamp(subscription.get("canceled_at")),
+        "ended_at": _stripe_timestamp(subscription.get("ended_at")),
+        "stripe_updated": stripe_updated,
+        "synced_at": datetime.utcnow()
+    }
+    dialect_insert = postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = dialect_insert(StripeSubscription).values(**values)
+    return stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_={name: stmt.excluded[name] for name in values if name != "id"},
+        where=StripeSubscription.stripe_updated <= stmt.excluded.stripe_updated
+    )
+
+async def get_current_subscription_async(db: AsyncSession, customer_id: str) -> Optional[StripeSubscription]:
+    """The customer's live subscription from the mirror, or their latest one"""
+    result = await db.execute(
+        select(StripeSubscription)
+        .where(StripeSubscription.customer_id == customer_id)
+        .order_by(
+            StripeSubscription.status.in_(STRIPE_LIVE_SUBSCRIPTION_STATUSES).desc(),
+            StripeSubscription.current_period_end.desc()
+        )
+        .limit(1)
+    )
+    return result.scalars().first()
+
+async def stripe_event_superseded(db: AsyncSession, event: dict) -> bool:
+    """True when a later event for the same customer has already been applied,
+    as happens when a dead-lettered event is retried from the admin page"""
+    customer_id = stripe_event_customer(event)
+    if not customer_id or not event.get("created"):
+        return False
+    result = await db.execute(
+        select(StripeEvent.id)
+        .where(
+            StripeEvent.customer_id == customer_id,
+            StripeEvent.status == "processed",
+            StripeEvent.created > event["created"],
+            StripeEvent.id != event["id"]
+        )
+        .limit(1)
+    )
+    return result.first() is not None
+
+async def apply_stripe_event(db: AsyncSession, event: dict):
+    """Apply one Stripe event to db's transaction. The caller commits, so the
+    changes, the queued emails and marking the event processed land together;
+    raising leaves nothing behind and the event is retried. An event older
+    than state already applied only touches the mirror, which ignores it."""
+    event_type = event["type"]
+    obj = event["data"]["object"]
+    dialect_name = db.get_bind().dialect.name
+
+    stale = await stripe_event_superseded(db, event)
+    if event_type.startswith("customer.subscription."):
+        result = await db.execute(stripe_subscription_upsert(dialect_name, obj, event["created"]))
+        stale = stale or not result.rowcount
+    if stale:
+        print(f"⏭️ Stripe event {event['id']} ({event_type}) is older than state already applied, skipping")
+        return
+
+    # Handle subscription updated (when user cancels)
+    if event_type == "customer.subscription.updated":
+        user = await get_user_by_customer_id_async(db, obj["customer"])
+        if not user:
+            return
+        if obj.get("cancel_at_period_end", False):
+            # User canceled - mark as canceling
+            if not user.cancel_at_period_end:
+                print(f"🔔 User {user.id} canceled subscription")
+                if user.plan and user.plan not in ["free", "canceling"]:
+                    user.original_plan = user.plan
+                else:
+                    user.original_plan = None
+                user.cancel_at_period_end = True
+
+                # Store cancellation date
+                period_end = obj.get("current_period_end")
+                if period_end:
+                    user.cancellation_date = datetime.fromtimestamp(period_end)
+
+                plan_for_email = user.original_plan if user.original_plan else user.plan
+                await queue_email(db, "subscription_cancellation", user, plan_for_email, user.cancellation_date)
+        elif user.cancel_at_period_end:
+            # User reactivated - restore plan
+            print(f"🔄 User {user.id} reactivated subscription")
+            if user.original_plan:
+                user.plan = user.original_plan
+            user.cancel_at_period_end = False
+            user.cancellation_date = None
+
+    # Handle subscription deleted/ended event
+    elif event_type == "customer.subscription.deleted":
+        # Find user and downgrade to free
+        user = await get_user_by_customer_id_async(db, obj["customer"])
+        if not user:
+            return
+        print(f"🔽 Downgrading user {user.id} to free plan")
+        old_plan = user.original_plan or user.plan
+
+        user.plan = "free"
+        user.cancellation_date = None
+        user.cancel_at_period_end = False
+        user.original_plan = None
+
+        if old_plan and old_plan not in ["free", "canceling"]:
+            await queue_email(db, "subscription_downgrade", user, old_plan)
+
+    # Handle successful payment
+    elif event_type == "invoice.payment_succeeded":
+        customer_id = obj.get("customer")
+        subscription_id = obj.get("subscription")
+        if not customer_id or not subscription_id:
+            print("⚠️ Missing customer_id or subscription_id in invoice")
+            return
+
+        # Get subscription details to determine plan. A Stripe error
+        # propagates so the event is retried.
+        subscription = await asyncio.to_thread(stripe.Subscription.retrieve, subscription_id)
+        await db.execute(stripe_subscription_upsert(dialect_name, subscription, int(time.time())))
+        if not subscription.get("items") or not subscription["items"].get("data"):
+            print("⚠️ No items in subscription")
+            return
+        price_id = subscription["items"]["data"][0]["price"]["id"]
+
+        # Update user's plan based on price_id
+        user = await get_user_by_customer_id_async(db, customer_id)
+        if not user:
+            print(f"⚠️ User not found for customer_id: {customer_id}")
+            return
+        if price_id == os.getenv("STRIPE_CREATOR_PRICE_MONTHLY"):
+            user.plan = "creator_monthly"
+            print(f"✅ Updated user {user.id} to creator_monthly")
+        elif price_id == os.getenv("STRIPE_CREATOR_PRICE_YEARLY"):
+            user.plan = "creator_yearly"
+            print(f"✅ Updated user {user.id} to creator_yearly")
+        else:
+            print(f"⚠️ Unknown price_id: {price_id}")
+
+        # Clear cancellation status if they were canceling
+        if user.original_plan and user.plan != "canceling":
+            user.original_plan = None
+            user.cancellation_date = None
+
+    # Handle failed payment
+    elif event_type == "invoice.payment_failed":
+        customer_id = obj.get("customer")
+        if not customer_id:
+            print("⚠️ Missing customer_id in failed invoice")
+            return
+        user = await get_user_by_customer_id_async(db, customer_id)
+        if user:
+            print(f"⚠️ Payment failed for user {user.id}")
+        else:
+            print(f"⚠️ User not found for customer_id: {customer_id}")
+
+def stripe_event_backoff(attempts: int) -> float:
+    delay = min(STRIPE_EVENT_BACKOFF_SECONDS * (2 ** max(attempts - 1, 0)), STRIPE_EVENT_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+class StripeEventProcessor:
+    """Applies stored stripe_events in the background.
+
+    Only the oldest unfinished event of each customer is claimable, so a
+    customer's events apply one at a time in Stripe's created order, and
+    a failing event holds back that customer's later events until it
+    succeeds or is dead-lettered. Different customers are processed
+    concurrently, and several app processes can share the table: claims
+    use FOR UPDATE SKIP LOCKED and a lease. Each event is applied and
+    marked processed in one transaction, fenced on the lease, so a
+    redelivered or re-claimed event never applies twice. Failures retry
+    with exponential backoff up to STRIPE_EVENT_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, workers: int = STRIPE_EVENT_WORKERS, batch_size: int = STRIPE_EVENT_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._wakeup = None
+        self._task = None
+        self._last_purge = 0.0
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.retried = 0
+        self.dead = 0
+        self.lost_leases = 0
+        self.latency = LatencyHistogram()
+
+    async def store(self, db: AsyncSession, payload: str, event: dict) -> bool:
+        """Persist a verified event; False if it was already stored"""
+        dialect_insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        now = datetime.utcnow()
+        result = await db.execute(
+            dialect_insert(StripeEvent).values(
+                id=event["id"],
+                type=event["type"],
+                customer_id=stripe_event_customer(event),
+                created=event.get("created") or int(time.time()),
+                payload=payload,
+                status="pending",
+                attempts=0,
+                next_attempt_at=now,
+                received_at=now
+            ).on_conflict_do_nothing(index_elements=["id"])
+        )
+        await db.commit()
+        if result.rowcount:
+            self.received += 1
+            self.wake()
+            return True
+        self.duplicates += 1
+        return False
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @staticmethod
+    def claimable():
+        """Pending events with no earlier unfinished event for the same customer"""
+        earlier = aliased(StripeEvent)
+        return and_(
+            StripeEvent.status == "pending",
+            ~select(earlier.id).where(
+                earlier.customer_id == StripeEvent.customer_id,
+                earlier.status.in_(["pending", "processing"]),
+                tuple_(earlier.created, earlier.received_at, earlier.id)
+                < tuple_(StripeEvent.created, StripeEvent.received_at, StripeEvent.id)
+            ).exists()
+        )
+
+    async def claim(self, now: datetime, lease: datetime) -> list:
+        async with AsyncSessionLocal() as db:
+            # Events whose processor died mid-way become claimable again
+            await db.execute(
+                update(StripeEvent)
+                .where(StripeEvent.status == "processing", StripeEvent.locked_until < now)
+                .values(status="pending", locked_until=None)
+                .execution_options(synchronize_session=False)
+            )
+            result = await db.execute(
+                select(StripeEvent)
+                .where(self.claimable(), StripeEvent.next_attempt_at <= now)
+                .order_by(StripeEvent.created, StripeEvent.received_at, StripeEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            events = result.scalars().all()
+            claimed = []
+            for stripe_event in events:
+                stripe_event.status = "processing"
+                stripe_event.locked_until = lease
+                stripe_event.attempts = (stripe_event.attempts or 0) + 1
+                claimed.append({
+                    "id": stripe_event.id,
+                    "type": stripe_event.type,
+                    "payload": stripe_event.payload,
+                    "attempts": stripe_event.attempts,
+                    "received_at": stripe_event.received_at
+                })
+            await db.commit()
+            return claimed
+
+    async def process(self, claimed: dict, lease: datetime):
         try:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, os.getenv("STRIPE_WEBHOOK_SECRET")
+            async with AsyncSessionLocal() as db:
+                await apply_stripe_event(db, json.loads(claimed["payload"]))
+                # Only the lease holder may finish the event
+                result = await db.execute(
+                    update(StripeEvent)
+                    .where(
+                        StripeEvent.id == claimed["id"],
+                        StripeEvent.status == "processing",
+                        StripeEvent.locked_until == lease
+                    )
+                    .values(status="processed", processed_at=datetime.utcnow(), locked_until=None, last_error=None)
+                    .execution_options(synchronize_session=False)
+                )
+                if not result.rowcount:
+                    await db.rollback()
+                    self.lost_leases += 1
+                    print(f"⚠️ Stripe event {claimed['id']} lease lost, leaving it to its new owner")
+                    return
+                await db.commit()
+            self.processed += 1
+            self.latency.observe((datetime.utcnow() - claimed["received_at"]).total_seconds())
+        except Exception as e:
+            await self.record_failure(claimed, lease, e)
+
+    async def record_failure(self, claimed: dict, lease: datetime, error: Exception):
+        dead = claimed["attempts"] >= STRIPE_EVENT_MAX_ATTEMPTS
+        values = {"locked_until": None, "last_error": f"{type(error).__name__}: {error}"[:2000]}
+        if dead:
+            values["status"] = "dead"
+        else:
+            values["status"] = "pending"
+            values["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=stripe_event_backoff(claimed["attempts"]))
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(StripeEvent)
+                .where(StripeEvent.id == claimed["id"], StripeEvent.locked_until == lease)
+                .values(**values)
+                .execution_options(synchronize_session=False)
             )
-        except ValueError:
-            return JSONResponse(content={"error": "Invalid payload"}, status_code=400)
-        except stripe.error.SignatureVerificationError:
-            return JSONResponse(content={"error": "Invalid signature"}, status_code=400)
-        
-        # Handle subscription updated (when user cancels)
-        if event["type"] == "customer.subscription.updated":
-            subscription = event["data"]["object"]
-            customer_id = subscription["customer"]
-            cancel_at_period_end = subscription.get("cancel_at_period_end", False)
-            
-            user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
-            if user:
-                if cancel_at_period_end:
-                    # User canceled - mark as canceling
-                    if not user.cancel_at_period_end:
-                        print(f"🔔 User {user.id} canceled subscription")
-                        if user.plan and user.plan not in ["free", "canceling"]:
-                            user.original_plan = user.plan
-                        else:
-                            user.original_plan = None
-                        user.cancel_at_period_end = True
-                        
-                        # Store cancellation date
-                        period_end = subscription.get("current_period_end")
-                        if period_end:
-                            user.cancellation_date = datetime.fromtimestamp(period_end)
-                        
-                        db.commit()
+            await db.commit()
+        if dead:
+            self.dead += 1
+            print(f"⛔ Stripe event {claimed['id']} ({claimed['type']}) dead-lettered after "
+                  f"{claimed['attempts']} attempt(s): {error}")
+        else:
+            self.retried += 1
+            print(f"⚠️ Stripe event {claimed['id']} ({claimed['type']}) failed "
+                  f"(attempt {claimed['attempts']}), will retry: {error}")
+
+    async def process_batch(self) -> int:
+        now = datetime.utcnow()
+        lease = now + timedelta(seconds=STRIPE_EVENT_LEASE_SECONDS)
+        claimed = await self.claim(now, lease)
+        slots = asyncio.Semaphore(self.workers)
+
+        async def bounded(event):
+            async with slots:
+                await self.process(event, lease)
+
+        # At most one event per customer is claimed, so these can't race
+        await asyncio.gather(*(bounded(event) for event in claimed))
+        return len(claimed)
+
+    async def next_due_in(self) -> Optional[float]:
+        """Seconds until the next claimable event is due, or None"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(func.min(StripeEvent.next_attempt_at)).where(self.claimable()))
+            next_at = result.scalar()
+        if next_at is None:
+            return None
+        return max((next_at - datetime.utcnow()).total_seconds(), 0.0)
+
+    async def purge_processed(self):
+        cutoff = datetime.utcnow() - timedelta(days=STRIPE_EVENT_KEEP_DAYS)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(StripeEvent)
+                .where(StripeEvent.status == "processed", StripeEvent.received_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        if result.rowcount:
+            print(f"🧹 Purged {result.rowcount} processed Stripe events")
 
-                        try:
-                            plan_for_email = user.original_plan if user.original_plan else user.plan
-                            email_service.send_subscription_cancellation_email(
-                            user, 
-                            plan_for_email, 
-                            user.cancellation_date
-                        )
-                            print(f"✅ Cancellation email sent to {user.email}")
-                        except Exception as e:
-                            print(f"❌ Failed to send cancellation email: {str(e)}")
+    async def run(self):
+        while True:
+            try:
+                if time.monotonic() - self._last_purge > 3600:
+                    self._last_purge = time.monotonic()
+                    await self.purge_processed()
 
-                    else:
-                        # User reactivated - restore plan
-                        if user.plan == "canceling" and user.original_plan:
-                            print(f"🔄 User {user.id} reactivated subscription")
-                        user.plan = user.original_plan
-                        if user.original_plan:
-                            user.plan = user.original_plan
-                        user.cancel_at_period_end = False
-                        user.cancellation_date = None
-                        db.commit()
-        
-        # Handle subscription deleted/ended event
-        elif event["type"] == "customer.subscription.deleted":
-            subscription = event["data"]["object"]
-            customer_id = subscription["customer"]
-            
-            # Find user and downgrade to free
-            user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
-            if user:
-                print(f"🔽 Downgrading user {user.id} to free plan")
-                
-                user.plan = "free"
-                user.cancellation_date = None
-                user.cancel_at_period_end = False
+                self._wakeup.clear()
+                if await self.process_batch():
+                    # Finishing an event can unblock the same customer's next one
+                    continue
+                wait = STRIPE_EVENT_POLL_SECONDS
+                due_in = await self.next_due_in()
+                if due_in is not None:
+                    wait = min(wait, due_in)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(wait, 0.05))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Stripe event processor error: {e}")
+                await asyncio.sleep(STRIPE_EVENT_POLL_SECONDS)
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        # Events interrupted mid-way are reclaimed when their lease expires
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._wakeup = None
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dead": self.dead,
+            "lost_leases": self.lost_leases,
+            "receipt_to_processed": self.latency.snapshot()
+        }
+
+stripe_event_processor = StripeEventProcessor()
+
+@app.on_event("startup")
+async def start_stripe_event_processor():
+    stripe_event_processor.start()
+
+@app.on_event("shutdown")
+async def stop_stripe_event_processor():
+    await stripe_event_processor.stop()
+
+SUBSCRIPTION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL_SECONDS", 900))
+SUBSCRIPTION_SWEEP_BATCH_SIZE = int(os.getenv("SUBSCRIPTION_SWEEP_BATCH_SIZE", 100))
+
+class SubscriptionExpirySweeper:
+    """Ends cancelled subscriptions whose cancellation_date has passed.
+
+    Every SUBSCRIPTION_SWEEP_INTERVAL_SECONDS it walks the due users in
+    batches and reconciles each against the local subscription mirror:
+    - a live subscription that is no longer set to cancel means the user
+      resubscribed, so the cancellation is cleared;
+    - a live subscription still cancelling with a later period end moves
+      cancellation_date to it;
+    - anything else is downgraded to free, as the subscription.deleted
+      webhook does.
+    Customers the mirror doesn't know yet are looked up in Stripe before
+    any row is locked. Each user is then locked (FOR UPDATE SKIP LOCKED,
+    so several processes can run it) and reconciled in a short transaction
+    of its own. A user whose customer still has webhook events waiting in
+    stripe_events is deferred to the next sweep, since the mirror may be
+    about to change. Each outcome clears or moves cancellation_date, so a
+    user leaves the due set once handled and the sweeper and the webhook
+    never both downgrade the same user.
+    """
+
+    def __init__(self, batch_size: int = SUBSCRIPTION_SWEEP_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._task = None
+        self.downgraded = 0
+        self.reactivated = 0
+        self.extended = 0
+        self.deferred = 0
+        self.stripe_lookups = 0
+        self.last_run_at = None
+
+    async def fill_mirror(self, customer_ids: set) -> set:
+        """Copy subscriptions of customers missing from the mirror in from
+        Stripe; returns the customers that couldn't be looked up"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(StripeSubscription.customer_id)
+                .where(StripeSubscription.customer_id.in_(customer_ids))
+                .distinct()
+            )
+            missing = customer_ids - set(result.scalars().all())
+        failed = set()
+        for customer_id in sorted(missing):
+            # Customers from before the mirror existed
+            self.stripe_lookups += 1
+            try:
+                subscriptions = await asyncio.to_thread(
+                    stripe.Subscription.list, customer=customer_id, status="all", limit=10
+                )
+            except stripe.error.InvalidRequestError as e:
+                # The customer no longer exists, so neither does a subscription
+                print(f"⚠️ Stripe has no customer {customer_id}: {e}")
+                continue
+            except Exception as e:
+                # Left due; the next sweep tries again
+                print(f"❌ Failed to look up Stripe subscriptions for {customer_id}: {e}")
+                failed.add(customer_id)
+                continue
+            async with AsyncSessionLocal() as db:
+                dialect_name = db.get_bind().dialect.name
+                for stripe_subscription in subscriptions.data:
+                    await db.execute(stripe_subscription_upsert(dialect_name, stripe_subscription, int(time.time())))
+                await db.commit()
+        return failed
+
+    async def reconcile(self, db: AsyncSession, user: User, now: datetime):
+        subscription = None
+        if user.stripe_customer_id:
+            subscription = await get_current_subscription_async(db, user.stripe_customer_id)
+
+        if subscription is not None and subscription.status in STRIPE_LIVE_SUBSCRIPTION_STATUSES:
+            if not subscription.cancel_at_period_end:
+                print(f"🔄 User {user.id} resubscribed, clearing cancellation")
+                if user.plan == "canceling" and user.original_plan:
+                    user.plan = user.original_plan
                 user.original_plan = None
+                user.cancel_at_period_end = False
+                user.cancellation_date = None
+                self.reactivated += 1
+                return
+            if subscription.current_period_end and subscription.current_period_end > now:
+                user.cancellation_date = subscription.current_period_end
+                self.extended += 1
+                return
 
-                db.commit()
-                
-                # Send downgrade confirmation email
-                try:
-                    email_service.send_downgrade_confirmation_email(user)
-                except Exception as e:
-                    print(f"Failed to send downgrade email: {str(e)}")
-        
-        # Handle successful payment
-        elif event["type"] == "invoice.payment_succeeded":
-            invoice = event["data"]["object"]
-            customer_id = invoice.get("customer")
-            subscription_id = invoice.get("subscription")
-            
-            if not customer_id or not subscription_id:
-                print("⚠️ Missing customer_id or subscription_id in invoice")
-                return JSONResponse(content={"status": "success"}, status_code=200)
-            
+        old_plan = user.original_plan or user.plan
+        print(f"🔽 Subscription ended, downgrading user {user.id} to free plan")
+        user.plan = "free"
+        user.cancellation_date = None
+        user.cancel_at_period_end = False
+        user.original_plan = None
+        if old_plan and old_plan not in ["free", "canceling"]:
+            await queue_email(db, "subscription_downgrade", user, old_plan)
+        self.downgraded += 1
+
+    async def reconcile_user(self, user_id: int, now: datetime):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(User)
+                .where(User.id == user_id, User.cancellation_date.isnot(None), User.cancellation_date <= now)
+                .with_for_update(skip_locked=True)
+            )
+            user = result.scalar_one_or_none()
+            if user is None:
+                # Handled meanwhile, or locked by another sweeper or webhook
+                return
+            if user.stripe_customer_id:
+                result = await db.execute(
+                    select(StripeEvent.id)
+                    .where(
+                        StripeEvent.customer_id == user.stripe_customer_id,
+                        StripeEvent.status.in_(["pending", "processing"])
+                    )
+                    .limit(1)
+                )
+                if result.first() is not None:
+                    self.deferred += 1
+                    return
+            await self.reconcile(db, user, now)
+            await db.commit()
+
+    async def sweep_batch(self, after_id: int) -> Optional[int]:
+        """Handle one batch of due users with ids above after_id; returns the
+        last id handled, or None when there are no more"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(User.id, User.stripe_customer_id)
+                .where(User.cancellation_date.isnot(None), User.cancellation_date <= now, User.id > after_id)
+                .order_by(User.id)
+                .limit(self.batch_size)
+            )
+            due = result.all()
+        if not due:
+            return None
+
+        unavailable = await self.fill_mirror({customer_id for _, customer_id in due if customer_id})
+        for user_id, customer_id in due:
+            if customer_id in unavailable:
+                continue
             try:
-                # Get subscription details to determine plan
-                subscription = stripe.Subscription.retrieve(subscription_id)
-                
-                # Safely get price_id
-                if not subscription.get("items") or not subscription["items"].get("data"):
-                    print("⚠️ No items in subscription")
-                    return JSONResponse(content={"status": "success"}, status_code=200)
-                
-                price_id = subscription["items"]["data"][0]["price"]["id"]
-                
-                # Update user's plan based on price_id
-                user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
-                if user:
-                    # Map price_id to plan name
-                    creator_monthly = os.getenv("STRIPE_CREATOR_PRICE_MONTHLY")
-                    creator_yearly = os.getenv("STRIPE_CREATOR_PRICE_YEARLY")
-                    
-                    if price_id == creator_monthly:
-                        user.plan = "creator_monthly"
-                        print(f"✅ Updated user {user.id} to creator_monthly")
-                    elif price_id == creator_yearly:
-                        user.plan = "creator_yearly"
-                        print(f"✅ Updated user {user.id} to creator_yearly")
-                    else:
-                        print(f"⚠️ Unknown price_id: {price_id}")
-                    
-                    # Clear cancellation status if they were canceling
-                    if user.original_plan and user.plan != "canceling":
-                        user.original_plan = None
-                        user.cancellation_date = None
-                    
-                    db.commit()
-                else:
-                    print(f"⚠️ User not found for customer_id: {customer_id}")
-                    
-            except stripe.error.StripeError as e:
-                print(f"⚠️ Stripe error retrieving subscription: {str(e)}")
+                await self.reconcile_user(user_id, now)
             except Exception as e:
-                print(f"⚠️ Error processing payment: {str(e)}")
-                import traceback
-                traceback.print_exc()
-        
-        # Handle failed payment
-        elif event["type"] == "invoice.payment_failed":
-            invoice = event["data"]["object"]
-            customer_id = invoice.get("customer")
-            
-            if not customer_id:
-                print("⚠️ Missing customer_id in failed invoice")
-                return JSONResponse(content={"status": "success"}, status_code=200)
-            
-            user = db.query(User).filter(User.stripe_customer_id == customer_id).first()
-            if user:
-                print(f"⚠️ Payment failed for user {user.id}")
-                
-                # Send payment failed email
-                try:
-                    email_service.send_payment_failed_email(user)
-                except Exception as e:
-                    print(f"Failed to send payment failed email: {str(e)}")
-            else:
-                print(f"⚠️ User not found for customer_id: {customer_id}")
-        
-        return JSONResponse(content={"status": "success"}, status_code=200)
-        
+                # Left due; the next sweep tries again
+                print(f"❌ Failed to reconcile subscription for user {user_id}: {e}")
+        return due[-1][0]
+
+    async def sweep(self):
+        # Keyset over user id, so a user that couldn't be reconciled is
+        # skipped rather than refetched forever within one sweep
+        last_id = 0
+        while last_id is not None:
+            last_id = await self.sweep_batch(last_id)
+        self.last_run_at = datetime.utcnow()
+
+    async def run(self):
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Subscription expiry sweep error: {e}")
+            await asyncio.sleep(SUBSCRIPTION_SWEEP_INTERVAL_SECONDS)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "downgraded": self.downgraded,
+            "reactivated": self.reactivated,
+            "extended": self.extended,
+            "deferred": self.deferred,
+            "stripe_lookups": self.stripe_lookups,
+            "last_run_at": self.last_run_at
+        }
+
+subscription_expiry_sweeper = SubscriptionExpirySweeper()
+
+@app.on_event("startup")
+async def start_subscription_expiry_sweeper():
+    subscription_expiry_sweeper.start()
+
+@app.on_event("shutdown")
+async def stop_subscription_expiry_sweeper():
+    await subscription_expiry_sweeper.stop()
+
+@app.api_route("/stripe-webhook", methods=["POST"])
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Verify, store and acknowledge. The event is applied by
+    stripe_event_processor, so Stripe gets its 2xx without waiting on our
+    database work, Stripe API calls or email, and a redelivery is a no-op."""
+    payload = await request.body()
+    sig_header = request.headers.get("stripe-signature")
+
+    try:
+        event = stripe.Webhook.construct_event(
+            payload, sig_header, os.getenv("STRIPE_WEBHOOK_SECRET")
+        )
+    except ValueError:
+        return JSONResponse(content={"error": "Invalid payload"}, status_code=400)
+    except stripe.error.SignatureVerificationError:
+        return JSONResponse(content={"error": "Invalid signature"}, status_code=400)
+
+    try:
+        stored = await stripe_event_processor.store(db, payload.decode("utf-8"), json.loads(payload))
     except Exception as e:
-        print(f"Webhook error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return JSONResponse(content={"status": "received"}, status_code=200)  # ✅ Changed to 200
-    finally:
-        db.close()
-        
+        # Nothing was recorded, so let Stripe deliver it again
+        print(f"❌ Failed to store Stripe event {event['id']}: {e}")
+        return JSONResponse(content={"error": "Could not record event"}, status_code=500)
+
+    return JSONResponse(content={"status": "received" if stored else "duplicate"}, status_code=200)
+
 def create_blog_post(db: Session, title: str, content: str, excerpt: str, 
                      meta_description: str, meta_keywords: str, read_time: int = 5):
     """Helper function to create blog posts"""
@@ -8372,25 +11208,6 @@ def get_plan_from_price_id(price_id):
     }
     return price_to_plan.get(price_id, "creator")
     
-def get_next_billing_date(stripe_customer_id):
-    """Get the next billing date for a customer's active subscription"""
-    try:
-        subscriptions = stripe.Subscription.list(
-            customer=stripe_customer_id,
-            status="active",
-            limit=1
-        )
-        
-        if subscriptions.data:
-            subscription = subscriptions.data[0]
-            next_billing_timestamp = subscription.current_period_end
-            return datetime.fromtimestamp(next_billing_timestamp)
-        
-        return None
-    except Exception as e:
-        print(f"Error getting billing date: {str(e)}")
-        return None
-
 # Background task functions
 async def handle_subscription_created(subscription):
     """Handle new subscription creation"""
@@ -8496,7 +11313,7 @@ async def handle_subscription_updated(subscription):
                 cancellation_date = None
             
             try:
-                email_service.send_subscription_cancellation_email(
+                await asyncio.to_thread(email_service.send_subscription_cancellation_email,
                     user, original_plan, cancellation_date
                 )
                 print(f"✅ Cancellation email sent to {user.email} for {original_plan} plan")
@@ -8634,7 +11451,7 @@ async def handle_subscription_deleted(subscription):
             
             # Send downgrade notification
             try:
-                email_service.send_subscription_downgrade_email(user, old_plan)
+                await asyncio.to_thread(email_service.send_subscription_downgrade_email, user, old_plan)
                 print(f"✅ Downgrade email sent to {user.email}")
             except Exception as e:
                 print(f"❌ Failed to send downgrade email: {str(e)}")
@@ -8696,6 +11513,14 @@ async def downgrade_user_plan(stripe_customer_id: str):
     finally:
         db.close()
 
+@app.on_event("shutdown")
+async def dispose_async_engines():
+    # Registered last so the workers' final flushes have finished. Pooled
+    # aiosqlite connections otherwise keep the interpreter from exiting.
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# sync_stripe_subscriptions.py
+# Copies every Stripe subscription into the stripe_subscriptions mirror.
+# Webhooks keep the mirror current; run this once after the migration, or
+# again if webhooks were down for longer than Stripe retries them.
+#
+#   python sync_stripe_subscriptions.py
+
+import time
+
+from main import SessionLocal, stripe, stripe_subscription_upsert
+
+
+def main():
+    db = SessionLocal()
+    dialect_name = db.get_bind().dialect.name
+    synced = 0
+    try:
+        # Stamped before listing, so an event that lands meanwhile still wins
+        started = int(time.time())
+        for subscription in stripe.Subscription.list(status="all", limit=100).auto_paging_iter():
+            db.execute(stripe_subscription_upsert(dialect_name, subscription, started))
+            synced += 1
+            if synced % 500 == 0:
+                db.commit()
+                print(f"Synced {synced} subscriptions...")
+        db.commit()
+        print(f"✅ Synced {synced} subscriptions")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()